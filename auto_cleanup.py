@@ -3,19 +3,20 @@
 Автоматический скрипт очистки для cron.
 Удаляет только файлы, помеченные как удаленные (без физической проверки диска).
 Безопасен для автоматического запуска.
+
+Работу выполняет движок очистки (политика purge, files/retention.py):
+пачками, с бюджетом ввода-вывода RETENTION_MAX_OPS_PER_SECOND / RETENTION_MAX_MB_PER_SECOND.
 """
 
 import os
 import sys
 import django
-from django.conf import settings
-from django.db import transaction
 
 # Настройка Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings')
 django.setup()
 
-from files.models import File
+from files.retention import run_retention
 import logging
 
 # Настройка логирования
@@ -35,42 +36,20 @@ def auto_cleanup():
     logger.info("🤖 Запуск автоматической очистки...")
     
     try:
-        # Находим только файлы, помеченные как удаленные
-        # Исключаем постоянные файлы для безопасности
-        files_to_delete = File.objects.filter(
-            is_deleted=True,
-            is_permanent=False
-        )
+        # Постоянные файлы политика purge не удаляет
+        metrics = run_retention(['purge'])['purge']
         
-        count = files_to_delete.count()
-        
-        if count == 0:
+        if metrics['rows'] == 0:
             logger.info("✅ Нет файлов для автоматической очистки")
             return True
         
-        logger.info(f"📋 Найдено {count} файлов для удаления")
-        
-        deleted_count = 0
-        errors = []
-        
-        with transaction.atomic():
-            for file_obj in files_to_delete:
-                try:
-                    logger.info(f"🗑️  Удаляем: {file_obj.code} - {file_obj.filename}")
-                    file_obj.delete()
-                    deleted_count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Ошибка при удалении {file_obj.code}: {str(e)}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-        
-        logger.info(f"📈 Результат: удалено {deleted_count} из {count} файлов")
+        logger.info(
+            f"📈 Результат: удалено {metrics['purged']} из {metrics['rows']} записей, "
+            f"файлов с диска {metrics['unlinked']} за {metrics['elapsed']} с"
+        )
         
-        if errors:
-            logger.warning(f"⚠️  Ошибок: {len(errors)}")
-            for error in errors:
-                logger.error(f"   • {error}")
+        if metrics['errors']:
+            logger.warning(f"⚠️  Ошибок: {metrics['errors']} (подробности выше)")
         
         return True
         
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации кешируемых списков файлов.
+
+Сравнивает хранение списка недавних файлов в кеше:
+- pickle списка моделей File (как было раньше);
+- компактные строки FileCard через orjson/json (files/cards.py).
+
+Запуск: python cache_benchmark.py [--files 3] [--rounds 20000]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings')
+
+import django
+
+django.setup()
+
+from django.utils import timezone
+
+from files.cards import orjson, pack_cards, unpack_cards
+from files.models import File
+
+
+def make_files(count):
+    """Создает несохраненные модели, похожие на реальные записи"""
+    now = timezone.now()
+    return [
+        File(
+            pk=index + 1,
+            file=f'uploads/report_{index}.pdf',
+            filename=f'Квартальный отчет {index}.pdf',
+            file_size=1_234_567 + index,
+            code=f'AB{index:04d}',
+            session_id='f' * 64,
+            created_at=now - timedelta(minutes=index),
+            expires_at=now + timedelta(hours=24),
+            qr_code=f'qr_codes/qr_AB{index:04d}.png',
+            download_count=index * 3,
+        )
+        for index in range(count)
+    ]
+
+
+def measure(label, dump, load, value, rounds):
+    """Размер и время чтения (load) одного значения"""
+    payload = dump(value)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        load(payload)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {len(payload):>8} байт {elapsed / rounds * 1e6:>10.2f} мкс/чтение")
+    return len(payload), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сериализации списков файлов')
+    parser.add_argument('--files', type=int, default=3, help='Файлов в списке')
+    parser.add_argument('--rounds', type=int, default=20000, help='Количество чтений')
+    args = parser.parse_args()
+
+    files = make_files(args.files)
+    print(f"🚀 Список из {args.files} файлов, {args.rounds} чтений, orjson: {'да' if orjson else 'нет'}")
+
+    pickled_size, pickled_time = measure(
+        'pickle(модели File)',
+        lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+        pickle.loads,
+        files,
+        args.rounds,
+    )
+    compact_size, compact_time = measure(
+        'FileCard (компактные строки)',
+        lambda value: pickle.dumps(pack_cards(value), pickle.HIGHEST_PROTOCOL),
+        lambda payload: unpack_cards(pickle.loads(payload)),
+        files,
+        args.rounds,
+    )
+
+    print(f"📊 Размер: в {pickled_size / compact_size:.1f} раза меньше, "
+          f"чтение: в {pickled_time / compact_time:.1f} раза быстрее")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,9 @@ from django.conf import settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings')
 django.setup()
 
+from django.db.models import Q
 from files.models import File
-from files.pdf_utils import compress_pdf, should_compress_pdf
-from django.core.files.base import ContentFile
+from files.pdf_utils import compress_file_pdf, should_compress_pdf
 
 def compress_existing_pdfs():
     """Сжимает существующие PDF файлы"""
@@ -22,9 +22,9 @@ def compress_existing_pdfs():
     
     # Находим PDF файлы без сжатых версий
     pdf_files = File.objects.filter(
+        Q(compressed_pdf__isnull=True) | Q(compressed_pdf=''),
         filename__iendswith='.pdf',
         is_deleted=False,
-        compressed_pdf__isnull=True
     )
     
     print(f"📋 Найдено PDF файлов: {pdf_files.count()}")
@@ -39,34 +39,16 @@ def compress_existing_pdfs():
                 
                 # Проверяем, нужно ли сжимать
                 if should_compress_pdf(file_obj.file.path, max_size_mb=10):
-                    success, compressed_path, compressed_size = compress_pdf(
-                        file_obj.file.path,
-                        quality=75,
-                        max_size_mb=10
-                    )
+                    # Сжатый PDF пишется прямо в хранилище (атомарный rename)
+                    compressed_size = compress_file_pdf(file_obj, quality=75, max_size_mb=10)
                     
-                    if success and compressed_path and compressed_size:
-                        # Сохраняем сжатую версию
-                        with open(compressed_path, 'rb') as f:
-                            file_obj.compressed_pdf.save(
-                                f"compressed_{file_obj.filename}",
-                                ContentFile(f.read()),
-                                save=True
-                            )
-                        
-                        file_obj.compressed_pdf_size = compressed_size
-                        file_obj.save(update_fields=['compressed_pdf', 'compressed_pdf_size'])
-                        
+                    if compressed_size:
                         original_mb = file_obj.file_size / (1024 * 1024)
                         compressed_mb = compressed_size / (1024 * 1024)
                         ratio = (1 - compressed_size / file_obj.file_size) * 100
                         
                         print(f"   ✅ {original_mb:.1f}MB → {compressed_mb:.1f}MB ({ratio:.1f}%)")
                         compressed_count += 1
-                        
-                        # Удаляем временный файл
-                        if compressed_path != file_obj.file.path:
-                            os.remove(compressed_path)
                     else:
                         print(f"   ❌ Не удалось сжать")
                         errors.append(f"Не удалось сжать {file_obj.code}")
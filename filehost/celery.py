@@ -38,6 +38,9 @@ app.conf.update(
     task_routes={
         'files.tasks.*': {'queue': 'files'},
         'files.tasks.cleanup_expired_files': {'queue': 'maintenance'},
+        'files.tasks.expire_due_files': {'queue': 'maintenance'},
+        'files.tasks.evict_preview_cache': {'queue': 'maintenance'},
+        'files.tasks.purge_deleted_files': {'queue': 'maintenance'},
     },
     
     # Queue configuration
@@ -59,13 +62,33 @@ app.conf.update(
     
     # Beat schedule (replaces cron)
     beat_schedule={
+        'expire-due-files': {
+            'task': 'files.tasks.expire_due_files',
+            'schedule': 5.0,  # Каждые 5 секунд (расписание истечения в Redis)
+        },
         'cleanup-expired-files': {
             'task': 'files.tasks.cleanup_expired_files',
+            'schedule': 3600.0,  # Каждый час — страховка для файлов вне расписания
+        },
+        'purge-deleted-files': {
+            'task': 'files.tasks.purge_deleted_files',
+            'schedule': 3600.0,  # Каждый час — записи удаленных файлов не копятся в таблице
+        },
+        'rebuild-code-index': {
+            'task': 'files.tasks.rebuild_code_index',
+            'schedule': 3600.0,  # Каждый час
+        },
+        'reconcile-stats': {
+            'task': 'files.tasks.reconcile_stats',
             'schedule': 3600.0,  # Каждый час
         },
         'generate-sitemap': {
             'task': 'files.tasks.generate_sitemap',
-            'schedule': 86400.0,  # Каждый день
+            'schedule': 900.0,  # Каждые 15 минут (пересобираются только измененные части)
+        },
+        'evict-preview-cache': {
+            'task': 'files.tasks.evict_preview_cache',
+            'schedule': 3600.0,  # Каждый час — пересчет объема кеша превью
         },
         'cleanup-old-logs': {
             'task': 'files.tasks.cleanup_old_logs',
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'files.middleware.SessionlessPathMiddleware',  # Легкие API в обход сессий (SESSIONLESS_PATHS)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -175,6 +176,61 @@ RATE_LIMIT_UPLOAD = int(os.getenv('RATE_LIMIT_UPLOAD', 5))  # Максимум 5
 RATE_LIMIT_API = int(os.getenv('RATE_LIMIT_API', 10))    # Максимум 10 API запросов в минуту
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60)) # Окно времени в секундах
 
+# Индекс кодов для маршрута <str:code>/ (отсечение сканеров и случайных кодов)
+CODE_INDEX_REBUILD_SECONDS = int(os.getenv('CODE_INDEX_REBUILD_SECONDS', 600))  # Перестройка фильтра Блума
+CODE_MISS_CACHE_SECONDS = int(os.getenv('CODE_MISS_CACHE_SECONDS', 300))  # Негативный кеш промахов
+CODE_MISS_RATE_LIMIT = os.getenv('CODE_MISS_RATE_LIMIT', '30/m')  # Промахов по коду с одного IP
+
+# Кеш метаданных файлов и пакетный API статуса
+FILE_METADATA_CACHE_SECONDS = int(os.getenv('FILE_METADATA_CACHE_SECONDS', 60))
+FILE_STATUS_MAX_CODES = int(os.getenv('FILE_STATUS_MAX_CODES', 100))  # Максимум кодов в одном запросе
+
+# Кеширование дорогих значений (files/caching.py)
+HOME_STATS_CACHE_SECONDS = int(os.getenv('HOME_STATS_CACHE_SECONDS', 30))  # Статистика главной страницы
+SITEMAP_CACHE_SECONDS = int(os.getenv('SITEMAP_CACHE_SECONDS', 900))  # Индекс sitemap.xml
+SITEMAP_SHARD_SIZE = int(os.getenv('SITEMAP_SHARD_SIZE', 50000))  # Диапазон id в одной части карты сайта (files/sitemaps.py)
+SITEMAP_ROOT = os.getenv('SITEMAP_ROOT', BASE_DIR / 'sitemaps')  # Готовые файлы карты сайта (отдает nginx)
+SITEMAP_FULL_REBUILD_SECONDS = int(os.getenv('SITEMAP_FULL_REBUILD_SECONDS', 86400))  # Полная пересборка раз в сутки
+
+# Движок очистки файлов (files/retention.py)
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 500))  # Записей в одном UPDATE
+RETENTION_UNLINK_WORKERS = int(os.getenv('RETENTION_UNLINK_WORKERS', 8))  # Потоков для удаления файлов с диска
+# Бюджет ввода-вывода очистки, чтобы она не мешала скачиваниям (0 — без ограничения)
+RETENTION_MAX_OPS_PER_SECOND = int(os.getenv('RETENTION_MAX_OPS_PER_SECOND', 1000))  # Удалений файлов и запросов пачек в секунду
+RETENTION_MAX_MB_PER_SECOND = float(os.getenv('RETENTION_MAX_MB_PER_SECOND', 100))  # Мегабайт удаленных файлов в секунду
+EXPIRY_SCHEDULER_BATCH_SIZE = int(os.getenv('EXPIRY_SCHEDULER_BATCH_SIZE', 100))  # Файлов в пачке удаления по расписанию (files/expiry_scheduler.py)
+RETENTION_PURGE_AFTER_HOURS = int(os.getenv('RETENTION_PURGE_AFTER_HOURS', 24))  # Записи удаленных файлов хранятся столько часов после истечения
+RECONCILE_GRACE_SECONDS = int(os.getenv('RECONCILE_GRACE_SECONDS', 3600))  # Файлы на диске моложе этого не считаются сиротами (files/reconcile.py)
+
+# Кеш PDF-превью офисных документов (files/preview_cache.py)
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv('PREVIEW_CACHE_MAX_BYTES', 2 * 1024 ** 3))  # Бюджет каталога media/previews
+PREVIEW_CACHE_LOW_WATERMARK = float(os.getenv('PREVIEW_CACHE_LOW_WATERMARK', 0.9))  # Вытеснять до этой доли бюджета
+
+# Сжатие больших PDF (files/pdf_utils.py)
+PDF_COMPRESS_WORKERS = int(os.getenv('PDF_COMPRESS_WORKERS', 0))  # Процессов растеризации страниц (0 — по числу ядер)
+PDF_COMPRESS_TIME_BUDGET = float(os.getenv('PDF_COMPRESS_TIME_BUDGET', 300))  # Секунд на документ (0 — без ограничения)
+PDF_COMPRESS_REQUEST_TIME_BUDGET = float(os.getenv('PDF_COMPRESS_REQUEST_TIME_BUDGET', 20))  # Бюджет сжатия при загрузке (меньше timeout gunicorn)
+PDF_MIN_PREDICTED_SAVING = float(os.getenv('PDF_MIN_PREDICTED_SAVING', 0.1))  # Не сжимать, если анализатор обещает меньше
+PDF_IMAGE_SHARE_THRESHOLD = float(os.getenv('PDF_IMAGE_SHARE_THRESHOLD', 0.3))  # С какой доли изображений пробовать их перекодирование
+
+# Постраничный предпросмотр PDF (/<код>/page/<n>.webp)
+PDF_PAGE_WIDTHS = (480, 800, 1200, 1600)  # Допустимые ширины; запрошенная округляется вверх до ближайшей
+PDF_PAGE_DEFAULT_WIDTH = 800
+PDF_PAGE_QUALITY = int(os.getenv('PDF_PAGE_QUALITY', 80))  # Качество WebP
+PDF_PAGE_MAX_PIXELS = int(os.getenv('PDF_PAGE_MAX_PIXELS', 8 * 1000 * 1000))  # Предел площади изображения страницы
+PDF_PAGE_EAGER = 2  # Сколько первых страниц грузить сразу, остальные — лениво
+PDF_PAGE_PREVIEW_LIMIT = int(os.getenv('PDF_PAGE_PREVIEW_LIMIT', 50))  # Сколько страниц показывать на странице файла
+PDF_PAGE_CACHE_SECONDS = int(os.getenv('PDF_PAGE_CACHE_SECONDS', 30 * 24 * 3600))  # max-age ответа
+
+# Индекс файлов сессии в Redis (files/session_index.py)
+SESSION_INDEX_TTL = int(os.getenv('SESSION_INDEX_TTL', 7 * 24 * 3600))  # Время жизни индекса неактивной сессии
+
+# Пути, которые обслуживаются без сессионных middleware
+SESSIONLESS_PATHS = [
+    '/api/check-code/',
+    '/sitemap.xml',
+]
+
 # Настройки логирования безопасности
 LOGGING = {
     'version': 1,
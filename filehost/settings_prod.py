@@ -72,6 +72,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Готовые файлы карты сайта (nginx: location ~ ^/sitemap)
+SITEMAP_ROOT = os.environ.get('SITEMAP_ROOT', os.path.join(BASE_DIR, 'sitemaps'))
+
 # Security settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -98,12 +101,17 @@ RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 
 # Cache configuration
+# Двухуровневый кеш: горячие ключи дополнительно держатся в памяти процесса
+# (files/cache_backends.py), сессии и счетчики ratelimit — только в Redis
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'files.cache_backends.TwoTierRedisCache',
         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'L1_KEY_PREFIXES': ['nsv_', 'home_stats', 'file_meta_', 'sitemap_xml_'],
+            'L1_MAX_ENTRIES': int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1000)),
+            'L1_TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', 5)),
         }
     }
 }
@@ -204,6 +212,9 @@ CELERY_WORKER_MAX_MEMORY_PER_CHILD = 200000  # 200MB
 CELERY_TASK_ROUTES = {
     'files.tasks.*': {'queue': 'files'},
     'files.tasks.cleanup_expired_files': {'queue': 'maintenance'},
+    'files.tasks.expire_due_files': {'queue': 'maintenance'},
+    'files.tasks.evict_preview_cache': {'queue': 'maintenance'},
+    'files.tasks.purge_deleted_files': {'queue': 'maintenance'},
 }
 
 # Celery Queues
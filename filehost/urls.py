@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from files.views import robots_txt, sitemap_xml, error_400, error_403, error_404, error_500
+from files.views import robots_txt, sitemap_xml, sitemap_section, error_400, error_403, error_404, error_500
 from django.views.i18n import JavaScriptCatalog
 
 urlpatterns = [
@@ -28,6 +28,7 @@ urlpatterns = [
     path('i18n/', include('django.conf.urls.i18n')),
     path('', include('files.urls')),
     path('sitemap.xml', sitemap_xml, name='sitemap'),
+    path('sitemap-<str:section>.xml', sitemap_section, name='sitemap_section'),
     path('robots.txt', robots_txt, name='robots_txt'),
 ]
 
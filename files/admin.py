@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import File
+from .models import CompressionRecord, File
 
 
 @admin.register(File)
@@ -155,6 +155,28 @@ class FileAdmin(admin.ModelAdmin):
         }
 
 
+@admin.register(CompressionRecord)
+class CompressionRecordAdmin(admin.ModelAdmin):
+    """
+    Прогнозы анализатора PDF и фактические результаты сжатия.
+    """
+    
+    list_display = [
+        'code', 'created_at', 'original_size', 'page_count', 'image_share',
+        'has_text', 'predicted_ratio', 'actual_ratio', 'strategy', 'skipped', 'duration'
+    ]
+    
+    list_filter = ['strategy', 'skipped', 'has_text', 'created_at']
+    
+    search_fields = ['code']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Настройки админки
 admin.site.site_header = '0123.ru - Администрирование'
 admin.site.site_title = '0123.ru'
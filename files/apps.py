@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FilesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "files"
+
+    def ready(self):
+        from .search import ensure_search_triggers
+
+        # SQLite теряет триггеры FTS при пересоздании таблицы в миграциях
+        post_migrate.connect(ensure_search_triggers, sender=self)
@@ -0,0 +1,375 @@
+"""
+Двухуровневый кеш: L1 в памяти процесса перед Redis (django_redis).
+
+Значения, которые один воркер gunicorn читает сотни раз в секунду
+(статистика главной, метаданные файлов, sitemap), не должны каждый раз
+ходить в Redis по сети. Бэкенд держит небольшой ограниченный LRU-кеш с
+коротким TTL в памяти процесса для ключей с префиксами из L1_KEY_PREFIXES;
+остальные ключи (сессии, счетчики ratelimit, блокировки) работают только
+через Redis.
+
+Запись и удаление L1-ключей публикуются в канал Redis pub/sub, и остальные
+процессы выбрасывают устаревшие копии за миллисекунды. Пока подписка на
+канал не установлена, L1 не используется.
+
+Настройки (CACHES[...]['OPTIONS']):
+
+* L1_KEY_PREFIXES — префиксы ключей, которые можно держать в L1;
+* L1_MAX_ENTRIES — максимальное число записей L1 (по умолчанию 1000);
+* L1_TIMEOUT — максимальное время жизни записи L1 в секундах (по умолчанию 5);
+* L1_CHANNEL — канал pub/sub для инвалидации.
+
+Каждый процесс раз в STATS_REPORT_SECONDS публикует свои счетчики попаданий
+по уровням в Redis; сводку выводит команда ./manage.py cache_stats.
+"""
+
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+STATS_KEY = 'filehost:cache:stats:{}'
+STATS_REPORT_SECONDS = 60
+
+# Общие для всех потоков процесса уровни L1 (Django создает экземпляр кеша на поток)
+_shared_tiers = {}
+_shared_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """
+    Ограниченный LRU-кеш с TTL в памяти процесса.
+    Значения хранятся сериализованными, как в LocMemCache: вызывающий код
+    получает копию и не может испортить закешированный объект.
+    """
+
+    def __init__(self, max_entries=1000, timeout=5):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает (найдено, значение)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires, payload = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+        return True, pickle.loads(payload)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0:
+            self.discard(key)
+            return
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedTier:
+    """
+    L1 процесса вместе с подпиской на инвалидации и счетчиками попаданий.
+    После fork (gunicorn --preload) все состояние сбрасывается и подписка
+    поднимается заново в дочернем процессе.
+    """
+
+    def __init__(self, max_entries, timeout, channel):
+        self.local = LocalTier(max_entries, timeout)
+        self.channel = channel
+        self.pid = None
+        self.sender = None
+        self.connected = False
+        # Номер поколения растет при каждой инвалидации: значение, прочитанное
+        # из Redis до инвалидации, не должно попасть в L1 после нее
+        self.generation = 0
+        self.stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def ensure_listener(self, cache):
+        """Запускает подписку в текущем процессе; возвращает True, если L1 можно использовать"""
+        pid = os.getpid()
+        if self.pid == pid:
+            return self.connected
+        with self._lock:
+            if self.pid != pid:
+                self.pid = pid
+                self.sender = uuid.uuid4().hex
+                self.connected = False
+                self.local.clear()
+                for name in self.stats:
+                    self.stats[name] = 0
+                threading.Thread(target=self._listen, args=(cache, pid), daemon=True).start()
+        return self.connected
+
+    def _listen(self, cache, pid):
+        backoff = 1
+        while self.pid == pid:
+            pubsub = None
+            try:
+                pubsub = cache.client.get_client(write=True).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Пока подписки не было, чужие записи могли пройти мимо — начинаем с пустого L1
+                self.invalidate_all()
+                self.connected = True
+                backoff = 1
+                reported = 0.0
+                while self.pid == pid:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self.handle_message(message['data'])
+                    if time.monotonic() - reported > STATS_REPORT_SECONDS:
+                        self.report(cache)
+                        reported = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Подписка на инвалидации L1 прервана: {e}")
+            finally:
+                self.connected = False
+                self.invalidate_all()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def handle_message(self, data):
+        try:
+            sender, keys = json.loads(data)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Некорректное сообщение инвалидации L1: {e}")
+            return
+        if sender == self.sender:
+            return
+        self.stats['invalidations'] += 1
+        if keys == '*':
+            self.invalidate_all()
+        else:
+            self.invalidate(*keys)
+
+    def invalidate(self, *keys):
+        self.generation += 1
+        self.local.discard(*keys)
+
+    def invalidate_all(self):
+        self.generation += 1
+        self.local.clear()
+
+    def report(self, cache):
+        """Публикует счетчики процесса в Redis (для ./manage.py cache_stats)"""
+        try:
+            key = STATS_KEY.format(f'{socket.gethostname()}:{self.pid}')
+            redis = cache.client.get_client(write=True)
+            redis.set(key, json.dumps(self.hit_ratios()), ex=STATS_REPORT_SECONDS * 3)
+        except Exception as e:
+            logger.warning(f"Не удалось опубликовать статистику L1: {e}")
+
+    def hit_ratios(self):
+        stats = dict(self.stats)
+        reads = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['l1_entries'] = len(self.local)
+        stats['l1_hit_ratio'] = round(stats['l1_hits'] / reads, 4) if reads else 0.0
+        stats['l2_hit_ratio'] = round(stats['l2_hits'] / reads, 4) if reads else 0.0
+        stats['listener'] = self.connected
+        return stats
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    Кеш django_redis с уровнем L1 в памяти процесса.
+    Поддерживает тот же интерфейс, что и RedisCache; L1 используется только
+    для ключей с префиксами из L1_KEY_PREFIXES.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        self._l1_prefixes = tuple(options.get('L1_KEY_PREFIXES', ()))
+        channel = options.get('L1_CHANNEL', 'filehost:cache:invalidate')
+
+        # Все экземпляры с одинаковыми параметрами делят один L1
+        tier_key = (server, channel, self.key_prefix, self.version)
+        with _shared_tiers_lock:
+            self._tier = _shared_tiers.get(tier_key)
+            if self._tier is None:
+                self._tier = SharedTier(
+                    options.get('L1_MAX_ENTRIES', 1000),
+                    options.get('L1_TIMEOUT', 5),
+                    channel,
+                )
+                _shared_tiers[tier_key] = self._tier
+
+    # --- служебное ---
+
+    def _l1_enabled(self, key):
+        if not self._l1_prefixes or not str(key).startswith(self._l1_prefixes):
+            return False
+        return self._tier.ensure_listener(self)
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(timeout, 0)
+
+    def _publish(self, keys):
+        """Сообщает остальным процессам об изменении ключей (или '*' — обо всех)"""
+        try:
+            payload = json.dumps([self._tier.sender, keys])
+            self.client.get_client(write=True).publish(self._tier.channel, payload)
+        except Exception as e:
+            # Без рассылки чужие L1 могут отставать — сбрасываем уровень целиком
+            logger.warning(f"Не удалось разослать инвалидацию L1: {e}")
+            self._tier.invalidate_all()
+
+    def _changed(self, keys, version=None):
+        full_keys = [self.make_key(key, version=version) for key in keys if self._is_l1_key(key)]
+        if full_keys:
+            self._tier.invalidate(*full_keys)
+            self._publish(full_keys)
+
+    def _is_l1_key(self, key):
+        return bool(self._l1_prefixes) and str(key).startswith(self._l1_prefixes)
+
+    def tier_stats(self):
+        """Счетчики попаданий по уровням для текущего процесса"""
+        return self._tier.hit_ratios()
+
+    # --- чтение ---
+
+    def get(self, key, default=None, version=None, client=None):
+        if not self._l1_enabled(key):
+            return super().get(key, default, version, client)
+
+        full_key = self.make_key(key, version=version)
+        found, value = self._tier.local.get(full_key)
+        if found:
+            self._tier.stats['l1_hits'] += 1
+            return value
+
+        generation = self._tier.generation
+        value = super().get(key, _MISSING, version, client)
+        if value is _MISSING:
+            self._tier.stats['misses'] += 1
+            return default
+
+        self._tier.stats['l2_hits'] += 1
+        if generation == self._tier.generation:
+            self._tier.local.set(full_key, value)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = {}
+        remote = []
+        for key in keys:
+            if self._l1_enabled(key):
+                found, value = self._tier.local.get(self.make_key(key, version=version))
+                if found:
+                    self._tier.stats['l1_hits'] += 1
+                    result[key] = value
+                    continue
+            remote.append(key)
+
+        if remote:
+            generation = self._tier.generation
+            fetched = super().get_many(remote, version=version, client=client)
+            for key in remote:
+                if not self._is_l1_key(key):
+                    continue
+                if key in fetched:
+                    self._tier.stats['l2_hits'] += 1
+                    if generation == self._tier.generation:
+                        self._tier.local.set(self.make_key(key, version=version), fetched[key])
+                else:
+                    self._tier.stats['misses'] += 1
+            result.update(fetched)
+        return result
+
+    # --- запись ---
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, **kwargs):
+        result = super().set(key, value, timeout=timeout, version=version, client=client, **kwargs)
+        if self._is_l1_key(key):
+            self._changed([key], version)
+            if result and not kwargs and self._l1_enabled(key):
+                self._tier.local.set(self.make_key(key, version=version), value, self._l1_timeout(timeout))
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout=timeout, version=version, client=client)
+        if result:
+            self._changed([key], version)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout=timeout, version=version, client=client)
+        self._changed(list(data), version)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        self._changed([key], version)
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version=version, client=client)
+        self._changed(keys, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None, **kwargs):
+        result = super().incr(key, delta=delta, version=version, client=client, **kwargs)
+        self._changed([key], version)
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None, **kwargs):
+        result = super().decr(key, delta=delta, version=version, client=client, **kwargs)
+        self._changed([key], version)
+        return result
+
+    def delete_pattern(self, *args, **kwargs):
+        result = super().delete_pattern(*args, **kwargs)
+        if self._l1_prefixes:
+            self._tier.invalidate_all()
+            self._publish('*')
+        return result
+
+    def clear(self):
+        result = super().clear()
+        if self._l1_prefixes:
+            self._tier.invalidate_all()
+            self._publish('*')
+        return result
@@ -0,0 +1,165 @@
+"""
+Кеширование дорогих вычислений с защитой от «стампеда».
+
+Когда популярное значение истекает под нагрузкой, все одновременные запросы
+бросаются пересчитывать его разом. cached_compute этого не допускает:
+
+* пересчетом занимается один воркер — тот, кто взял блокировку через
+  cache.add (в Redis это SET NX);
+* значение обновляется заранее с вероятностью, растущей к концу срока
+  жизни (XFetch: чем дольше вычисление, тем раньше начинается обновление);
+* после мягкого срока значение еще stale_ttl секунд хранится в кеше и
+  отдается остальным запросам, пока один воркер его пересчитывает.
+
+Ключи группируются тегами с версиями (versioned_key): вместо cache.clear()
+изменившаяся группа сбрасывается увеличением версии тега (bump_tags), а
+старые записи просто доживают свой TTL. Общий кеш при этом не трогается —
+в продакшене в нем же живут сессии и счетчики ratelimit.
+"""
+
+import logging
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'lock_{}'
+TAG_VERSION_KEY = 'nsv_{}'
+
+# Теги групп ключей
+TAG_STATS = 'stats'
+TAG_METADATA = 'meta'
+TAG_SITEMAP = 'sitemap'
+
+# Коэффициент XFetch: больше 1 — обновлять раньше, меньше 1 — позже
+XFETCH_BETA = 1.0
+
+# Ожидание значения от другого воркера при холодном кеше
+LOCK_WAIT_SECONDS = 2.0
+LOCK_POLL_SECONDS = 0.05
+
+
+def is_envelope(entry):
+    return isinstance(entry, dict) and entry.keys() == {'value', 'expires', 'delta'}
+
+
+def should_refresh(entry, beta=XFETCH_BETA, now=None):
+    """
+    Решает, пора ли обновлять значение (XFetch).
+    После мягкого срока ответ всегда «да»; незадолго до него — с вероятностью,
+    пропорциональной времени вычисления.
+    """
+    now = time.time() if now is None else now
+    # -log(U) — экспоненциально распределенная добавка к текущему времени
+    early = -entry['delta'] * beta * math.log(random.random() or 1e-12)
+    return now + early >= entry['expires']
+
+
+def acquire_lock(key, timeout):
+    """Берет блокировку пересчета ключа (атомарно для всех воркеров)"""
+    return cache.add(LOCK_KEY.format(key), 1, timeout)
+
+
+def release_lock(key):
+    cache.delete(LOCK_KEY.format(key))
+
+
+def make_entry(value, ttl, delta=0.0):
+    """Оборачивает значение в конверт с мягким сроком и временем вычисления"""
+    return {'value': value, 'expires': time.time() + ttl, 'delta': delta}
+
+
+def store(key, value, ttl, delta=0.0, stale_ttl=None):
+    """Кладет значение в кеш: мягкий срок ttl, физически хранится ttl + stale_ttl"""
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+    cache.set(key, make_entry(value, ttl, delta), ttl + stale_ttl)
+
+
+def _compute_and_store(key, ttl, fn, stale_ttl):
+    started = time.monotonic()
+    value = fn()
+    store(key, value, ttl, time.monotonic() - started, stale_ttl)
+    return value
+
+
+def cached_compute(key, ttl, fn, stale_ttl=None, lock_timeout=30):
+    """
+    Возвращает значение fn() из кеша, пересчитывая его не чаще раза за ttl
+    и только в одном воркере одновременно.
+
+    stale_ttl — сколько секунд после мягкого срока можно отдавать старое
+    значение, пока идет пересчет (по умолчанию равно ttl).
+    """
+    entry = cache.get(key)
+
+    if is_envelope(entry):
+        if not should_refresh(entry):
+            return entry['value']
+        if not acquire_lock(key, lock_timeout):
+            # Пересчитывает другой воркер — отдаем старое значение
+            return entry['value']
+        try:
+            return _compute_and_store(key, ttl, fn, stale_ttl)
+        except Exception as e:
+            logger.warning(f"Не удалось пересчитать {key}, отдаем устаревшее значение: {e}")
+            return entry['value']
+        finally:
+            release_lock(key)
+
+    # Холодный кеш: считает владелец блокировки, остальные недолго ждут результат
+    if acquire_lock(key, lock_timeout):
+        try:
+            return _compute_and_store(key, ttl, fn, stale_ttl)
+        finally:
+            release_lock(key)
+
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_SECONDS)
+        entry = cache.get(key)
+        if is_envelope(entry):
+            return entry['value']
+
+    logger.warning(f"Не дождались пересчета {key}, вычисляем без блокировки")
+    return fn()
+
+
+def session_tag(session_id):
+    """Тег кешей, относящихся к одной анонимной сессии"""
+    return f'session:{session_id}'
+
+
+def _initial_version():
+    # Версия от времени: если ключ версии вытеснят, записи старых версий не оживут
+    return int(time.time() * 1000)
+
+
+def tag_versions(*tags):
+    """Возвращает текущие версии тегов"""
+    keys = [TAG_VERSION_KEY.format(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key) or _initial_version()
+    return [versions[key] for key in keys]
+
+
+def versioned_key(key, *tags):
+    """Ключ кеша, который устаревает при смене версии любого из тегов"""
+    return f"{key}:{'.'.join(str(version) for version in tag_versions(*tags))}"
+
+
+def bump_tags(*tags):
+    """Сбрасывает все ключи с указанными тегами"""
+    for tag in dict.fromkeys(tags):
+        key = TAG_VERSION_KEY.format(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить тег {tag}: {e}")
@@ -0,0 +1,113 @@
+"""
+Компактные карточки файлов для кешируемых списков.
+
+В кеш кладется не список моделей (pickle тащит _state и все поля, а чтение
+каждый раз пересобирает объекты моделей), а кортежи только с полями, нужными
+шаблону, сериализованные через orjson (или json, если orjson не установлен).
+FileCard отдает шаблону тот же интерфейс, что и модель File.
+"""
+
+import json
+from datetime import datetime, timezone as dt_timezone
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+from .models import File, get_file_type_by_name
+
+CARD_FIELDS = [
+    'code', 'filename', 'file_size', 'created_at', 'expires_at',
+    'download_count', 'is_protected', 'is_permanent',
+]
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FileCard:
+    """
+    Легкое представление файла для шаблонов списков.
+    Методы отображения берутся у модели File, поэтому шаблоны не различают
+    карточку и модель.
+    """
+
+    __slots__ = (
+        'code', 'filename', 'file_size', 'created_at', 'expires_at',
+        'download_count', 'is_protected', 'is_permanent', 'file_type',
+    )
+
+    def __init__(self, code, filename, file_size, created_at, expires_at,
+                 download_count, is_protected, is_permanent, file_type):
+        self.code = code
+        self.filename = filename
+        self.file_size = file_size
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.download_count = download_count
+        self.is_protected = is_protected
+        self.is_permanent = is_permanent
+        self.file_type = file_type
+
+    @classmethod
+    def from_row(cls, row):
+        code, filename, size, created, expires, downloads, protected, permanent, file_type = row
+        return cls(
+            code, filename, size,
+            datetime.fromtimestamp(created, dt_timezone.utc),
+            datetime.fromtimestamp(expires, dt_timezone.utc),
+            downloads, protected, permanent, file_type,
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Карточка из снимка метаданных (files/metadata.py)"""
+        return cls(
+            snapshot['code'], snapshot['filename'], snapshot['size'],
+            datetime.fromtimestamp(snapshot['created_at'], dt_timezone.utc),
+            datetime.fromtimestamp(snapshot['expires_at'], dt_timezone.utc),
+            snapshot['downloads'], snapshot['protected'], snapshot['permanent'], snapshot['type'],
+        )
+
+    @staticmethod
+    def to_row(file):
+        """Компактный кортеж полей файла (тип файла вычисляется заранее)"""
+        return (
+            file.code, file.filename, file.file_size,
+            file.created_at.timestamp(), file.expires_at.timestamp(),
+            file.download_count, file.is_protected, file.is_permanent,
+            get_file_type_by_name(file.filename),
+        )
+
+    def get_file_type(self):
+        return self.file_type
+
+    get_file_type_icon = File.get_file_type_icon
+    get_file_type_name = File.get_file_type_name
+    get_file_type_color = File.get_file_type_color
+    get_file_size_mb = File.get_file_size_mb
+    is_expired = File.is_expired
+    get_remaining_time = File.get_remaining_time
+
+    def __repr__(self):
+        return f'<FileCard {self.code}>'
+
+
+def pack_cards(files):
+    """Сериализует файлы в компактные строки для кеша"""
+    return dumps([FileCard.to_row(file) for file in files])
+
+
+def unpack_cards(data):
+    """Восстанавливает карточки из сериализованных строк"""
+    return [FileCard.from_row(row) for row in loads(data)]
@@ -0,0 +1,291 @@
+"""
+Индекс кодов файлов для быстрого отсечения несуществующих кодов.
+
+Маршрут <str:code>/ перехватывает любой одноуровневый URL, поэтому сканеры
+(/wp-login.php/, /.env/) и перебор случайных кодов раньше стоили запросов к БД
+и рендера шаблона 404. Индекс состоит из трех частей:
+
+* фильтр Блума живых кодов в памяти процесса, перестраивается периодически;
+* негативный кеш недавно не найденных кодов (общий для всех воркеров);
+* метки недавно добавленных кодов, которые закрывают окно между загрузкой
+  файла в одном воркере и перестройкой фильтра в остальных.
+
+Для проверки занятости кода (форма загрузки, /api/check-code/) используется
+общее множество занятых кодов в Redis: отрицательный ответ окончательный,
+положительный перепроверяется в БД.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+MISS_KEY = 'code_miss_{}'
+NEW_KEY = 'code_new_{}'
+
+# Множество занятых канонических кодов (включая мягко удаленные записи:
+# код освобождается только вместе со строкой в БД)
+OCCUPIED_KEY = redis_key('codes:occupied')
+OCCUPIED_JOURNAL_KEY = redis_key('codes:occupied:journal:{}')
+OCCUPIED_TMP_KEY = redis_key('codes:occupied:tmp')
+OCCUPIED_READY_KEY = redis_key('codes:occupied:ready')
+
+
+def normalize_code(code):
+    """Приводит код к каноническому виду (верхний регистр, без пробелов)"""
+    return (code or '').upper().strip()
+
+
+def _journal_keys():
+    """Ключи журнала добавлений за текущий и предыдущий час"""
+    hour = int(time.time() // 3600)
+    return [OCCUPIED_JOURNAL_KEY.format(hour), OCCUPIED_JOURNAL_KEY.format(hour - 1)]
+
+
+def code_digest(code):
+    """Короткий хеш кода для ключей кеша (в URL может быть что угодно)"""
+    return hashlib.blake2b(code.encode('utf-8'), digest_size=12).hexdigest()
+
+
+class BloomFilter:
+    """
+    Простой фильтр Блума на bytearray.
+    Ложноотрицательных ответов не бывает, ложноположительные — с вероятностью error_rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class CodeIndex:
+    """
+    Индекс живых кодов для маршрута прямого просмотра.
+    Отвечает на вопрос «может ли существовать файл с этим кодом» без обращения к БД.
+    """
+
+    def __init__(self):
+        self._filter = None
+        self._built_at = 0.0
+        self._building = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'CODE_INDEX_REBUILD_SECONDS', 600)
+
+    def rebuild(self):
+        """Строит фильтр заново по всем неудаленным файлам"""
+        from .models import File
+
+        started = time.monotonic()
+        codes = File.objects.filter(is_deleted=False).values_list('code', flat=True)
+        capacity = max(codes.count() * 2, 1024)
+        bloom = BloomFilter(capacity, getattr(settings, 'CODE_INDEX_ERROR_RATE', 0.01))
+        for code in codes.iterator(chunk_size=5000):
+            bloom.add(normalize_code(code))
+
+        with self._lock:
+            # Коды, добавленные во время перестройки, переносим в новый фильтр
+            for code in self._pending:
+                bloom.add(code)
+            self._pending = []
+            self._filter = bloom
+            self._built_at = time.monotonic()
+            self._building = False
+
+        logger.info(f"Индекс кодов перестроен: {bloom.count} кодов за {time.monotonic() - started:.2f}с")
+
+    def _rebuild_in_background(self):
+        from django.db import connection
+
+        try:
+            self.rebuild()
+        except Exception as e:
+            with self._lock:
+                self._building = False
+            logger.warning(f"Не удалось перестроить индекс кодов: {e}")
+        finally:
+            # У потока свое соединение с БД — закрываем, иначе каждая перестройка его теряет
+            connection.close()
+
+    def _current_filter(self):
+        """Возвращает текущий фильтр, при необходимости запуская фоновую перестройку"""
+        with self._lock:
+            stale = self._filter is None or time.monotonic() - self._built_at > self.rebuild_interval
+            if stale and not self._building:
+                self._building = True
+                threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+            return self._filter
+
+    def might_exist(self, code):
+        """
+        Проверяет код без обращения к БД.
+        False означает, что файла с таким кодом точно нет; True — что нужно спросить БД.
+        """
+        code = normalize_code(code)
+        if not code:
+            return False
+        digest = code_digest(code)
+        markers = cache.get_many([MISS_KEY.format(digest), NEW_KEY.format(digest)])
+        if NEW_KEY.format(digest) in markers:
+            return True
+        if MISS_KEY.format(digest) in markers:
+            return False
+
+        bloom = self._current_filter()
+        if bloom is None:
+            # Фильтр еще строится — решает БД
+            return True
+        return code in bloom
+
+    def remember_miss(self, code):
+        """Запоминает код, которого нет в БД"""
+        digest = code_digest(normalize_code(code))
+        cache.set(MISS_KEY.format(digest), 1, getattr(settings, 'CODE_MISS_CACHE_SECONDS', 300))
+
+    def add(self, code):
+        """Регистрирует код нового (или переименованного) файла"""
+        code = normalize_code(code)
+        if not code:
+            return
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(code)
+            if self._building:
+                self._pending.append(code)
+
+        # Метка живет дольше интервала перестройки: другие воркеры увидят код
+        # через нее, пока их фильтры не перестроятся
+        digest = code_digest(code)
+        cache.set(NEW_KEY.format(digest), 1, self.rebuild_interval * 2 + 60)
+        cache.delete(MISS_KEY.format(digest))
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                # Почасовой журнал нужен перестройке множества: коды, добавленные
+                # во время сканирования БД, не должны потеряться
+                journal_key = _journal_keys()[0]
+                pipe = redis.pipeline()
+                pipe.sadd(OCCUPIED_KEY, code)
+                pipe.sadd(journal_key, code)
+                pipe.expire(journal_key, 7200)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Не удалось добавить код {code} в Redis: {e}")
+                # Множество без этого кода давало бы ложные «свободно» — не доверяем ему до перестройки
+                try:
+                    redis.delete(OCCUPIED_READY_KEY)
+                except Exception:
+                    pass
+
+    def discard(self, code):
+        """Отмечает удаление кода (из фильтра Блума код уйдет при перестройке)"""
+        code = normalize_code(code)
+        digest = code_digest(code)
+        cache.delete(NEW_KEY.format(digest))
+        cache.set(MISS_KEY.format(digest), 1, getattr(settings, 'CODE_MISS_CACHE_SECONDS', 300))
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                redis.srem(OCCUPIED_KEY, code)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить код {code} из Redis: {e}")
+
+    def is_available(self, code, exclude_pk=None):
+        """
+        Проверяет, свободен ли код для нового или переименованного файла.
+        Отсутствие кода в множестве Redis — окончательный ответ;
+        присутствие перепроверяется в БД (множество может содержать устаревшие коды).
+        """
+        from .models import File
+
+        code = normalize_code(code)
+        if not code:
+            return False
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                pipe = redis.pipeline()
+                pipe.exists(OCCUPIED_READY_KEY)
+                pipe.sismember(OCCUPIED_KEY, code)
+                ready, member = pipe.execute()
+                if ready and not member:
+                    return True
+            except Exception as e:
+                logger.warning(f"Redis недоступен, проверяем код {code} в БД: {e}")
+
+        occupied = File.objects.filter(code__iexact=code)
+        if exclude_pk is not None:
+            occupied = occupied.exclude(pk=exclude_pk)
+        return not occupied.exists()
+
+    def rebuild_occupied(self):
+        """
+        Перестраивает множество занятых кодов в Redis по БД.
+        Возвращает количество кодов или None, если Redis не настроен.
+        """
+        from .models import File
+
+        redis = get_redis()
+        if redis is None:
+            return None
+
+        # Код, добавленный во время сканирования, попадет либо в скан БД,
+        # либо в журнал последних двух часов, который сливается с результатом атомарно
+        redis.delete(OCCUPIED_TMP_KEY)
+        codes = File.objects.values_list('code', flat=True).iterator(chunk_size=5000)
+        batch = []
+        for code in codes:
+            batch.append(normalize_code(code))
+            if len(batch) >= 5000:
+                redis.sadd(OCCUPIED_TMP_KEY, *batch)
+                batch = []
+        if batch:
+            redis.sadd(OCCUPIED_TMP_KEY, *batch)
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.sunionstore(OCCUPIED_TMP_KEY, [OCCUPIED_TMP_KEY] + _journal_keys())
+        pipe.sadd(OCCUPIED_TMP_KEY, '')  # Пустая строка не бывает кодом: RENAME не упадет на пустом множестве
+        pipe.rename(OCCUPIED_TMP_KEY, OCCUPIED_KEY)
+        pipe.set(OCCUPIED_READY_KEY, 1)
+        pipe.scard(OCCUPIED_KEY)
+        result = pipe.execute()
+
+        count = result[-1] - 1
+        logger.info(f"Множество занятых кодов перестроено: {count} кодов")
+        return count
+
+
+code_index = CodeIndex()
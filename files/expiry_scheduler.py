@@ -0,0 +1,100 @@
+"""
+Планировщик истечения файлов на сортированном множестве Redis.
+
+Раньше истекший файл оставался на диске и в списках до часового прохода
+очистки. Теперь при загрузке и изменении срока id файла кладется в ZSET
+со score = expires_at, а задача expire_due_files каждые несколько секунд
+забирает наступившие записи (ZRANGEBYSCORE ... LIMIT) и удаляет их
+небольшими пачками через files/retention.py.
+
+Забирает запись тот, чей ZREM ее удалил, поэтому параллельные воркеры не
+обрабатывают один файл дважды. Срок каждой записи перепроверяется в БД:
+продленный файл возвращается в расписание с новым сроком. Часовой проход
+sweep_expired остается страховкой (файлы, загруженные без Redis, и сбои).
+"""
+
+import logging
+import time
+
+from .redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_KEY = redis_key('expiry:schedule')
+
+
+class ExpiryScheduler:
+    """ZSET id файлов по времени истечения"""
+
+    def schedule(self, file):
+        """Ставит файл в расписание (или переносит на новый срок)"""
+        if file.pk is None:
+            return
+        if file.is_deleted or file.is_permanent:
+            self.cancel(file.pk)
+            return
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            redis.zadd(SCHEDULE_KEY, {file.pk: file.expires_at.timestamp()})
+        except Exception as e:
+            logger.warning(f"Не удалось запланировать истечение файла {file.pk}: {e}")
+
+    def schedule_many(self, entries):
+        """Ставит в расписание пары (id, срок истечения)"""
+        entries = {pk: expires_at.timestamp() for pk, expires_at in entries}
+        redis = get_redis()
+        if redis is None or not entries:
+            return
+        try:
+            redis.zadd(SCHEDULE_KEY, entries)
+        except Exception as e:
+            logger.warning(f"Не удалось запланировать истечение {len(entries)} файлов: {e}")
+
+    def cancel(self, *pks):
+        """Убирает файлы из расписания"""
+        pks = [pk for pk in pks if pk is not None]
+        redis = get_redis()
+        if redis is None or not pks:
+            return
+        try:
+            redis.zrem(SCHEDULE_KEY, *pks)
+        except Exception as e:
+            logger.warning(f"Не удалось убрать файлы из расписания истечения: {e}")
+
+    def pop_due(self, limit, now=None):
+        """
+        Забирает до limit наступивших записей.
+        Возвращает список id или None, если Redis недоступен.
+        """
+        redis = get_redis()
+        if redis is None:
+            return None
+        now = time.time() if now is None else now
+        try:
+            members = redis.zrangebyscore(SCHEDULE_KEY, '-inf', now, start=0, num=limit)
+            if not members:
+                return []
+            pipe = redis.pipeline(transaction=False)
+            for member in members:
+                pipe.zrem(SCHEDULE_KEY, member)
+            removed = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Расписание истечения недоступно: {e}")
+            return None
+        # Запись принадлежит тому, чей ZREM ее удалил
+        return [int(member) for member, ok in zip(members, removed) if ok]
+
+    def pending(self):
+        """Количество записей в расписании (для мониторинга)"""
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            return redis.zcard(SCHEDULE_KEY)
+        except Exception:
+            return None
+
+
+expiry_scheduler = ExpiryScheduler()
@@ -1,6 +1,7 @@
 from django import forms
 from django.conf import settings
 from .models import File
+from .code_index import code_index
 import os
 from django.utils.translation import gettext_lazy as _
 
@@ -76,8 +77,8 @@ class FileUploadForm(forms.ModelForm):
         
         if custom_code:
             # Убираем все ограничения на символы и длину
-            # Проверяем только уникальность
-            if File.objects.filter(code=custom_code).exists():
+            # Проверяем только уникальность (без учета регистра — коды хранятся в верхнем)
+            if not code_index.is_available(custom_code):
                 raise forms.ValidationError(_('Этот код уже используется. Выберите другой.'))
         
         return custom_code if custom_code else None
@@ -169,7 +170,7 @@ class FileEditForm(forms.ModelForm):
         if new_code:
             # Убираем все ограничения на символы и длину
             # Проверяем только уникальность, исключая текущий файл
-            if File.objects.filter(code=new_code).exclude(pk=self.instance.pk).exists():
+            if not code_index.is_available(new_code, exclude_pk=self.instance.pk):
                 raise forms.ValidationError(_('Этот код уже используется. Выберите другой.'))
         
         return new_code if new_code else None 
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Команда для просмотра попаданий в двухуровневый кеш
+Собирает счетчики, которые процессы публикуют в Redis (files.cache_backends)
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from files.cache_backends import STATS_KEY
+from files.redis_utils import get_redis
+
+
+class Command(BaseCommand):
+    help = 'Показывает долю попаданий в L1 (память процесса) и L2 (Redis) по процессам'
+
+    def handle(self, *args, **options):
+        redis = get_redis()
+        if redis is None:
+            self.stdout.write(self.style.WARNING('⚠️ Кеш не на Redis, двухуровневый кеш не используется'))
+            return
+
+        keys = sorted(redis.scan_iter(match=STATS_KEY.format('*'), count=100))
+        if not keys:
+            self.stdout.write(self.style.WARNING('⚠️ Нет данных: процессы еще не опубликовали статистику'))
+            return
+
+        total = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0}
+        self.stdout.write('📊 Статистика кеша по процессам:')
+        for key in keys:
+            raw = redis.get(key)
+            if raw is None:
+                continue
+            stats = json.loads(raw)
+            for name in total:
+                total[name] += stats.get(name, 0)
+            key = key.decode() if isinstance(key, bytes) else key
+            process = key[len(STATS_KEY.format('')):]
+            self.stdout.write(
+                f"  {process} — "
+                f"L1 {stats['l1_hit_ratio']:.1%}, L2 {stats['l2_hit_ratio']:.1%}, "
+                f"записей L1: {stats['l1_entries']}, инвалидаций: {stats['invalidations']}, "
+                f"подписка: {'✅' if stats['listener'] else '❌'}"
+            )
+
+        reads = sum(total.values())
+        if reads:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Всего чтений: {reads}, L1: {total['l1_hits'] / reads:.1%}, "
+                f"L2: {total['l2_hits'] / reads:.1%}, промахов: {total['misses'] / reads:.1%}"
+            ))
@@ -1,14 +1,16 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from files.models import File
-import os
+from files.reconcile import reconcile_media
+from files.retention import IOBudget, purge_soft_deleted
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'Удаляет из базы данных файлы, которые помечены как удаленные или физически отсутствуют на диске'
+    help = (
+        'Удаляет из базы данных файлы, которые помечены как удаленные или физически отсутствуют на диске; '
+        'с --delete-orphans также файлы на диске, для которых нет записи в базе'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -26,138 +28,119 @@ class Command(BaseCommand):
             action='store_true',
             help='Включить в очистку постоянные файлы (по умолчанию они исключены)',
         )
+        parser.add_argument(
+            '--delete-orphans',
+            action='store_true',
+            help='Удалять файлы на диске, для которых нет записи в базе (по умолчанию они только показываются)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Размер пачки удаления (по умолчанию RETENTION_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-ops',
+            type=int,
+            default=None,
+            help='Не больше операций ввода-вывода в секунду (0 — без ограничения, по умолчанию RETENTION_MAX_OPS_PER_SECOND)',
+        )
+        parser.add_argument(
+            '--max-mb',
+            type=float,
+            default=None,
+            help='Не больше мегабайт удаленных файлов в секунду (0 — без ограничения, по умолчанию RETENTION_MAX_MB_PER_SECOND)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
-        include_permanent = options['include_permanent']
-        
+        delete_orphans = options['delete_orphans']
+        reconcile_options = {
+            'include_permanent': options['include_permanent'],
+            'delete_orphans': delete_orphans,
+            'batch_size': options['batch_size'],
+        }
+
         self.stdout.write(
             self.style.SUCCESS('🧹 Начинаем очистку базы данных от удаленных файлов...')
         )
-        
-        # 1. Находим файлы, помеченные как удаленные
-        soft_deleted_files = File.objects.filter(is_deleted=True)
-        if not include_permanent:
-            soft_deleted_files = soft_deleted_files.filter(is_permanent=False)
-        
-        self.stdout.write(f"📋 Найдено файлов, помеченных как удаленные: {soft_deleted_files.count()}")
-        
-        # 2. Находим файлы, которые физически отсутствуют на диске
-        orphaned_files = []
-        all_files = File.objects.all()
-        if not include_permanent:
-            all_files = all_files.filter(is_permanent=False)
-            
-        for file_obj in all_files:
-            if file_obj.file and not os.path.exists(file_obj.file.path):
-                orphaned_files.append(file_obj)
-        
-        self.stdout.write(f"📋 Найдено файлов, отсутствующих на диске: {len(orphaned_files)}")
-        
-        # 3. Находим QR коды, которые отсутствуют на диске
-        orphaned_qr_codes = []
-        for file_obj in all_files:
-            if file_obj.qr_code and not os.path.exists(file_obj.qr_code.path):
-                orphaned_qr_codes.append(file_obj)
-        
-        self.stdout.write(f"📋 Найдено QR кодов, отсутствующих на диске: {len(orphaned_qr_codes)}")
-        
-        # Объединяем все файлы для удаления
-        files_to_delete = set()
-        files_to_delete.update(soft_deleted_files)
-        files_to_delete.update(orphaned_files)
-        files_to_delete.update(orphaned_qr_codes)
-        
-        total_files = len(files_to_delete)
-        
-        if total_files == 0:
+
+        # Подсчет: один проход по таблице и один обход диска, без изменений
+        soft_deleted = purge_soft_deleted(batch_size=options['batch_size'], dry_run=True)
+        report = reconcile_media(dry_run=True, **reconcile_options)
+        self.show_report(soft_deleted, report, delete_orphans)
+
+        total = soft_deleted['rows'] + report['missing_rows'] + (report['disk_orphans'] if delete_orphans else 0)
+        if total == 0:
             self.stdout.write(
                 self.style.SUCCESS('✅ Нет файлов для удаления!')
             )
             return
-        
-        # Показываем детали
-        self.stdout.write(f"\n📊 Детали файлов для удаления:")
-        self.stdout.write(f"   • Помеченные как удаленные: {soft_deleted_files.count()}")
-        self.stdout.write(f"   • Отсутствующие на диске: {len(orphaned_files)}")
-        self.stdout.write(f"   • С отсутствующими QR кодами: {len(orphaned_qr_codes)}")
-        self.stdout.write(f"   • Всего уникальных файлов: {total_files}")
-        
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('\n🔍 РЕЖИМ ПРОСМОТРА - файлы НЕ будут удалены')
             )
-            self.show_file_details(files_to_delete)
+            self.show_samples(report, delete_orphans)
             return
-        
+
         # Подтверждение удаления
         if not force:
-            self.stdout.write(f"\n⚠️  Вы собираетесь удалить {total_files} файлов из базы данных.")
+            self.stdout.write(f"\n⚠️  Вы собираетесь удалить {total} записей и файлов.")
             confirm = input("Продолжить? (yes/no): ")
             if confirm.lower() not in ['yes', 'y', 'да', 'д']:
                 self.stdout.write(
                     self.style.WARNING('❌ Операция отменена пользователем')
                 )
                 return
-        
-        # Выполняем удаление
-        self.stdout.write(f"\n🗑️  Удаляем {total_files} файлов...")
-        
-        deleted_count = 0
-        errors = []
-        
-        with transaction.atomic():
-            for file_obj in files_to_delete:
-                try:
-                    # Логируем информацию о файле
-                    self.stdout.write(f"   Удаляем: {file_obj.code} - {file_obj.filename}")
-                    
-                    # Удаляем файл (это вызовет наш кастомный метод delete)
-                    file_obj.delete()
-                    deleted_count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Ошибка при удалении {file_obj.code}: {str(e)}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-                    self.stdout.write(
-                        self.style.ERROR(f"   ❌ {error_msg}")
-                    )
-        
-        # Результаты
+
+        # Общий бюджет на оба прохода, чтобы очистка не мешала скачиваниям
+        budget = IOBudget.from_settings(options['max_ops'], options['max_mb'])
+        self.stdout.write(f"\n🗑️  Удаляем...")
+        purged = purge_soft_deleted(batch_size=options['batch_size'], budget=budget)
+        report = reconcile_media(dry_run=False, budget=budget, **reconcile_options)
+
+        errors = purged['errors'] + report['errors']
         self.stdout.write(f"\n📈 Результаты очистки:")
-        self.stdout.write(f"   ✅ Успешно удалено: {deleted_count}")
-        self.stdout.write(f"   ❌ Ошибок: {len(errors)}")
-        
+        self.stdout.write(f"   ✅ Удалено записей: {purged['purged'] + report['purged']}")
+        self.stdout.write(f"   ✅ Удалено файлов с диска: {purged['unlinked'] + report['unlinked']}")
+        self.stdout.write(
+            f"   📦 Освобождено: {(purged['bytes_freed'] + report['bytes_freed']) / 1024 / 1024:.1f} МБ"
+        )
+        self.stdout.write(f"   ❌ Ошибок: {errors}")
+
         if errors:
-            self.stdout.write(f"\n🚨 Ошибки:")
-            for error in errors:
-                self.stdout.write(f"   • {error}")
-        
-        if deleted_count > 0:
             self.stdout.write(
-                self.style.SUCCESS(f'\n🎉 Очистка завершена! Удалено {deleted_count} файлов.')
+                self.style.WARNING('\n⚠️  Часть файлов не удалось удалить, подробности в логе.')
             )
         else:
             self.stdout.write(
-                self.style.WARNING('\n⚠️  Не удалось удалить ни одного файла.')
+                self.style.SUCCESS('\n🎉 Очистка завершена!')
             )
 
-    def show_file_details(self, files):
-        """Показывает детали файлов для удаления"""
-        self.stdout.write(f"\n📋 Детали файлов для удаления:")
-        
-        for file_obj in files:
-            status = []
-            if file_obj.is_deleted:
-                status.append("помечен как удаленный")
-            if file_obj.file and not os.path.exists(file_obj.file.path):
-                status.append("файл отсутствует")
-            if file_obj.qr_code and not os.path.exists(file_obj.qr_code.path):
-                status.append("QR код отсутствует")
-            
-            status_str = ", ".join(status)
+    def show_report(self, soft_deleted, report, delete_orphans):
+        """Показывает найденные расхождения"""
+        self.stdout.write(f"\n📊 Детали файлов для удаления:")
+        self.stdout.write(f"   • Помеченные как удаленные: {soft_deleted['rows']}")
+        self.stdout.write(f"   • Записи без файла или QR кода на диске: {report['missing_rows']}")
+        if delete_orphans:
+            self.stdout.write(f"   • Файлы на диске без записи в базе: {report['disk_orphans']}")
+        elif report['disk_orphans']:
             self.stdout.write(
-                f"   • {file_obj.code} - {file_obj.filename} ({status_str})"
+                f"   • Файлы на диске без записи в базе (не удаляются, см. --delete-orphans): {report['disk_orphans']}"
             )
+        if report['missing_compressed']:
+            self.stdout.write(f"   • Отсутствующие сжатые PDF (записи сохраняются): {report['missing_compressed']}")
+
+    def show_samples(self, report, delete_orphans):
+        """Показывает, что будет удалено (первые найденные пути)"""
+        sections = [('Записи без файла будут удалены', 'db', report['missing_rows'])]
+        if delete_orphans:
+            sections.append(('Файлы без записи будут удалены с диска', 'disk', report['disk_orphans']))
+        for title, key, total in sections:
+            samples = report['samples'][key]
+            if samples:
+                self.stdout.write(f"\n📋 {title} (первые {len(samples)} из {total}):")
+                for path in samples:
+                    self.stdout.write(f"   • {path}")
@@ -1,7 +1,7 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from files.models import File
-import os
+from files.retention import IOBudget, expired_batches, sweep_expired
 
 
 class Command(BaseCommand):
@@ -13,53 +13,75 @@ class Command(BaseCommand):
             action='store_true',
             help='Показать что будет удалено без фактического удаления',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Количество записей в одной пачке (по умолчанию RETENTION_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Потоков для удаления файлов с диска (по умолчанию RETENTION_UNLINK_WORKERS)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Максимум записей за запуск; остаток обработает следующий запуск',
+        )
+        parser.add_argument(
+            '--max-ops',
+            type=int,
+            default=None,
+            help='Не больше операций ввода-вывода в секунду (0 — без ограничения, по умолчанию RETENTION_MAX_OPS_PER_SECOND)',
+        )
+        parser.add_argument(
+            '--max-mb',
+            type=float,
+            default=None,
+            help='Не больше мегабайт удаленных файлов в секунду (0 — без ограничения, по умолчанию RETENTION_MAX_MB_PER_SECOND)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
-        # Находим истекшие файлы
-        expired_files = File.objects.filter(
-            expires_at__lt=timezone.now(),
-            is_deleted=False
+
+        if dry_run:
+            count = 0
+            for rows in expired_batches(timezone.now(), options['batch_size'] or settings.RETENTION_BATCH_SIZE):
+                for row in rows:
+                    self.stdout.write(f'  - код: {row[1]}, файл: {row[4]}')
+                count += len(rows)
+            if count == 0:
+                self.stdout.write(self.style.SUCCESS('Нет истекших файлов для удаления'))
+            else:
+                self.stdout.write(self.style.WARNING(f'Будет удалено {count} истекших файлов'))
+            return
+
+        metrics = sweep_expired(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            limit=options['limit'],
+            budget=IOBudget.from_settings(options['max_ops'], options['max_mb']),
         )
-        
-        count = expired_files.count()
-        
-        if count == 0:
-            self.stdout.write(
-                self.style.SUCCESS('Нет истекших файлов для удаления')
-            )
+
+        if metrics['rows'] == 0:
+            self.stdout.write(self.style.SUCCESS('Нет истекших файлов для удаления'))
             return
-        
-        if dry_run:
-            self.stdout.write(
-                self.style.WARNING(f'Будет удалено {count} истекших файлов:')
-            )
-            for file in expired_files:
-                self.stdout.write(f'  - {file.filename} (код: {file.code}, истек: {file.expires_at})')
-        else:
-            # Удаляем файлы
-            for file in expired_files:
-                try:
-                    # Удаляем физический файл
-                    if file.file and os.path.exists(file.file.path):
-                        os.remove(file.file.path)
-                    
-                    # Удаляем QR код
-                    if file.qr_code and os.path.exists(file.qr_code.path):
-                        os.remove(file.qr_code.path)
-                    
-                    # Помечаем как удаленный
-                    file.is_deleted = True
-                    file.save()
-                    
-                    self.stdout.write(f'Удален файл: {file.filename} (код: {file.code})')
-                    
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f'Ошибка при удалении {file.filename}: {e}')
-                    )
-            
-            self.stdout.write(
-                self.style.SUCCESS(f'Успешно удалено {count} истекших файлов')
-            ) 
\ No newline at end of file
+
+        self.stdout.write(
+            f"📊 Пачек: {metrics['batches']}, строк: {metrics['rows']} за {metrics['elapsed']} с "
+            f"({metrics['rows_per_second']} строк/с)"
+        )
+        self.stdout.write(
+            f"🗑️ Удалено файлов с диска: {metrics['unlinked']}, "
+            f"освобождено {metrics['bytes_freed'] / 1024 / 1024:.1f} МБ ({metrics['mb_per_second']} МБ/с)"
+        )
+        if metrics['throttled']:
+            self.stdout.write(f"⏳ Ожидание бюджета ввода-вывода: {metrics['throttled']} с")
+        if metrics['errors']:
+            self.stdout.write(self.style.ERROR(f"❌ Ошибок удаления: {metrics['errors']} (подробности в логе)"))
+        self.stdout.write(
+            self.style.SUCCESS(f"Успешно удалено {metrics['marked']} истекших файлов")
+        )
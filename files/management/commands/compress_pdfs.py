@@ -1,12 +1,23 @@
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db.models import Q
 from files.models import File
-from files.pdf_utils import compress_pdf, should_compress_pdf, get_pdf_info
+from files.pdf_utils import compress_file_by_id, init_backfill_worker, should_compress_pdf
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_KEY = 'compress_pdfs_checkpoint'
+CHECKPOINT_TIMEOUT = 7 * 24 * 3600
+
+# Как часто печатать прогресс (секунды)
+PROGRESS_INTERVAL = 5
+
 
 class Command(BaseCommand):
     help = 'Сжимает PDF файлы для быстрого веб-отображения'
@@ -34,133 +45,155 @@ class Command(BaseCommand):
             default=75,
             help='Качество сжатия от 1 до 100 (по умолчанию 75)',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Сколько файлов сжимать параллельно в отдельных процессах (по умолчанию 1)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с начала, игнорируя сохраненную точку прерванного запуска',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
         max_size_mb = options['max_size']
         quality = options['quality']
-        
+        workers = max(1, options['workers'])
+
         self.stdout.write(
             self.style.SUCCESS('🗜️  Начинаем сжатие PDF файлов...')
         )
-        
+
         # Находим PDF файлы для сжатия
         pdf_files = File.objects.filter(
             filename__iendswith='.pdf',
             is_deleted=False
         )
-        
+
         if not force:
             # Исключаем файлы, у которых уже есть сжатые версии
-            pdf_files = pdf_files.filter(compressed_pdf__isnull=True)
-        
-        files_to_compress = []
-        
-        for file_obj in pdf_files:
-            if os.path.exists(file_obj.file.path):
-                if should_compress_pdf(file_obj.file.path, max_size_mb):
-                    files_to_compress.append(file_obj)
-        
-        total_files = len(files_to_compress)
-        
-        if total_files == 0:
+            # (пустой FileField хранится как '', а не NULL)
+            pdf_files = pdf_files.filter(Q(compressed_pdf__isnull=True) | Q(compressed_pdf=''))
+
+        if dry_run:
             self.stdout.write(
-                self.style.SUCCESS('✅ Нет PDF файлов для сжатия!')
+                self.style.WARNING('\n🔍 РЕЖИМ ПРОСМОТРА - файлы НЕ будут сжаты')
             )
+            self.show_file_details(pdf_files, max_size_mb)
             return
-        
-        self.stdout.write(f"📋 Найдено PDF файлов для сжатия: {total_files}")
-        self.stdout.write(f"⚙️  Параметры: max_size={max_size_mb}MB, quality={quality}")
-        
-        if dry_run:
+
+        # Продолжаем прерванный запуск с теми же параметрами
+        params = {'force': force, 'max_size': max_size_mb, 'quality': quality}
+        after_id = 0
+        checkpoint = None if options['restart'] else cache.get(CHECKPOINT_KEY)
+        if checkpoint:
+            if checkpoint['params'] == params:
+                after_id = checkpoint['last_id']
+                self.stdout.write(f"⏯️  Продолжаем прерванный запуск с id > {after_id}")
+            else:
+                self.stdout.write(
+                    self.style.WARNING('⚠️  Сохраненная точка относится к запуску с другими параметрами и пропущена')
+                )
+
+        pdf_files = pdf_files.filter(id__gt=after_id).order_by('id')
+        total_files = pdf_files.count()
+
+        if total_files == 0:
+            cache.delete(CHECKPOINT_KEY)
             self.stdout.write(
-                self.style.WARNING('\n🔍 РЕЖИМ ПРОСМОТРА - файлы НЕ будут сжаты')
+                self.style.SUCCESS('✅ Нет PDF файлов для сжатия!')
             )
-            self.show_file_details(files_to_compress)
             return
-        
-        # Выполняем сжатие
-        self.stdout.write(f"\n🗜️  Сжимаем {total_files} PDF файлов...")
-        
+
+        self.stdout.write(f"📋 Кандидатов на сжатие: {total_files}")
+        self.stdout.write(f"⚙️  Параметры: max_size={max_size_mb}MB, quality={quality}, workers={workers}")
+
+        # Выполняем сжатие: каждый файл сохраняется сразу, ошибка одного
+        # не откатывает остальные, а точка продолжения двигается по мере готовности
+        self.stdout.write(f"\n🗜️  Сжимаем PDF файлы...")
+
         compressed_count = 0
+        processed = 0
         errors = []
         total_original_size = 0
         total_compressed_size = 0
-        
-        with transaction.atomic():
-            for file_obj in files_to_compress:
-                try:
-                    original_size = file_obj.file_size
-                    total_original_size += original_size
-                    
-                    self.stdout.write(f"   Сжимаем: {file_obj.code} - {file_obj.filename}")
-                    
-                    # Сжимаем PDF
-                    success, compressed_path, compressed_size = compress_pdf(
-                        file_obj.file.path,
-                        quality=quality,
-                        max_size_mb=max_size_mb
-                    )
-                    
-                    if success and compressed_path and compressed_size:
-                        # Сохраняем сжатую версию
-                        with open(compressed_path, 'rb') as f:
-                            file_obj.compressed_pdf.save(
-                                f"compressed_{file_obj.filename}",
-                                ContentFile(f.read()),
-                                save=True
-                            )
-                        
-                        file_obj.compressed_pdf_size = compressed_size
-                        file_obj.save(update_fields=['compressed_pdf', 'compressed_pdf_size'])
-                        
-                        total_compressed_size += compressed_size
-                        compressed_count += 1
-                        
-                        # Удаляем временный файл
-                        if compressed_path != file_obj.file.path:
-                            os.remove(compressed_path)
-                        
-                        # Показываем результат
-                        original_mb = original_size / (1024 * 1024)
-                        compressed_mb = compressed_size / (1024 * 1024)
-                        ratio = file_obj.get_compression_ratio()
-                        
-                        self.stdout.write(
-                            f"     ✅ {original_mb:.1f}MB → {compressed_mb:.1f}MB ({ratio}% сжатие)"
-                        )
-                    else:
-                        self.stdout.write(f"     ❌ Не удалось сжать")
-                        errors.append(f"Не удалось сжать {file_obj.code}")
-                        
-                except Exception as e:
-                    error_msg = f"Ошибка при сжатии {file_obj.code}: {str(e)}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-                    self.stdout.write(
-                        self.style.ERROR(f"     ❌ {error_msg}")
-                    )
-        
+
+        started = time.monotonic()
+        last_report = started
+        candidates = pdf_files.values_list('id', flat=True).iterator(chunk_size=500)
+
+        # id в порядке отправки; точка продолжения — наибольший id, до
+        # которого включительно все файлы уже обработаны
+        submitted = deque()
+        finished = set()
+
+        for result in self.run_pool(candidates, submitted, workers, quality, max_size_mb):
+            processed += 1
+            finished.add(result['id'])
+            last_id = None
+            while submitted and submitted[0] in finished:
+                last_id = submitted.popleft()
+                finished.discard(last_id)
+            if last_id is not None:
+                cache.set(CHECKPOINT_KEY, {'last_id': last_id, 'params': params}, CHECKPOINT_TIMEOUT)
+
+            status = result['status']
+            if status == 'compressed':
+                compressed_count += 1
+                total_original_size += result['original_size']
+                total_compressed_size += result['compressed_size']
+
+                # Показываем результат
+                original_mb = result['original_size'] / (1024 * 1024)
+                compressed_mb = result['compressed_size'] / (1024 * 1024)
+                ratio = round((1 - result['compressed_size'] / result['original_size']) * 100, 1) if result['original_size'] else 0
+
+                self.stdout.write(
+                    f"   ✅ {result['code']}: {original_mb:.1f}MB → {compressed_mb:.1f}MB ({ratio}% сжатие)"
+                )
+            elif status == 'no_gain':
+                self.stdout.write(f"   ➖ {result['code']}: сжатие не дало выигрыша")
+            elif status == 'missing':
+                errors.append(f"Файл не найден: {result['code'] or result['id']}")
+            elif status == 'error':
+                error_msg = f"Ошибка при сжатии {result['code'] or result['id']}: {result['error']}"
+                errors.append(error_msg)
+                self.stdout.write(
+                    self.style.ERROR(f"   ❌ {error_msg}")
+                )
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL or processed == total_files:
+                last_report = now
+                self.report_progress(processed, total_files, total_original_size, now - started)
+
+        cache.delete(CHECKPOINT_KEY)
+
         # Результаты
+        elapsed = time.monotonic() - started
         self.stdout.write(f"\n📈 Результаты сжатия:")
+        self.stdout.write(f"   📋 Обработано: {processed} за {elapsed:.1f} с")
         self.stdout.write(f"   ✅ Успешно сжато: {compressed_count}")
         self.stdout.write(f"   ❌ Ошибок: {len(errors)}")
-        
+
         if compressed_count > 0:
             total_original_mb = total_original_size / (1024 * 1024)
             total_compressed_mb = total_compressed_size / (1024 * 1024)
             total_saved_mb = total_original_mb - total_compressed_mb
             total_ratio = (1 - total_compressed_size / total_original_size) * 100
-            
+
             self.stdout.write(f"   📊 Общий размер: {total_original_mb:.1f}MB → {total_compressed_mb:.1f}MB")
             self.stdout.write(f"   💾 Сэкономлено: {total_saved_mb:.1f}MB ({total_ratio:.1f}%)")
-        
+
         if errors:
             self.stdout.write(f"\n🚨 Ошибки:")
             for error in errors:
                 self.stdout.write(f"   • {error}")
-        
+
         if compressed_count > 0:
             self.stdout.write(
                 self.style.SUCCESS(f'\n🎉 Сжатие завершено! Обработано {compressed_count} файлов.')
@@ -170,12 +203,56 @@ class Command(BaseCommand):
                 self.style.WARNING('\n⚠️  Не удалось сжать ни одного файла.')
             )
 
-    def show_file_details(self, files):
+    def run_pool(self, candidates, submitted, workers, quality, max_size_mb):
+        """
+        Сжимает файлы по id из candidates и отдает результаты по мере готовности.
+        В пул отправляется не больше 2 * workers файлов сразу, поэтому
+        кандидаты читаются из базы потоком.
+        """
+        if workers == 1:
+            for file_id in candidates:
+                submitted.append(file_id)
+                yield compress_file_by_id(file_id, quality=quality, max_size_mb=max_size_mb)
+            return
+
+        # Параллельно идут файлы, поэтому каждый растеризуется в одном процессе
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_backfill_worker) as pool:
+            pending = set()
+            for file_id in candidates:
+                submitted.append(file_id)
+                pending.add(pool.submit(compress_file_by_id, file_id, quality, max_size_mb, 1))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def report_progress(self, processed, total, original_bytes, elapsed):
+        """Прогресс: обработано, скорость и оценка оставшегося времени"""
+        rate = processed / elapsed if elapsed else 0.0
+        mb_rate = original_bytes / (1024 * 1024) / elapsed if elapsed else 0.0
+        remaining = max(total - processed, 0)
+        eta = remaining / rate if rate else 0
+        self.stdout.write(
+            f"   ⏱️  {processed}/{total} ({processed * 100 // total}%), "
+            f"{rate:.2f} файл/с, {mb_rate:.1f} МБ/с, осталось ~{int(eta) // 60} мин {int(eta) % 60} с"
+        )
+
+    def show_file_details(self, files, max_size_mb):
         """Показывает детали файлов для сжатия"""
         self.stdout.write(f"\n📋 Детали PDF файлов для сжатия:")
-        
-        for file_obj in files:
-            original_mb = file_obj.file_size / (1024 * 1024)
-            self.stdout.write(
-                f"   • {file_obj.code} - {file_obj.filename} ({original_mb:.1f}MB)"
-            )
+
+        count = 0
+        for file_obj in files.order_by('id').iterator(chunk_size=500):
+            if os.path.exists(file_obj.file.path) and should_compress_pdf(file_obj.file.path, max_size_mb):
+                count += 1
+                original_mb = file_obj.file_size / (1024 * 1024)
+                self.stdout.write(
+                    f"   • {file_obj.code} - {file_obj.filename} ({original_mb:.1f}MB)"
+                )
+
+        self.stdout.write(f"📋 Найдено PDF файлов для сжатия: {count}")
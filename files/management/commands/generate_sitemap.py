@@ -1,81 +1,35 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.contrib.sites.models import Site
-from files.models import File
-from django.utils import timezone
-import os
+from files.sitemaps import build_sitemaps
 
 
 class Command(BaseCommand):
-    help = 'Генерирует sitemap.xml файл'
+    help = 'Собирает sitemap.xml (индекс) и части карты сайта в SITEMAP_ROOT'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--output',
+            '--output-dir',
             type=str,
-            default='static/sitemap.xml',
-            help='Путь для сохранения sitemap.xml файла'
+            default=None,
+            help='Директория для файлов карты сайта (по умолчанию SITEMAP_ROOT)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересобрать все части, а не только измененные'
         )
 
     def handle(self, *args, **options):
-        output_path = options['output']
-        
-        # Создаем директорию, если её нет
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Получаем домен
-        try:
-            site = Site.objects.get_current()
-            domain = site.domain
-        except Site.DoesNotExist:
-            domain = '0123.ru'
-        
-        # Генерируем sitemap
-        sitemap_content = self.generate_sitemap(domain)
-        
-        # Сохраняем файл
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(sitemap_content)
-        
+        root = options['output_dir'] or settings.SITEMAP_ROOT
+
+        # Части пишутся потоком из итератора по БД, без сборки XML в памяти
+        result = build_sitemaps(root, full=options['full'])
+
+        mode = 'полная' if result['full'] else 'инкрементальная'
         self.stdout.write(
-            self.style.SUCCESS(f'Sitemap успешно создан: {output_path}')
+            self.style.SUCCESS(
+                f"✅ Sitemap собран в {root} ({mode} сборка): частей {result['shards']}, "
+                f"пересобрано {result['rebuilt']}, изменено файлов {result['changed']}, "
+                f"удалено частей {result['removed']}"
+            )
         )
-
-    def generate_sitemap(self, domain):
-        """Генерирует содержимое sitemap.xml"""
-        
-        # Начинаем XML
-        xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-        
-        # Статические страницы
-        static_pages = [
-            ('', '1.0', 'daily'),  # Главная страница
-            ('/files/recent/', '0.8', 'daily'),  # Мои файлы
-        ]
-        
-        for url, priority, changefreq in static_pages:
-            xml += f'  <url>\n'
-            xml += f'    <loc>https://{domain}{url}</loc>\n'
-            xml += f'    <changefreq>{changefreq}</changefreq>\n'
-            xml += f'    <priority>{priority}</priority>\n'
-            xml += f'  </url>\n'
-        
-        # Публичные файлы (без паролей)
-        public_files = File.objects.filter(
-            is_protected=False,
-            expires_at__gt=timezone.now(),
-            is_deleted=False
-        ).order_by('-created_at')[:1000]  # Ограничиваем количество
-        
-        for file in public_files:
-            xml += f'  <url>\n'
-            xml += f'    <loc>https://{domain}/files/{file.code}/</loc>\n'
-            xml += f'    <lastmod>{file.created_at.strftime("%Y-%m-%d")}</lastmod>\n'
-            xml += f'    <changefreq>daily</changefreq>\n'
-            xml += f'    <priority>0.6</priority>\n'
-            xml += f'  </url>\n'
-        
-        # Закрываем XML
-        xml += '</urlset>'
-        
-        return xml
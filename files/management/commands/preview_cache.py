@@ -0,0 +1,45 @@
+"""
+Команда для просмотра и вытеснения кеша PDF-превью (files/preview_cache.py)
+"""
+
+from django.core.management.base import BaseCommand
+
+from files.preview_cache import preview_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику кеша превью офисных документов и вытесняет старые превью'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Пересчитать объем и вытеснить давно не открытые превью сверх бюджета',
+        )
+        parser.add_argument(
+            '--max-mb',
+            type=float,
+            default=None,
+            help='Бюджет для вытеснения в мегабайтах (по умолчанию PREVIEW_CACHE_MAX_BYTES)',
+        )
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            max_bytes = None if options['max_mb'] is None else int(options['max_mb'] * 1024 * 1024)
+            preview_cache.cleanup_tempdirs()
+            evicted, freed = preview_cache.evict(max_bytes)
+            self.stdout.write(
+                self.style.SUCCESS(f"🧹 Вытеснено превью: {evicted}, освобождено {freed / 1024 / 1024:.1f} МБ")
+            )
+
+        stats = preview_cache.stats()
+        self.stdout.write('📊 Кеш превью:')
+        self.stdout.write(
+            f"  Занято: {stats['bytes'] / 1024 / 1024:.1f} из {stats['max_bytes'] / 1024 / 1024:.0f} МБ"
+        )
+        self.stdout.write(
+            f"  Попаданий: {stats['hits']}, промахов: {stats['misses']} (доля попаданий {stats['hit_rate']:.1%})"
+        )
+        self.stdout.write(
+            f"  Вытеснено: {stats['evictions']} файлов, {stats['evicted_bytes'] / 1024 / 1024:.1f} МБ"
+        )
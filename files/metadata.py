@@ -0,0 +1,121 @@
+"""
+Кеш метаданных файлов по коду.
+
+Снимок метаданных — компактный словарь с полями, нужными API статуса и
+спискам файлов. Снимки читаются пачкой (get_many), промахи добираются
+одним запросом с IN и кладутся обратно в кеш.
+
+Снимки хранятся в конвертах files.caching: истекающий снимок обновляет
+один воркер, остальные до конца обновления получают устаревший.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import (
+    TAG_METADATA, acquire_lock, is_envelope, make_entry, release_lock, should_refresh, tag_versions,
+)
+
+from .code_index import code_digest, normalize_code
+
+logger = logging.getLogger(__name__)
+
+META_KEY = 'file_meta_{}'
+
+# Снимок для кода, которого нет в БД (кешируется, чтобы опрос несуществующих
+# кодов не доходил до БД)
+MISSING = {}
+
+SNAPSHOT_FIELDS = [
+    'id', 'code', 'filename', 'file_size', 'is_protected', 'is_permanent', 'is_deleted',
+    'created_at', 'expires_at', 'download_count', 'compressed_pdf', 'compressed_pdf_size',
+]
+
+
+def metadata_key(code, version=None):
+    """Ключ кеша метаданных для кода (version — версия тега метаданных)"""
+    if version is None:
+        version = tag_versions(TAG_METADATA)[0]
+    return f'{META_KEY.format(code_digest(normalize_code(code)))}:{version}'
+
+
+def build_snapshot(file):
+    """Строит компактный снимок метаданных файла"""
+    return {
+        'id': file.pk,
+        'code': file.code,
+        'filename': file.filename,
+        'size': file.file_size,
+        'type': file.get_file_type(),
+        'protected': file.is_protected,
+        'permanent': file.is_permanent,
+        'deleted': file.is_deleted,
+        'created_at': file.created_at.timestamp(),
+        'expires_at': file.expires_at.timestamp(),
+        'downloads': file.download_count,
+        'compressed_size': file.compressed_pdf_size if file.has_compressed_pdf() else None,
+    }
+
+
+def get_metadata_many(codes):
+    """
+    Возвращает {канонический_код: снимок} для списка кодов.
+    Для отсутствующих файлов снимок — пустой словарь MISSING.
+    """
+    from .models import File
+
+    codes = list(dict.fromkeys(normalize_code(code) for code in codes if normalize_code(code)))
+    if not codes:
+        return {}
+
+    version = tag_versions(TAG_METADATA)[0]
+    keys = {metadata_key(code, version): code for code in codes}
+    cached = cache.get_many(list(keys))
+    result = {}
+    refresh = []
+    for key, entry in cached.items():
+        if not is_envelope(entry):
+            continue
+        code = keys[key]
+        result[code] = entry['value']
+        if should_refresh(entry) and acquire_lock(key, 30):
+            refresh.append(code)
+
+    missing = [code for code in codes if code not in result]
+    fetch = missing + refresh
+    if fetch:
+        ttl = getattr(settings, 'FILE_METADATA_CACHE_SECONDS', 60)
+        started = time.monotonic()
+        fetched = {}
+        try:
+            for file in File.objects.filter(code__in=fetch).only(*SNAPSHOT_FIELDS):
+                fetched[normalize_code(file.code)] = build_snapshot(file)
+            for code in fetch:
+                fetched.setdefault(code, MISSING)
+
+            delta = time.monotonic() - started
+            cache.set_many(
+                {metadata_key(code, version): make_entry(snapshot, ttl, delta) for code, snapshot in fetched.items()},
+                ttl * 2
+            )
+            result.update(fetched)
+        except Exception as e:
+            if missing:
+                raise
+            logger.warning(f"Не удалось обновить метаданные, отдаем устаревшие: {e}")
+        finally:
+            for code in refresh:
+                release_lock(metadata_key(code, version))
+
+    return result
+
+
+def invalidate_metadata(*codes):
+    """Сбрасывает кешированные метаданные кодов"""
+    codes = [code for code in codes if code]
+    if codes:
+        version = tag_versions(TAG_METADATA)[0]
+        cache.delete_many([metadata_key(code, version) for code in codes])
@@ -10,6 +10,7 @@ from django.utils.deprecation import MiddlewareMixin
 from django.core.cache import cache
 from django.http import HttpResponse, JsonResponse
 from django.conf import settings
+from django.urls import resolve
 from django.utils import timezone
 from django_ratelimit.core import is_ratelimited
 from django_ratelimit.exceptions import Ratelimited
@@ -53,19 +54,43 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
     
     def process_response(self, request, response):
         """Добавляем заголовки безопасности к ответу"""
-        # Запрещаем встраивание в iframe (защита от clickjacking)
-        response['X-Frame-Options'] = 'DENY'
-        
-        # Запрещаем MIME type sniffing
-        response['X-Content-Type-Options'] = 'nosniff'
-        
-        # Включаем XSS protection
-        response['X-XSS-Protection'] = '1; mode=block'
-        
-        # Referrer policy
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+        return add_security_headers(response)
+
+
+def add_security_headers(response):
+    """Добавляет заголовки безопасности к ответу"""
+    # Запрещаем встраивание в iframe (защита от clickjacking)
+    response['X-Frame-Options'] = 'DENY'
+    
+    # Запрещаем MIME type sniffing
+    response['X-Content-Type-Options'] = 'nosniff'
+    
+    # Включаем XSS protection
+    response['X-XSS-Protection'] = '1; mode=block'
+    
+    # Referrer policy
+    response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+    
+    return response
+
+
+class SessionlessPathMiddleware(MiddlewareMixin):
+    """
+    Короткий путь для легких API, которые дергаются на каждое нажатие клавиши
+    (например, /api/check-code/).
+    
+    Для путей из SESSIONLESS_PATHS view вызывается сразу, без сессий, CSRF,
+    локали, сообщений и анонимных сессий. Должен стоять сразу после SecurityMiddleware.
+    View на таких путях не должны обращаться к request.session и request.user.
+    """
+    
+    def process_request(self, request):
+        if request.path_info not in getattr(settings, 'SESSIONLESS_PATHS', ()):
+            return None
         
-        return response
+        match = resolve(request.path_info)
+        response = match.func(request, *match.args, **match.kwargs)
+        return add_security_headers(response)
 
 
 class AnonymousSessionMiddleware(MiddlewareMixin):
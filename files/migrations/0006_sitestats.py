@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:16
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def seed_stats(apps, schema_editor):
+    """Заполняет строку статистики по существующим файлам"""
+    File = apps.get_model('files', 'File')
+    SiteStats = apps.get_model('files', 'SiteStats')
+
+    today = timezone.localdate()
+    alive = File.objects.filter(is_deleted=False)
+    SiteStats.objects.update_or_create(pk=1, defaults={
+        'total_files': File.objects.count(),
+        'total_downloads': File.objects.aggregate(total=Sum('download_count'))['total'] or 0,
+        'active_files': alive.count(),
+        'protected_files': alive.filter(is_protected=True).count(),
+        'today_date': today,
+        'today_files': File.objects.filter(created_at__date=today).count(),
+        'reconciled_at': timezone.now(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_file_compressed_pdf_file_compressed_pdf_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_files', models.BigIntegerField(default=0, verbose_name='Всего загружено файлов')),
+                ('total_downloads', models.BigIntegerField(default=0, verbose_name='Всего скачиваний')),
+                ('active_files', models.BigIntegerField(default=0, verbose_name='Активных файлов')),
+                ('protected_files', models.BigIntegerField(default=0, verbose_name='Защищенных файлов')),
+                ('today_date', models.DateField(blank=True, null=True, verbose_name='Текущий день')),
+                ('today_files', models.BigIntegerField(default=0, verbose_name='Загружено за день')),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя сверка')),
+            ],
+            options={
+                'verbose_name': 'Статистика',
+                'verbose_name_plural': 'Статистика',
+            },
+        ),
+        migrations.RunPython(seed_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from files.search import install_search_index
+
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from files.search import uninstall_search_index
+
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Поисковые индексы по имени и коду файла: GIN pg_trgm в PostgreSQL,
+    теневая таблица FTS5 (trigram) с триггерами в SQLite.
+    """
+
+    dependencies = [
+        ('files', '0006_sitestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
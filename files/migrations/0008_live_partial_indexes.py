@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_session_b23d41_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_session_ce65bc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_code_5ff5cc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_is_dele_648c0c_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_downloa_da04f0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_file_si_ed220e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_is_prot_84ef1e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['session_id', 'created_at'], name='files_file_session_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_permanent', False)), fields=['expires_at'], name='files_file_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['id'], name='files_file_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_protected', False)), fields=['id'], name='files_file_public_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-download_count'], name='files_file_popular_idx'),
+        ),
+    ]
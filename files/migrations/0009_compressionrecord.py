@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_live_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(blank=True, max_length=10, verbose_name='Код файла')),
+                ('original_size', models.BigIntegerField(verbose_name='Исходный размер (байт)')),
+                ('compressed_size', models.BigIntegerField(blank=True, null=True, verbose_name='Размер после сжатия (байт)')),
+                ('page_count', models.PositiveIntegerField(default=0, verbose_name='Страниц')),
+                ('image_share', models.FloatField(default=0, verbose_name='Доля изображений')),
+                ('has_text', models.BooleanField(default=False, verbose_name='Есть текст')),
+                ('filters', models.CharField(blank=True, max_length=255, verbose_name='Фильтры потоков')),
+                ('predicted_ratio', models.FloatField(verbose_name='Прогноз (доля исходного размера)')),
+                ('actual_ratio', models.FloatField(blank=True, null=True, verbose_name='Факт (доля исходного размера)')),
+                ('strategy', models.CharField(blank=True, max_length=20, verbose_name='Стратегия')),
+                ('skipped', models.BooleanField(default=False, verbose_name='Пропущено анализатором')),
+                ('duration', models.FloatField(default=0, verbose_name='Длительность (с)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+            ],
+            options={
+                'verbose_name': 'Сжатие PDF',
+                'verbose_name_plural': 'Сжатие PDF',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -1,12 +1,90 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.conf import settings
 import os
 import qrcode
+from functools import partial
 from io import BytesIO
 from django.core.files.base import ContentFile
 from PIL import Image
 
+from .code_index import code_index
+from .metadata import invalidate_metadata
+from . import stats
+from .caching import bump_tags, session_tag
+from .session_index import session_index
+from .sitemap_journal import mark_dirty as mark_sitemap_dirty
+from .expiry_scheduler import expiry_scheduler
+from .preview_cache import preview_cache
+
+
+FILE_TYPE_ICONS = {
+    'image': 'fas fa-image',
+    'video': 'fas fa-video',
+    'audio': 'fas fa-music',
+    'document': 'fas fa-file-alt',
+    'spreadsheet': 'fas fa-file-excel',
+    'presentation': 'fas fa-file-powerpoint',
+    'archive': 'fas fa-file-archive',
+    'code': 'fas fa-file-code',
+    'executable': 'fas fa-cog',
+    'other': 'fas fa-file'
+}
+
+FILE_TYPE_NAMES = {
+    'image': 'Изображение',
+    'video': 'Видео',
+    'audio': 'Аудио',
+    'document': 'Документ',
+    'spreadsheet': 'Таблица',
+    'presentation': 'Презентация',
+    'archive': 'Архив',
+    'code': 'Код',
+    'executable': 'Программа',
+    'other': 'Файл'
+}
+
+FILE_TYPE_COLORS = {
+    'image': 'text-info',
+    'video': 'text-danger',
+    'audio': 'text-warning',
+    'document': 'text-primary',
+    'spreadsheet': 'text-success',
+    'presentation': 'text-warning',
+    'archive': 'text-secondary',
+    'code': 'text-dark',
+    'executable': 'text-danger',
+    'other': 'text-muted'
+}
+
+
+def get_file_type_by_name(filename):
+    """Определяет тип файла по расширению имени"""
+    _, ext = os.path.splitext(filename.lower())
+    
+    # Категории файлов
+    if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico']:
+        return 'image'
+    elif ext in ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv', '.m4v']:
+        return 'video'
+    elif ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a']:
+        return 'audio'
+    elif ext in ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt']:
+        return 'document'
+    elif ext in ['.xls', '.xlsx', '.csv', '.ods']:
+        return 'spreadsheet'
+    elif ext in ['.ppt', '.pptx', '.odp']:
+        return 'presentation'
+    elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2']:
+        return 'archive'
+    elif ext in ['.py', '.js', '.html', '.css', '.php', '.java', '.cpp', '.c', '.h']:
+        return 'code'
+    elif ext in ['.exe', '.msi', '.dmg', '.pkg', '.deb', '.rpm']:
+        return 'executable'
+    else:
+        return 'other'
+
 
 class File(models.Model):
     """
@@ -53,26 +131,95 @@ class File(models.Model):
         verbose_name = 'Файл'
         verbose_name_plural = 'Файлы'
         ordering = ['-created_at']
-        # Индексы для оптимизации запросов
+        # Индексы для оптимизации запросов. Почти все запросы читают только живые
+        # файлы, поэтому индексы частичные: записи удаленных файлов их не раздувают.
+        # Код ищется по индексу ограничения unique.
         indexes = [
-            models.Index(fields=['session_id', 'created_at']),
-            models.Index(fields=['session_id', 'expires_at']),
-            models.Index(fields=['code']),  # Для быстрого поиска по коду
-            models.Index(fields=['is_deleted', 'expires_at']),  # Для очистки истекших файлов
-            models.Index(fields=['download_count']),  # Для популярных файлов
+            # Списки файлов сессии (главная, недавние, поиск, индекс сессии в Redis)
+            models.Index(fields=['session_id', 'created_at'], condition=Q(is_deleted=False), name='files_file_session_live_idx'),
+            # Очистка истекших файлов
+            models.Index(fields=['expires_at'], condition=Q(is_deleted=False, is_permanent=False), name='files_file_expiry_idx'),
+            # Окончательное удаление записей удаленных файлов (пачками по id)
+            models.Index(fields=['id'], condition=Q(is_deleted=True), name='files_file_deleted_idx'),
+            # Части карты сайта (диапазоны id публичных файлов)
+            models.Index(fields=['id'], condition=Q(is_deleted=False, is_protected=False), name='files_file_public_idx'),
+            models.Index(fields=['-download_count'], condition=Q(is_deleted=False), name='files_file_popular_idx'),  # Для популярных файлов
             models.Index(fields=['created_at']),  # Для сортировки по дате
-            models.Index(fields=['file_size']),  # Для фильтрации по размеру
-            models.Index(fields=['is_protected']),  # Для защищенных файлов
         ]
     
     def __str__(self):
         return f"{self.code} - {self.filename}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_state()
+        return instance
+    
+    def _remember_loaded_state(self):
+        """Запоминает поля, от изменения которых зависят статистика и индексы"""
+        deferred = self.get_deferred_fields()
+        if deferred & {'is_deleted', 'is_protected', 'code'}:
+            self._loaded_state = None
+        else:
+            self._loaded_state = (self.is_deleted, self.is_protected, self.code)
+    
+    def _update_stats(self, is_new, previous):
+        """Переносит изменение флагов файла в глобальную статистику"""
+        if is_new:
+            if not self.is_deleted:
+                stats.record_upload(protected=self.is_protected)
+        elif previous is not None:
+            was_deleted, was_protected, _ = previous
+            if not was_deleted and self.is_deleted:
+                stats.record_removed(active=1, protected=int(was_protected))
+            elif not self.is_deleted and was_protected != self.is_protected:
+                stats.record_protection_change(1 if self.is_protected else -1)
+    
+    def _update_session_index(self, previous):
+        """Переносит файл в индексе сессии (новый код, пометка удаления, новый срок)"""
+        old_code = previous[2] if previous is not None else None
+        if old_code and old_code != self.code:
+            transaction.on_commit(partial(session_index.remove, self.session_id, old_code))
+        if self.is_deleted:
+            transaction.on_commit(partial(session_index.remove, self.session_id, self.code))
+        else:
+            transaction.on_commit(partial(session_index.add, self))
+    
     def save(self, *args, **kwargs):
-        """Переопределяем save для автоматической генерации QR кода"""
+        """
+        Переопределяем save для автоматической генерации QR кода.
+        Индексы в Redis (сессии, расписание истечения, коды) обновляются
+        после фиксации транзакции: при откате в них не остается файлов,
+        которых нет в базе.
+        """
+        is_new = self._state.adding
+        previous = getattr(self, '_loaded_state', None)
         if not self.pk:  # Только при создании нового файла
             self.generate_qr_code()
         super().save(*args, **kwargs)
+        invalidate_metadata(self.code)
+        self._update_stats(is_new, previous)
+        
+        # Полное сохранение (загрузка, редактирование, пометка удаления) меняет
+        # список недавних файлов сессии; обновление счетчика скачиваний — нет
+        if self.session_id and kwargs.get('update_fields') is None:
+            bump_tags(session_tag(self.session_id))
+            self._update_session_index(previous)
+        if kwargs.get('update_fields') is None:
+            mark_sitemap_dirty(self.pk)
+        if kwargs.get('update_fields') is None or {'expires_at', 'is_deleted', 'is_permanent'} & set(kwargs['update_fields']):
+            transaction.on_commit(partial(expiry_scheduler.schedule, self))
+        self._remember_loaded_state()
+        
+        # Регистрируем код в индексе только для нового файла, смены кода или
+        # восстановления; счетчики скачиваний и правки описания его не трогают
+        if is_new or previous is None:
+            transaction.on_commit(partial(code_index.add, self.code))
+        else:
+            was_deleted, _, old_code = previous
+            if old_code != self.code or (was_deleted and not self.is_deleted):
+                transaction.on_commit(partial(code_index.add, self.code))
     
     def generate_qr_code(self):
         """Генерирует QR код со ссылкой на файл"""
@@ -118,76 +265,19 @@ class File(models.Model):
         self.download_count += 1
         self.last_downloaded = timezone.now()
         self.save(update_fields=['download_count', 'last_downloaded'])
+        stats.record_downloads(1)
     
     def get_file_type(self):
         """Определяет тип файла на основе расширения"""
-        import mimetypes
-        
-        # Получаем расширение файла
-        _, ext = os.path.splitext(self.filename.lower())
-        
-        # Определяем MIME тип
-        mime_type, _ = mimetypes.guess_type(self.filename)
-        
-        # Категории файлов
-        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico']:
-            return 'image'
-        elif ext in ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv', '.m4v']:
-            return 'video'
-        elif ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a']:
-            return 'audio'
-        elif ext in ['.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt']:
-            return 'document'
-        elif ext in ['.xls', '.xlsx', '.csv', '.ods']:
-            return 'spreadsheet'
-        elif ext in ['.ppt', '.pptx', '.odp']:
-            return 'presentation'
-        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2']:
-            return 'archive'
-        elif ext in ['.py', '.js', '.html', '.css', '.php', '.java', '.cpp', '.c', '.h']:
-            return 'code'
-        elif ext in ['.exe', '.msi', '.dmg', '.pkg', '.deb', '.rpm']:
-            return 'executable'
-        else:
-            return 'other'
+        return get_file_type_by_name(self.filename)
     
     def get_file_type_icon(self):
         """Возвращает иконку FontAwesome для типа файла"""
-        file_type = self.get_file_type()
-        
-        icon_map = {
-            'image': 'fas fa-image',
-            'video': 'fas fa-video',
-            'audio': 'fas fa-music',
-            'document': 'fas fa-file-alt',
-            'spreadsheet': 'fas fa-file-excel',
-            'presentation': 'fas fa-file-powerpoint',
-            'archive': 'fas fa-file-archive',
-            'code': 'fas fa-file-code',
-            'executable': 'fas fa-cog',
-            'other': 'fas fa-file'
-        }
-        
-        return icon_map.get(file_type, 'fas fa-file')
+        return FILE_TYPE_ICONS.get(self.get_file_type(), 'fas fa-file')
     
     def get_file_type_name(self):
         """Возвращает человекочитаемое название типа файла"""
-        file_type = self.get_file_type()
-        
-        name_map = {
-            'image': 'Изображение',
-            'video': 'Видео',
-            'audio': 'Аудио',
-            'document': 'Документ',
-            'spreadsheet': 'Таблица',
-            'presentation': 'Презентация',
-            'archive': 'Архив',
-            'code': 'Код',
-            'executable': 'Программа',
-            'other': 'Файл'
-        }
-        
-        return name_map.get(file_type, 'Файл')
+        return FILE_TYPE_NAMES.get(self.get_file_type(), 'Файл')
     
     def get_compressed_pdf_size_mb(self):
         """Возвращает размер сжатого PDF в мегабайтах"""
@@ -214,22 +304,7 @@ class File(models.Model):
     
     def get_file_type_color(self):
         """Возвращает цвет для типа файла (Bootstrap классы)"""
-        file_type = self.get_file_type()
-        
-        color_map = {
-            'image': 'text-info',
-            'video': 'text-danger',
-            'audio': 'text-warning',
-            'document': 'text-primary',
-            'spreadsheet': 'text-success',
-            'presentation': 'text-warning',
-            'archive': 'text-secondary',
-            'code': 'text-dark',
-            'executable': 'text-danger',
-            'other': 'text-muted'
-        }
-        
-        return color_map.get(file_type, 'text-muted')
+        return FILE_TYPE_COLORS.get(self.get_file_type(), 'text-muted')
     
     def get_remaining_time(self):
         """Возвращает оставшееся время жизни файла"""
@@ -283,4 +358,72 @@ class File(models.Model):
                 logger.warning(f"Не удалось удалить сжатый PDF {self.compressed_pdf.path}: {e}")
         
         # Полностью удаляем запись из базы данных для освобождения кода
+        previous = getattr(self, '_loaded_state', None) or (self.is_deleted, self.is_protected, self.code)
+        pk = self.pk
         super().delete(*args, **kwargs)
+        mark_sitemap_dirty(pk)
+        transaction.on_commit(partial(expiry_scheduler.cancel, pk))
+        if not previous[0]:
+            stats.record_removed(active=1, protected=int(previous[1]))
+        transaction.on_commit(partial(code_index.discard, self.code))
+        preview_cache.discard(self.code)
+        invalidate_metadata(self.code)
+        if self.session_id:
+            bump_tags(session_tag(self.session_id))
+            transaction.on_commit(partial(session_index.remove, self.session_id, self.code))
+
+
+class SiteStats(models.Model):
+    """
+    Глобальная статистика сервиса в одной строке.
+    Обновляется атомарно при загрузке, скачивании, удалении и истечении
+    файлов (см. files/stats.py), периодически сверяется с таблицей файлов.
+    """
+    
+    total_files = models.BigIntegerField(default=0, verbose_name='Всего загружено файлов')
+    total_downloads = models.BigIntegerField(default=0, verbose_name='Всего скачиваний')
+    active_files = models.BigIntegerField(default=0, verbose_name='Активных файлов')
+    protected_files = models.BigIntegerField(default=0, verbose_name='Защищенных файлов')
+    
+    # Счетчик загрузок за день today_date (сбрасывается первой загрузкой нового дня)
+    today_date = models.DateField(blank=True, null=True, verbose_name='Текущий день')
+    today_files = models.BigIntegerField(default=0, verbose_name='Загружено за день')
+    
+    reconciled_at = models.DateTimeField(blank=True, null=True, verbose_name='Последняя сверка')
+    
+    class Meta:
+        verbose_name = 'Статистика'
+        verbose_name_plural = 'Статистика'
+    
+    def __str__(self):
+        return f"Файлов: {self.total_files}, скачиваний: {self.total_downloads}"
+
+
+class CompressionRecord(models.Model):
+    """
+    Прогноз анализатора PDF и фактический результат сжатия.
+    По этим записям подбираются пороги и коэффициенты в files/pdf_utils.py.
+    Код файла хранится строкой: записи переживают удаление файлов.
+    """
+    
+    code = models.CharField(max_length=10, blank=True, verbose_name='Код файла')
+    original_size = models.BigIntegerField(verbose_name='Исходный размер (байт)')
+    compressed_size = models.BigIntegerField(blank=True, null=True, verbose_name='Размер после сжатия (байт)')
+    page_count = models.PositiveIntegerField(default=0, verbose_name='Страниц')
+    image_share = models.FloatField(default=0, verbose_name='Доля изображений')
+    has_text = models.BooleanField(default=False, verbose_name='Есть текст')
+    filters = models.CharField(max_length=255, blank=True, verbose_name='Фильтры потоков')
+    predicted_ratio = models.FloatField(verbose_name='Прогноз (доля исходного размера)')
+    actual_ratio = models.FloatField(blank=True, null=True, verbose_name='Факт (доля исходного размера)')
+    strategy = models.CharField(max_length=20, blank=True, verbose_name='Стратегия')
+    skipped = models.BooleanField(default=False, verbose_name='Пропущено анализатором')
+    duration = models.FloatField(default=0, verbose_name='Длительность (с)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата')
+    
+    class Meta:
+        verbose_name = 'Сжатие PDF'
+        verbose_name_plural = 'Сжатие PDF'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.code} - {self.strategy or 'пропущено'}"
@@ -0,0 +1,218 @@
+"""
+Курсорная (keyset) пагинация списков файлов.
+
+Paginator Django на каждую страницу делает COUNT(*) и запрос с OFFSET,
+стоимость которого растет с номером страницы. Здесь страница выбирается
+условием по ключу сортировки (created_at, id) относительно последней записи
+предыдущей страницы — такой запрос обслуживается индексом
+(session_id, created_at) и стоит одинаково на любой глубине.
+
+Для поиска перед ключом может стоять целочисленный ранг релевантности
+(аннотация queryset): страницы идут по (ранг, created_at, id).
+
+Курсор в URL непрозрачный: base64 от направления, ключа записи и номера
+страницы. Общее количество оценивается запросом COUNT с ограничением
+(COUNT по подзапросу с LIMIT), поэтому тоже не зависит от размера выборки.
+"""
+
+import base64
+import json
+import math
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Точное число записей считаем не дальше этой границы
+ESTIMATE_CAP = 1000
+
+
+def encode_cursor(direction, obj, number, rank=None):
+    """Кодирует позицию в непрозрачный курсор"""
+    rank_value = getattr(obj, rank) if rank else None
+    raw = json.dumps([direction, rank_value, obj.created_at.isoformat(), obj.pk, number], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Декодирует курсор; для некорректного курсора возвращает None (первая страница)"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, rank_value, created_at, pk, number = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii'))
+        )
+        created_at = parse_datetime(created_at)
+        if direction not in ('next', 'prev') or created_at is None:
+            return None
+        rank_value = None if rank_value is None else int(rank_value)
+        return direction, rank_value, created_at, int(pk), max(int(number), 1)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+class CursorPage:
+    """Страница курсорной пагинации (интерфейс похож на django.core.paginator.Page)"""
+
+    def __init__(self, object_list, number, has_next, has_previous, per_page, total, total_capped, rank=None):
+        self.object_list = object_list
+        self.rank = rank
+        self.number = number
+        self.per_page = per_page
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.total = total
+        self.total_capped = total_capped
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor('next', self.object_list[-1], self.number + 1, self.rank)
+        return ''
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor('prev', self.object_list[0], self.number - 1, self.rank)
+        return ''
+
+    @property
+    def num_pages(self):
+        """Оценка количества страниц"""
+        return max(math.ceil(self.total / self.per_page), self.number)
+
+    @property
+    def total_display(self):
+        """Количество записей для показа: «1000+», если точное значение не считали"""
+        return f'{self.total}+' if self.total_capped else self.total
+
+
+def encode_offset_cursor(offset, number):
+    """Курсор по позиции в упорядоченном списке (индекс сессии в Redis)"""
+    raw = json.dumps(['offset', offset, number], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_offset_cursor(cursor):
+    """Возвращает (смещение, номер страницы) или None"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, offset, number = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if kind != 'offset':
+            return None
+        return max(int(offset), 0), max(int(number), 1)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+class OffsetPage(CursorPage):
+    """Страница списка с точным количеством и курсором по позиции"""
+
+    def __init__(self, object_list, number, offset, per_page, total):
+        super().__init__(
+            object_list, number,
+            has_next=offset + len(object_list) < total,
+            has_previous=offset > 0,
+            per_page=per_page, total=total, total_capped=False,
+        )
+        self.offset = offset
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_offset_cursor(self.offset + self.per_page, self.number + 1)
+        return ''
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_offset_cursor(max(self.offset - self.per_page, 0), max(self.number - 1, 1))
+        return ''
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу (created_at, id), от новых файлов к старым.
+    Если задан rank — имя целочисленной аннотации, — сначала идут записи
+    с большим рангом. queryset не должен быть упорядочен по другим полям:
+    сортировку задает пагинатор.
+    """
+
+    def __init__(self, queryset, per_page, estimate_cap=ESTIMATE_CAP, rank=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.estimate_cap = estimate_cap
+        self.rank = rank
+
+    def _ordering(self, descending=True):
+        fields = ([self.rank] if self.rank else []) + ['created_at', 'id']
+        return [f'-{field}' if descending else field for field in fields]
+
+    def _after(self, position, descending=True):
+        """Условие «строго после позиции» в порядке сортировки"""
+        rank_value, created_at, pk = position
+        op = 'lt' if descending else 'gt'
+        condition = Q(**{f'created_at__{op}': created_at}) | Q(created_at=created_at, **{f'id__{op}': pk})
+        if self.rank:
+            condition = Q(**{f'{self.rank}__{op}': rank_value}) | (Q(**{self.rank: rank_value}) & condition)
+        return condition
+
+    def page(self, cursor=None):
+        position = decode_cursor(cursor)
+        if position is not None and self.rank and position[1] is None:
+            position = None
+
+        if position is None:
+            rows = list(self.queryset.order_by(*self._ordering())[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            number, has_previous = 1, False
+        else:
+            direction, rank_value, created_at, pk, number = position
+            key = (rank_value, created_at, pk)
+            if direction == 'next':
+                rows = list(self.queryset.filter(self._after(key)).order_by(*self._ordering())[:self.per_page + 1])
+                has_next = len(rows) > self.per_page
+                rows = rows[:self.per_page]
+                has_previous = True
+            else:
+                rows = list(self.queryset.filter(
+                    self._after(key, descending=False)
+                ).order_by(*self._ordering(descending=False))[:self.per_page + 1])
+                has_previous = len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+                has_next = True
+                if not has_previous:
+                    number = 1
+
+        total, capped = self.estimate_total(number, rows, has_next)
+        return CursorPage(rows, number, has_next, has_previous, self.per_page, total, capped, self.rank)
+
+    def estimate_total(self, number, rows, has_next):
+        """Возвращает (количество, ограничено_ли) без полного COUNT(*)"""
+        if number == 1 and not has_next:
+            return len(rows), False
+        counted = self.queryset.order_by()[:self.estimate_cap + 1].count()
+        if counted > self.estimate_cap:
+            return self.estimate_cap, True
+        return counted, False
@@ -4,31 +4,398 @@
 
 import os
 import logging
+import multiprocessing
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
 from django.conf import settings
 from django.core.files.base import ContentFile
-from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
-def compress_pdf(input_path, output_path=None, quality=75, max_size_mb=10):
+# Масштаб растеризации страниц (уменьшаем разрешение на 20%)
+RASTER_ZOOM = 0.8
+
+# Меньше стольких страниц на процесс пул не окупается
+MIN_PAGES_PER_WORKER = 8
+
+
+class CompressionTimeout(Exception):
+    """Сжатие не уложилось в бюджет времени на документ"""
+
+
+def page_ranges(page_count, workers, chunks_per_worker=4):
+    """
+    Делит страницы на непрерывные диапазоны [start, stop).
+    Диапазонов больше, чем процессов, чтобы тяжелые страницы не задерживали весь документ.
+    """
+    if page_count <= 0:
+        return []
+    chunks = max(1, min(page_count, workers * chunks_per_worker))
+    size, extra = divmod(page_count, chunks)
+    ranges, start = [], 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def render_page_range(input_path, start, stop, output_path, zoom=RASTER_ZOOM, deadline=None, quality=None):
+    """
+    Растеризует страницы [start, stop) в отдельный PDF output_path.
+    Выполняется в процессе пула: документ открывается заново, а между
+    процессами передаются только пути. quality — качество JPEG страниц
+    (None — без потерь, deflate).
+    """
+    import fitz  # PyMuPDF
+
+    matrix = fitz.Matrix(zoom, zoom)
+    with fitz.open(input_path) as doc, fitz.open() as part:
+        for page_num in range(start, stop):
+            if deadline is not None and time.time() > deadline:
+                raise CompressionTimeout(f"страницы {start}-{stop}")
+            page = doc[page_num]
+            pix = page.get_pixmap(matrix=matrix, alpha=False)
+            new_page = part.new_page(width=page.rect.width, height=page.rect.height)
+            if quality:
+                new_page.insert_image(page.rect, stream=pix.tobytes('jpeg', jpg_quality=quality))
+            else:
+                # Пиксмап вставляется напрямую, без промежуточного кодирования в PNG
+                new_page.insert_image(page.rect, pixmap=pix)
+        part.save(output_path, garbage=4, deflate=True)
+    return start, output_path
+
+
+def _pool_workers(workers, page_count):
+    """Сколько процессов использовать для документа"""
+    if workers is None:
+        workers = getattr(settings, 'PDF_COMPRESS_WORKERS', 0) or os.cpu_count() or 1
+    # Запуск процесса стоит дороже растеризации нескольких страниц
+    workers = max(1, min(workers, page_count // MIN_PAGES_PER_WORKER))
+    # Процессы Celery (prefork) — демоны и не могут запускать дочерние процессы
+    if workers > 1 and multiprocessing.current_process().daemon:
+        workers = 1
+    return workers
+
+
+def render_pages(input_path, page_count, tmpdir, workers=1, deadline=None, quality=None):
+    """
+    Растеризует все страницы в части tmpdir/part-<start>.pdf.
+    Возвращает пути частей в порядке страниц.
+    """
+    ranges = page_ranges(page_count, workers)
+    jobs = [(input_path, start, stop, os.path.join(tmpdir, f'part-{start:06d}.pdf')) for start, stop in ranges]
+
+    if workers == 1:
+        return [render_page_range(*job, deadline=deadline, quality=quality)[1] for job in jobs]
+
+    parts = {}
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futures = [executor.submit(render_page_range, *job, deadline=deadline, quality=quality) for job in jobs]
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for future in done:
+            # Исключение процесса важнее таймаута
+            start, path = future.result()
+            parts[start] = path
+        if pending:
+            raise CompressionTimeout(f"готово {len(done)} из {len(futures)} диапазонов")
+    finally:
+        # При ошибке не ждем: оставшиеся процессы сами прервутся по deadline
+        executor.shutdown(wait=len(parts) == len(jobs), cancel_futures=True)
+    return [parts[start] for start, _ in ranges]
+
+
+def assemble_parts(parts, output_path):
+    """Собирает части в один PDF в переданном порядке"""
+    import fitz  # PyMuPDF
+
+    with fitz.open() as compressed_doc:
+        for part_path in parts:
+            with fitz.open(part_path) as part:
+                compressed_doc.insert_pdf(part)
+        compressed_doc.save(output_path, garbage=4, deflate=True, clean=True)
+
+
+# Сохранение без потерь: garbage=4 удаляет неиспользуемые объекты и объединяет
+# одинаковые объекты и потоки (повторяющиеся изображения, шрифты)
+SAVE_OPTIONS = {
+    'garbage': 4,
+    'clean': True,
+    'deflate': True,
+    'deflate_images': True,
+    'deflate_fonts': True,
+    'use_objstms': 1,
+}
+
+
+def _save_optimized(doc, output_path):
+    """Подмножество шрифтов и сохранение без потерь"""
+    try:
+        doc.subset_fonts()
+    except Exception as e:
+        # Не все шрифты можно урезать (Type3, поврежденные) — это не ошибка сжатия
+        logger.info(f"Не удалось урезать шрифты: {e}")
+    doc.save(output_path, **SAVE_OPTIONS)
+
+
+def optimize_lossless(input_path, output_path, quality, workers=1, deadline=None):
+    """Без потерь: подмножества шрифтов, дедупликация объектов, сборка мусора"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(input_path) as doc:
+        _save_optimized(doc, output_path)
+
+
+def _image_strategy(dpi_target):
+    def optimize_images(input_path, output_path, quality, workers=1, deadline=None):
+        """
+        Перекодирует встроенные изображения в JPEG с качеством quality и
+        уменьшает те, что отображаются с разрешением выше dpi_target.
+        Текст и векторная графика не меняются.
+        """
+        import fitz  # PyMuPDF
+
+        with fitz.open(input_path) as doc:
+            doc.rewrite_images(
+                dpi_threshold=dpi_target + dpi_target // 2,
+                dpi_target=dpi_target,
+                quality=quality,
+            )
+            _save_optimized(doc, output_path)
+    return optimize_images
+
+
+def optimize_raster(input_path, output_path, quality, workers=1, deadline=None):
+    """Растеризация страниц в JPEG (только для сканов: текст не сохраняется)"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(input_path) as doc:
+        page_count = len(doc)
+    with tempfile.TemporaryDirectory(prefix='pdf-compress-') as tmpdir:
+        parts = render_pages(input_path, page_count, tmpdir, workers=workers, deadline=deadline, quality=quality)
+        assemble_parts(parts, output_path)
+
+
+# Стратегии от дешевых и безопасных к дорогим и разрушительным
+STRATEGIES = (
+    ('lossless', optimize_lossless),
+    ('images', _image_strategy(150)),
+    ('images_low', _image_strategy(96)),
+    ('raster', optimize_raster),
+)
+
+
+def has_text(doc, sample_pages=5):
+    """Есть ли в документе извлекаемый текст (проверяются первые страницы)"""
+    for page_num in range(min(sample_pages, len(doc))):
+        if doc[page_num].get_text('text').strip():
+            return True
+    return False
+
+
+def optimize_pdf(input_path, output_path, quality=75, target_size=None, strategies=None,
+                 workers=1, deadline=None):
+    """
+    Пробует стратегии по очереди и останавливается на первой, результат которой
+    не больше target_size. Если ни одна не уложилась, берет самый маленький результат.
+    Результат меньше исходного файла записывается в output_path.
+    
+    Returns:
+        tuple: (стратегия, размер) или (None, исходный_размер), если сжать не удалось
+    """
+    original_size = os.path.getsize(input_path)
+    strategies = strategies or [name for name, _ in STRATEGIES]
+    available = dict(STRATEGIES)
+
+    best_name, best_path, best_size = None, None, original_size
+    # Кандидаты пишутся рядом с результатом, чтобы итоговый os.replace был атомарным
+    workdir = tempfile.mkdtemp(prefix='.optimize-', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        for name in strategies:
+            if deadline is not None and time.time() > deadline:
+                raise CompressionTimeout(f"перед стратегией {name}")
+            candidate = os.path.join(workdir, f'{name}.pdf')
+            started = time.time()
+            try:
+                available[name](input_path, candidate, quality, workers=workers, deadline=deadline)
+            except CompressionTimeout:
+                raise
+            except Exception as e:
+                logger.warning(f"Стратегия {name} не сработала для {input_path}: {e}")
+                continue
+            size = os.path.getsize(candidate)
+            logger.info(
+                f"Стратегия {name}: {size / 1024 / 1024:.2f} МБ "
+                f"({(1 - size / original_size) * 100:.1f}%) за {time.time() - started:.1f} с"
+            )
+            if size < best_size:
+                best_name, best_path, best_size = name, candidate, size
+            if target_size is not None and best_size <= target_size:
+                break
+
+        if best_path is None:
+            return None, original_size
+        os.replace(best_path, output_path)
+        return best_name, best_size
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Доля размера, которую удается сэкономить на потоках разного вида (подбирается
+# по CompressionRecord: прогноз и фактический результат хранятся для каждого файла)
+IMAGE_SAVINGS = {
+    'DCTDecode': 0.45,       # JPEG: уменьшение разрешения и качества
+    'JPXDecode': 0.3,        # JPEG 2000 уже хорошо сжат
+    'JBIG2Decode': 0.0,      # Черно-белые сканы сжаты лучше, чем JPEG
+    'CCITTFaxDecode': 0.0,
+    None: 0.75,              # Без сжатия или Flate: перекодирование в JPEG
+}
+UNCOMPRESSED_SAVING = 0.7    # Потоки без фильтра сжимаются deflate
+OTHER_SAVING = 0.05          # Шрифты и прочее: подмножества и сборка мусора
+
+
+def _stream_filter(doc, xref):
+    """Последний фильтр потока (им закодированы данные) или None"""
+    kind, value = doc.xref_get_key(xref, 'Filter')
+    if kind == 'name':
+        return value.lstrip('/')
+    if kind == 'array':
+        names = value.strip('[]').split()
+        return names[-1].lstrip('/') if names else None
+    return None
+
+
+def _stream_length(doc, xref):
+    kind, value = doc.xref_get_key(xref, 'Length')
+    if kind == 'int':
+        return int(value)
+    # Косвенная длина: читаем сырой поток (без декодирования)
+    return len(doc.xref_stream_raw(xref) or b'')
+
+
+def analyze_pdf(path):
+    """
+    Быстрый анализ PDF без рендеринга: обход таблицы xref, словари потоков.
+    Оценивает достижимый коэффициент (сжатый размер / исходный) и выбирает
+    стратегии сжатия; пустой список стратегий — сжимать не стоит.
+    
+    Returns:
+        dict: pages, size, image_count, image_bytes, image_share, filters,
+        has_text, predicted_ratio, strategies, seconds
+    """
+    import fitz  # PyMuPDF
+
+    started = time.time()
+    size = os.path.getsize(path)
+    image_count = image_bytes = uncompressed_bytes = 0
+    image_savings = 0.0
+    filters = {}
+
+    with fitz.open(path) as doc:
+        pages = len(doc)
+        for xref in range(1, doc.xref_length()):
+            try:
+                if not doc.xref_is_stream(xref):
+                    continue
+                length = _stream_length(doc, xref)
+                name = _stream_filter(doc, xref)
+                is_image = doc.xref_get_key(xref, 'Subtype') == ('name', '/Image')
+            except Exception:
+                # Поврежденный объект не должен ломать анализ
+                continue
+            key = name or 'none'
+            filters[key] = filters.get(key, 0) + 1
+            if is_image:
+                image_count += 1
+                image_bytes += length
+                image_savings += length * IMAGE_SAVINGS.get(name, IMAGE_SAVINGS[None])
+            elif name is None:
+                uncompressed_bytes += length
+        text = has_text(doc)
+
+    other_bytes = max(0, size - image_bytes - uncompressed_bytes)
+    saved = image_savings + uncompressed_bytes * UNCOMPRESSED_SAVING + other_bytes * OTHER_SAVING
+    predicted_ratio = max(0.0, 1 - saved / size) if size else 1.0
+    image_share = image_bytes / size if size else 0.0
+
+    strategies = []
+    if 1 - predicted_ratio >= getattr(settings, 'PDF_MIN_PREDICTED_SAVING', 0.1):
+        strategies.append('lossless')
+        if image_share >= getattr(settings, 'PDF_IMAGE_SHARE_THRESHOLD', 0.3):
+            strategies += ['images', 'images_low']
+            # Растеризация уничтожает текст, поэтому применяется только к сканам
+            if not text:
+                strategies.append('raster')
+
+    return {
+        'pages': pages,
+        'size': size,
+        'image_count': image_count,
+        'image_bytes': image_bytes,
+        'image_share': round(image_share, 4),
+        'filters': filters,
+        'has_text': text,
+        'predicted_ratio': round(predicted_ratio, 4),
+        'strategies': strategies,
+        'seconds': round(time.time() - started, 3),
+    }
+
+
+def record_compression(code, analysis, strategy=None, compressed_size=None, duration=0.0):
+    """Сохраняет прогноз и фактический результат сжатия (для настройки порогов)"""
+    # Модели импортируются лениво: модуль загружается процессами пула без Django
+    from .models import CompressionRecord
+
+    try:
+        CompressionRecord.objects.create(
+            code=code or '',
+            original_size=analysis['size'],
+            compressed_size=compressed_size,
+            page_count=analysis['pages'],
+            image_share=analysis['image_share'],
+            has_text=analysis['has_text'],
+            filters=','.join(f'{name}:{count}' for name, count in sorted(analysis['filters'].items()))[:255],
+            predicted_ratio=analysis['predicted_ratio'],
+            actual_ratio=round(compressed_size / analysis['size'], 4) if compressed_size and analysis['size'] else None,
+            strategy=strategy or '',
+            skipped=not analysis['strategies'],
+            duration=round(duration, 3),
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить статистику сжатия {code}: {e}")
+
+
+def compress_pdf(input_path, output_path=None, quality=75, max_size_mb=10, workers=None, time_budget=None,
+                 code=None):
     """
     Сжимает PDF файл для веб-отображения.
     
+    Сначала документ анализируется без рендеринга (analyze_pdf): если сжатие
+    не окупится, возвращается оригинал. Иначе пробуются выбранные стратегии,
+    сохраняющие текст и векторную графику (сборка мусора и подмножества
+    шрифтов, затем перекодирование встроенных изображений), и только для
+    сканов без текста — растеризация страниц в пуле процессов. Берется первый
+    результат не больше max_size_mb, иначе самый маленький.
+    
     Args:
         input_path (str): Путь к исходному PDF файлу
         output_path (str, optional): Путь для сохранения сжатого файла
-        quality (int): Качество сжатия (1-100, по умолчанию 75)
+        quality (int): Качество JPEG для изображений и страниц (1-100, по умолчанию 75)
         max_size_mb (int): Максимальный размер в МБ (по умолчанию 10)
+        workers (int, optional): Количество процессов растеризации (по умолчанию PDF_COMPRESS_WORKERS или число ядер)
+        time_budget (float, optional): Бюджет времени на документ в секундах
+            (по умолчанию PDF_COMPRESS_TIME_BUDGET); при превышении сжатие прерывается
+        code (str, optional): Код файла; если указан, прогноз и результат
+            сохраняются в CompressionRecord
     
     Returns:
         tuple: (успех, путь_к_файлу, размер_файла) или (False, None, 0)
     """
     try:
-        import fitz  # PyMuPDF
-        
-        # Открываем исходный PDF
-        doc = fitz.open(input_path)
-        
         # Проверяем размер исходного файла
         original_size = os.path.getsize(input_path)
         original_size_mb = original_size / (1024 * 1024)
@@ -40,57 +407,189 @@ def compress_pdf(input_path, output_path=None, quality=75, max_size_mb=10):
             logger.info(f"PDF уже достаточно мал ({original_size_mb:.2f} МБ), сжатие не требуется")
             return True, input_path, original_size
         
-        # Создаем новый документ для сжатой версии
-        compressed_doc = fitz.open()
+        started = time.time()
+        # Анализ без рендеринга: какие стратегии могут окупиться
+        analysis = analyze_pdf(input_path)
+        page_count = analysis['pages']
+        strategies = analysis['strategies']
+        logger.info(
+            f"Анализ PDF: {page_count} страниц, изображения {analysis['image_share']:.0%} размера, "
+            f"прогноз {analysis['predicted_ratio']:.0%} от исходного, стратегии: {strategies or 'нет'}"
+        )
+        if not strategies:
+            logger.info("Сжатие не окупится, используем оригинал")
+            if code:
+                record_compression(code, analysis, duration=time.time() - started)
+            return True, input_path, original_size
         
-        # Копируем страницы с оптимизацией
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            # Получаем изображение страницы с пониженным качеством
-            mat = fitz.Matrix(0.8, 0.8)  # Уменьшаем разрешение на 20%
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            
-            # Конвертируем в изображение
-            img_data = pix.tobytes("png")
-            
-            # Создаем новую страницу с изображением
-            new_page = compressed_doc.new_page(width=page.rect.width, height=page.rect.height)
-            new_page.insert_image(page.rect, pixmap=pix)
+        if time_budget is None:
+            time_budget = getattr(settings, 'PDF_COMPRESS_TIME_BUDGET', 0) or None
+        deadline = started + time_budget if time_budget else None
+        workers = _pool_workers(workers, page_count)
         
         # Если не указан путь вывода, создаем временный файл
         if not output_path:
             output_path = input_path.replace('.pdf', '_compressed.pdf')
         
-        # Сохраняем сжатый PDF
-        compressed_doc.save(output_path, garbage=4, deflate=True, clean=True)
-        compressed_doc.close()
-        doc.close()
-        
-        # Проверяем размер сжатого файла
-        compressed_size = os.path.getsize(output_path)
-        compressed_size_mb = compressed_size / (1024 * 1024)
-        
-        # Вычисляем коэффициент сжатия
-        compression_ratio = (1 - compressed_size / original_size) * 100
+        strategy, compressed_size = optimize_pdf(
+            input_path, output_path,
+            quality=quality,
+            target_size=max_size_mb * 1024 * 1024,
+            strategies=strategies,
+            workers=workers,
+            deadline=deadline,
+        )
         
-        logger.info(f"PDF сжат: {compressed_size_mb:.2f} МБ (сжатие: {compression_ratio:.1f}%)")
+        if code:
+            record_compression(code, analysis, strategy, compressed_size, time.time() - started)
         
         # Если сжатие не дало результата, возвращаем оригинал
-        if compressed_size >= original_size:
+        if strategy is None:
             logger.warning("Сжатие не дало результата, используем оригинал")
-            os.remove(output_path)
             return True, input_path, original_size
         
+        # Вычисляем коэффициент сжатия
+        compression_ratio = (1 - compressed_size / original_size) * 100
+        
+        logger.info(
+            f"PDF сжат стратегией {strategy}: {compressed_size / 1024 / 1024:.2f} МБ "
+            f"(сжатие: {compression_ratio:.1f}%), {page_count} страниц за {time.time() - started:.1f} с"
+        )
+        
         return True, output_path, compressed_size
         
     except ImportError:
         logger.error("PyMuPDF не установлен. Установите: pip install PyMuPDF")
         return False, None, 0
+    except CompressionTimeout as e:
+        logger.warning(f"Сжатие PDF {input_path} прервано по бюджету времени: {e}")
+        return False, None, 0
     except Exception as e:
         logger.error(f"Ошибка при сжатии PDF {input_path}: {str(e)}")
         return False, None, 0
 
+
+def compress_file_pdf(file_obj, quality=75, max_size_mb=10, workers=None, time_budget=None):
+    """
+    Сжимает PDF записи File прямо в место хранения compressed_pdf.
+    
+    Оптимизатор пишет результат во временный каталог рядом с целевым файлом
+    и переносит его атомарным os.replace, поэтому сжатый PDF не читается
+    обратно в память и не копируется через API хранилища. Размер берется
+    из fstat. Если хранилище не дает локальный путь, результат передается
+    ему потоком, без чтения целиком.
+    
+    Returns:
+        int or None: размер сжатого PDF или None, если сжатие не выполнено
+    """
+    field = file_obj.compressed_pdf
+    storage = field.storage
+    # Имя выводится из уникального id записи, а не из имени загруженного файла:
+    # свободное имя, выбранное до сжатия, ничем не занято, и две параллельные
+    # загрузки scan.pdf перезаписали бы сжатую копию друг друга
+    name = field.field.generate_filename(file_obj, f"compressed_{file_obj.code}-{file_obj.pk}.pdf")
+    try:
+        target_path = storage.path(name)
+    except NotImplementedError:
+        target_path = None
+
+    if target_path:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        output_path = target_path
+    else:
+        fd, output_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+
+    try:
+        success, compressed_path, compressed_size = compress_pdf(
+            file_obj.file.path,
+            output_path=output_path,
+            quality=quality,
+            max_size_mb=max_size_mb,
+            workers=workers,
+            time_budget=time_budget,
+            code=file_obj.code,
+        )
+        # Оригинал (сжатие не окупилось) не копируется как «сжатая» версия
+        if not success or compressed_path != output_path:
+            return None
+
+        with open(output_path, 'rb') as f:
+            compressed_size = os.fstat(f.fileno()).st_size
+            if target_path is None:
+                from django.core.files import File as DjangoFile
+                name = storage.save(name, DjangoFile(f, name=os.path.basename(name)))
+    finally:
+        if target_path is None and os.path.exists(output_path):
+            os.remove(output_path)
+
+    previous = field.name
+    file_obj.compressed_pdf.name = name
+    file_obj.compressed_pdf_size = compressed_size
+    file_obj.save(update_fields=['compressed_pdf', 'compressed_pdf_size'])
+    if previous and previous != name:
+        try:
+            storage.delete(previous)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить прежний сжатый PDF {previous}: {e}")
+    return compressed_size
+
+
+def init_backfill_worker():
+    """Инициализация процесса пула compress_pdfs (spawn: Django настраивается заново)"""
+    import django
+
+    django.setup()
+
+
+def compress_file_by_id(file_id, quality=75, max_size_mb=10, workers=None):
+    """
+    Сжимает PDF одной записи File по id — единица работы команды compress_pdfs.
+
+    Выполняется в процессе пула, поэтому принимает и возвращает только
+    простые значения. Результат записывается сразу (autocommit), ошибка
+    одного файла не откатывает остальные.
+
+    Returns:
+        dict: id, code, status ('compressed', 'no_gain', 'small', 'missing',
+        'error'), original_size, compressed_size, error
+    """
+    from .models import File
+
+    result = {
+        'id': file_id,
+        'code': None,
+        'status': 'missing',
+        'original_size': 0,
+        'compressed_size': 0,
+        'error': None,
+    }
+    try:
+        file_obj = File.objects.get(pk=file_id)
+        result['code'] = file_obj.code
+        path = file_obj.file.path
+        if not os.path.exists(path):
+            return result
+        if not should_compress_pdf(path, max_size_mb):
+            result['status'] = 'small'
+            return result
+
+        result['original_size'] = file_obj.file_size
+        compressed_size = compress_file_pdf(file_obj, quality=quality, max_size_mb=max_size_mb, workers=workers)
+        if compressed_size:
+            result['status'] = 'compressed'
+            result['compressed_size'] = compressed_size
+        else:
+            result['status'] = 'no_gain'
+    except File.DoesNotExist:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка при сжатии PDF файла {file_id}: {e}")
+        result['status'] = 'error'
+        result['error'] = str(e)
+    return result
+
+
 def create_pdf_thumbnail(pdf_path, thumbnail_path=None, size=(200, 200)):
     """
     Создает миниатюру для PDF файла.
@@ -117,9 +616,8 @@ def create_pdf_thumbnail(pdf_path, thumbnail_path=None, size=(200, 200)):
         mat = fitz.Matrix(0.5, 0.5)  # Уменьшаем для миниатюры
         pix = page.get_pixmap(matrix=mat, alpha=False)
         
-        # Конвертируем в PIL Image
-        img_data = pix.tobytes("png")
-        img = Image.open(BytesIO(img_data))
+        # Конвертируем в PIL Image напрямую из пикселей, без кодирования в PNG
+        img = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
         
         # Изменяем размер
         img.thumbnail(size, Image.Resampling.LANCZOS)
@@ -143,6 +641,58 @@ def create_pdf_thumbnail(pdf_path, thumbnail_path=None, size=(200, 200)):
         logger.error(f"Ошибка при создании миниатюры PDF {pdf_path}: {str(e)}")
         return False, None
 
+
+def pdf_page_count(pdf_path):
+    """Число страниц PDF или None, если файл не открывается"""
+    try:
+        import fitz  # PyMuPDF
+
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать число страниц PDF {pdf_path}: {e}")
+        return None
+
+
+def render_page_image(pdf_path, page_number, width, quality=80, max_pixels=None):
+    """
+    Рендерит одну страницу PDF в WebP заданной ширины.
+
+    Открывается только нужная страница, поэтому для предпросмотра большого
+    документа не нужно загружать и разбирать его целиком.
+
+    Args:
+        pdf_path (str): Путь к PDF файлу
+        page_number (int): Номер страницы, начиная с 1
+        width (int): Ширина изображения в пикселях
+        quality (int): Качество WebP от 1 до 100
+        max_pixels (int, optional): Ограничение площади (для очень длинных страниц)
+
+    Returns:
+        bytes or None: WebP или None, если такой страницы нет
+    """
+    import fitz  # PyMuPDF
+    from io import BytesIO
+    from PIL import Image
+
+    if max_pixels is None:
+        max_pixels = getattr(settings, 'PDF_PAGE_MAX_PIXELS', 8 * 1000 * 1000)
+
+    with fitz.open(pdf_path) as doc:
+        if not 1 <= page_number <= doc.page_count:
+            return None
+        page = doc[page_number - 1]
+        zoom = width / page.rect.width
+        height = page.rect.height * zoom
+        if width * height > max_pixels:
+            zoom *= (max_pixels / (width * height)) ** 0.5
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+    image = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
 def get_pdf_info(pdf_path):
     """
     Получает информацию о PDF файле.
@@ -0,0 +1,270 @@
+"""
+Кеш PDF-превью офисных документов с ограничением по размеру.
+
+view_file конвертирует документы через LibreOffice в media/previews/<код>.pdf.
+Раньше эти файлы никто не удалял, и каталог рос без ограничений. Теперь:
+
+* превью кладется в кеш атомарно (конвертация во временный каталог и
+  os.replace), поэтому параллельные запросы не отдают недописанный PDF;
+* попадание обновляет atime файла (явно, т. к. диски обычно смонтированы
+  с relatime/noatime), по нему вытесняются давно не открытые превью;
+* когда оценка занятого объема превышает PREVIEW_CACHE_MAX_BYTES, самые
+  старые по atime файлы удаляются до PREVIEW_CACHE_LOW_WATERMARK от бюджета;
+* превью удаляется вместе с файлом (File.delete, движок очистки);
+* счетчики попаданий, промахов, вытеснений и занятых байт хранятся в общем
+  кеше и доступны через stats() (команда preview_cache).
+
+В том же бюджете хранятся изображения отдельных страниц PDF
+(previews/pages/<код>/<страница>-<ширина>.webp), которые рендерит pdf_page.
+
+Оценка объема обновляется при записи и удалении и пересчитывается полным
+обходом каталога при каждом вытеснении (задача evict_preview_cache).
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import acquire_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'previews'
+PAGES_DIR = 'pages'
+CACHED_SUFFIXES = ('.pdf', '.webp')
+COUNTER_KEY = 'preview_cache:{}'
+COUNTERS = ('hits', 'misses', 'evictions', 'evicted_bytes', 'bytes')
+
+# Не чаще, чем раз в столько секунд, обновлять atime одного файла
+TOUCH_INTERVAL = 60
+
+
+def _incr(name, delta=1):
+    key = COUNTER_KEY.format(name)
+    try:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить счетчик кеша превью {name}: {e}")
+        return None
+
+
+class PreviewCache:
+    """Каталог превью с вытеснением давно не открытых файлов"""
+
+    @property
+    def root(self):
+        return os.path.join(str(settings.MEDIA_ROOT), PREVIEW_DIR)
+
+    @property
+    def max_bytes(self):
+        return getattr(settings, 'PREVIEW_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+
+    def path(self, code):
+        return os.path.join(self.root, f'{code}.pdf')
+
+    def page_dir(self, code):
+        return os.path.join(self.root, PAGES_DIR, code)
+
+    def page_path(self, code, page, width):
+        return os.path.join(self.page_dir(code), f'{page}-{width}.webp')
+
+    def get(self, code, source_mtime=None):
+        """
+        Путь к превью, если оно есть и не старше исходника (source_mtime), иначе None.
+        Попадание продлевает жизнь превью в кеше.
+        """
+        return self._lookup(self.path(code), source_mtime)
+
+    def get_page(self, code, page, width, source_mtime=None):
+        """Путь к изображению страницы PDF или None (как get)"""
+        return self._lookup(self.page_path(code, page, width), source_mtime)
+
+    def _lookup(self, path, source_mtime):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            _incr('misses')
+            return None
+        if source_mtime is not None and st.st_mtime < source_mtime:
+            _incr('misses')
+            return None
+
+        now = time.time()
+        if st.st_atime < now - TOUCH_INTERVAL:
+            try:
+                # mtime сохраняем: по нему проверяется свежесть относительно исходника
+                os.utime(path, (now, st.st_mtime))
+            except OSError as e:
+                logger.warning(f"Не удалось обновить atime превью {path}: {e}")
+        _incr('hits')
+        return path
+
+    def tempdir(self):
+        """Временный каталог для конвертации внутри кеша (та же ФС — os.replace атомарен)"""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(prefix='.convert-', dir=self.root)
+
+    def store(self, code, produced_path):
+        """Кладет готовый PDF в кеш под кодом файла; возвращает путь в кеше"""
+        return self._put(self.path(code), produced_path)
+
+    def store_page(self, code, page, width, data):
+        """Кладет изображение страницы (байты) в кеш; возвращает путь в кеше"""
+        directory = self.page_dir(code)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл рядом и атомарно переименовываем
+        fd, produced_path = tempfile.mkstemp(prefix='.page-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return self._put(self.page_path(code, page, width), produced_path)
+        except BaseException:
+            if os.path.exists(produced_path):
+                os.unlink(produced_path)
+            raise
+
+    def _put(self, path, produced_path):
+        try:
+            previous = os.stat(path).st_size
+        except FileNotFoundError:
+            previous = 0
+        size = os.stat(produced_path).st_size
+        os.replace(produced_path, path)
+
+        held = _incr('bytes', size - previous)
+        if held is not None and held > self.max_bytes:
+            self.evict()
+        return path
+
+    def discard(self, *codes):
+        """Удаляет превью и изображения страниц файлов (файл удален или истек)"""
+        freed = 0
+        for code in codes:
+            paths = [self.path(code)]
+            page_dir = self.page_dir(code)
+            try:
+                with os.scandir(page_dir) as iterator:
+                    paths.extend(entry.path for entry in iterator)
+            except FileNotFoundError:
+                pass
+            for path in paths:
+                try:
+                    size = os.stat(path).st_size
+                    os.unlink(path)
+                    freed += size
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить превью {path}: {e}")
+            try:
+                os.rmdir(page_dir)
+            except OSError:
+                pass
+        if freed:
+            _incr('bytes', -freed)
+        return freed
+
+    def scan(self):
+        """Файлы превью и страниц: список (atime, размер, путь)"""
+        entries = []
+        self._scan_dir(self.root, entries)
+        try:
+            iterator = os.scandir(os.path.join(self.root, PAGES_DIR))
+        except FileNotFoundError:
+            return entries
+        with iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    self._scan_dir(entry.path, entries)
+        return entries
+
+    def _scan_dir(self, directory, entries):
+        try:
+            iterator = os.scandir(directory)
+        except FileNotFoundError:
+            return
+        with iterator:
+            for entry in iterator:
+                if not entry.is_file(follow_symlinks=False) or not entry.name.endswith(CACHED_SUFFIXES):
+                    continue
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_atime, st.st_size, entry.path))
+
+    def cleanup_tempdirs(self, older_than=3600):
+        """Удаляет временные каталоги оборванных конвертаций"""
+        cutoff = time.time() - older_than
+        try:
+            iterator = os.scandir(self.root)
+        except FileNotFoundError:
+            return
+        with iterator:
+            for entry in iterator:
+                if entry.name.startswith('.convert-') and entry.is_dir(follow_symlinks=False):
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+
+    def evict(self, max_bytes=None):
+        """
+        Пересчитывает занятый объем и, если он больше бюджета, удаляет самые
+        давно открытые превью до нижней отметки. Возвращает (удалено файлов, байт).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if not acquire_lock('preview_cache_evict', 300):
+            return 0, 0
+        try:
+            entries = self.scan()
+            held = sum(size for _, size, _ in entries)
+            evicted, freed = 0, 0
+            if held > max_bytes:
+                target = max_bytes * getattr(settings, 'PREVIEW_CACHE_LOW_WATERMARK', 0.9)
+                entries.sort()
+                for _, size, path in entries:
+                    if held <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning(f"Не удалось вытеснить превью {path}: {e}")
+                        continue
+                    held -= size
+                    evicted += 1
+                    freed += size
+                    if path.endswith('.webp'):
+                        # Каталог страниц файла удаляется, когда опустеет
+                        try:
+                            os.rmdir(os.path.dirname(path))
+                        except OSError:
+                            pass
+            cache.set(COUNTER_KEY.format('bytes'), held, None)
+            if evicted:
+                _incr('evictions', evicted)
+                _incr('evicted_bytes', freed)
+                logger.info(f"Кеш превью: вытеснено {evicted} файлов ({freed} байт), занято {held} байт")
+            return evicted, freed
+        finally:
+            release_lock('preview_cache_evict')
+
+    def stats(self):
+        """Счетчики кеша превью"""
+        values = cache.get_many([COUNTER_KEY.format(name) for name in COUNTERS])
+        result = {name: values.get(COUNTER_KEY.format(name), 0) for name in COUNTERS}
+        reads = result['hits'] + result['misses']
+        result['hit_rate'] = result['hits'] / reads if reads else 0.0
+        result['max_bytes'] = self.max_bytes
+        return result
+
+
+preview_cache = PreviewCache()
@@ -0,0 +1,284 @@
+"""
+Сверка файлов на диске с записями в БД.
+
+Раньше cleanup_deleted_files дважды обходил все записи File и для каждой
+вызывал os.path.exists (миллионы stat и создание моделей), а файлы на диске
+без записи в БД не находил вовсе. Теперь:
+
+* диск читается одним обходом os.scandir по uploads/, qr_codes/,
+  compressed_pdfs/ и previews/;
+* пути из БД читаются потоком values_list(...).iterator();
+* оба потока сортируются внешней сортировкой (куски в памяти, слияние
+  временных файлов через heapq.merge) и сравниваются слиянием, поэтому
+  память ограничена размером куска, а не количеством файлов.
+
+Результат — две разности: файлы на диске без записи (сироты) и записи,
+у которых нет файла на диске. Действия выполняются пачками движком очистки
+(политика orphans, files/retention.py); в режиме dry_run только считаются.
+Сироты удаляются только по явному запросу (delete_orphans).
+"""
+
+import heapq
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from .models import File
+from .retention import PURGE_FIELDS, RetentionEngine, RetentionPolicy, SweepMetrics, purge_rows
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIRS = ('uploads', 'qr_codes', 'compressed_pdfs', 'previews')
+# Изображения страниц PDF живут только в кеше превью (вытеснение, удаление с файлом)
+SKIP_DIRS = ('previews/pages',)
+
+# Виды путей из БД; отсутствие на диске оригинала или QR-кода означает битую запись
+KIND_FILE = 'file'
+KIND_QR = 'qr'
+KIND_COMPRESSED = 'compressed'
+KIND_PREVIEW = 'preview'
+REQUIRED_KINDS = (KIND_FILE, KIND_QR)
+
+# Не больше стольких строк сортируется в памяти
+SORT_CHUNK = 200000
+
+# Сколько примеров каждой разности сохранить в отчете
+SAMPLE_SIZE = 20
+
+
+def _valid(path):
+    # Табуляция и перевод строки служат разделителями во временных файлах сортировки
+    return '\t' not in path and '\n' not in path
+
+
+def scan_media(root, dirs=MEDIA_DIRS):
+    """Относительные пути файлов в каталогах media (один проход os.scandir)"""
+    for top in dirs:
+        stack = [os.path.join(root, top)]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.relpath(entry.path, root).replace(os.sep, '/') not in SKIP_DIRS:
+                            stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    if _valid(path):
+                        yield path
+                    else:
+                        logger.warning(f"Пропущен файл с недопустимым именем: {entry.path!r}")
+
+
+def db_paths():
+    """Строки 'путь\\tвид\\tid\\tпостоянный' для всех файлов, на которые ссылается БД"""
+    rows = File.objects.values_list('id', 'code', 'file', 'qr_code', 'compressed_pdf', 'is_permanent')
+    for pk, code, file_name, qr_name, compressed_name, is_permanent in rows.iterator(chunk_size=5000):
+        permanent = int(is_permanent)
+        for kind, path in (
+            (KIND_FILE, file_name),
+            (KIND_QR, qr_name),
+            (KIND_COMPRESSED, compressed_name),
+            (KIND_PREVIEW, f'previews/{code}.pdf'),
+        ):
+            if path and _valid(path):
+                yield f'{path}\t{kind}\t{pk}\t{permanent}'
+
+
+def _is_recent(path, cutoff):
+    # Запись о новом файле может быть еще не сохранена — такой файл не сирота
+    try:
+        return os.stat(path).st_mtime > cutoff
+    except FileNotFoundError:
+        return True
+
+
+def _spill(lines):
+    f = tempfile.TemporaryFile('w+', encoding='utf-8')
+    for line in lines:
+        f.write(line)
+        f.write('\n')
+    f.seek(0)
+    return f
+
+
+def _read(f):
+    for line in f:
+        yield line[:-1]
+
+
+def external_sort(lines, chunk_size=SORT_CHUNK):
+    """
+    Сортирует поток строк с ограниченной памятью: куски по chunk_size сортируются
+    в памяти и сбрасываются во временные файлы, затем сливаются heapq.merge.
+    """
+    chunk, spilled = [], []
+    try:
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                chunk.sort()
+                spilled.append(_spill(chunk))
+                chunk = []
+        chunk.sort()
+        if not spilled:
+            yield from chunk
+            return
+        yield from heapq.merge(*[_read(f) for f in spilled], iter(chunk))
+    finally:
+        for f in spilled:
+            f.close()
+
+
+def diff(disk_sorted, db_sorted):
+    """
+    Слияние двух отсортированных потоков.
+    Выдает ('disk', путь) для файлов без записи и ('db', путь, вид, id, постоянный)
+    для путей из БД, которых нет на диске.
+    """
+    # Табуляция меньше любого печатного символа, поэтому порядок строк
+    # 'путь\\t...' совпадает с порядком путей
+    disk = next(disk_sorted, None)
+    matched = None
+    for line in db_sorted:
+        path, kind, pk, permanent = line.split('\t')
+        while disk is not None and disk < path:
+            yield ('disk', disk)
+            disk = next(disk_sorted, None)
+        if disk == path:
+            matched = path
+            disk = next(disk_sorted, None)
+        if path == matched:
+            # Один путь может встретиться в БД несколько раз
+            continue
+        yield ('db', path, kind, int(pk), permanent == '1')
+    while disk is not None:
+        yield ('disk', disk)
+        disk = next(disk_sorted, None)
+
+
+class ReconcileReport(SweepMetrics):
+    """Счетчики и примеры расхождений"""
+
+    def __init__(self):
+        super().__init__()
+        self.disk_orphans = 0
+        self.missing_rows = 0
+        self.missing_compressed = 0
+        self.samples = {'disk': [], 'db': []}
+
+    def sample(self, key, value):
+        if len(self.samples[key]) < SAMPLE_SIZE:
+            self.samples[key].append(value)
+
+    def as_dict(self):
+        result = super().as_dict()
+        result.update(
+            disk_orphans=self.disk_orphans,
+            missing_rows=self.missing_rows,
+            missing_compressed=self.missing_compressed,
+            samples=self.samples,
+        )
+        return result
+
+
+class OrphanSweepPolicy(RetentionPolicy):
+    """
+    Политика orphans движка очистки: удаляет записи без оригинала или
+    QR-кода и, если delete_orphans, файлы-сироты. Пачка — список
+    расхождений из diff().
+    """
+
+    name = 'orphans'
+    metrics_class = ReconcileReport
+
+    def __init__(self, delete_orphans=False, delete_missing=True, include_permanent=False,
+                 grace_seconds=None, root=None):
+        self.delete_orphans = delete_orphans
+        self.delete_missing = delete_missing
+        self.include_permanent = include_permanent
+        self.grace_seconds = (
+            getattr(settings, 'RECONCILE_GRACE_SECONDS', 3600) if grace_seconds is None else grace_seconds
+        )
+        self.root = str(root or settings.MEDIA_ROOT)
+        self.seen = set()
+
+    def batches(self, engine, report):
+        cutoff = time.time() - self.grace_seconds
+        disk_sorted = external_sort(scan_media(self.root))
+        db_sorted = external_sort(db_paths())
+
+        batch = []
+        for item in diff(disk_sorted, db_sorted):
+            if item[0] == 'disk':
+                if _is_recent(os.path.join(self.root, item[1]), cutoff):
+                    continue
+                report.disk_orphans += 1
+                report.sample('disk', item[1])
+                if self.delete_orphans:
+                    batch.append(item)
+            else:
+                _, path, kind, pk, permanent = item
+                if kind == KIND_COMPRESSED:
+                    report.missing_compressed += 1
+                    continue
+                if kind not in REQUIRED_KINDS or (permanent and not self.include_permanent) or pk in self.seen:
+                    continue
+                # У записи может не быть и оригинала, и QR-кода — считаем ее один раз
+                self.seen.add(pk)
+                report.missing_rows += 1
+                report.sample('db', path)
+                if self.delete_missing:
+                    batch.append(item)
+            if len(batch) >= engine.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def apply(self, batch, engine, report):
+        orphans = [os.path.join(self.root, item[1]) for item in batch if item[0] == 'disk']
+        if orphans:
+            engine.unlink(orphans, report)
+
+        missing = {item[3]: item[1] for item in batch if item[0] == 'db'}
+        if missing:
+            rows = File.objects.filter(id__in=missing).values_list(*PURGE_FIELDS)
+            # Файл мог появиться после обхода диска (загрузка в период grace)
+            rows = [row for row in rows if not os.path.exists(os.path.join(self.root, missing[row[0]]))]
+            if rows:
+                purge_rows(rows, engine, report)
+
+    def describe(self, result):
+        return (
+            f"сирот на диске {result['disk_orphans']}, записей без файла {result['missing_rows']}, "
+            f"удалено файлов {result['unlinked']}, удалено записей {result['purged']} "
+            f"за {result['elapsed']} с, ожидание бюджета {result['throttled']} с"
+        )
+
+
+def reconcile_media(dry_run=True, delete_orphans=False, delete_missing=True, include_permanent=False,
+                    batch_size=None, workers=None, grace_seconds=None, root=None, budget=None):
+    """
+    Сверяет media с БД и (если не dry_run) удаляет записи без оригинала
+    или QR-кода, а с delete_orphans — и файлы-сироты. Сироты считаются в
+    отчете всегда. Возвращает словарь с отчетом.
+    """
+    policy = OrphanSweepPolicy(
+        delete_orphans=delete_orphans,
+        delete_missing=delete_missing,
+        include_permanent=include_permanent,
+        grace_seconds=grace_seconds,
+        root=root,
+    )
+    engine = RetentionEngine(batch_size=batch_size, workers=workers, budget=budget, dry_run=dry_run)
+    return engine.run(policy)
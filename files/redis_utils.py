@@ -0,0 +1,36 @@
+"""
+Доступ к Redis напрямую (множества, сортированные множества, pub/sub).
+В разработке кеш живет в памяти процесса, поэтому все вызывающие должны
+уметь работать без Redis и откатываться на БД.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Префикс для ключей, которые пишутся в Redis в обход Django cache
+KEY_PREFIX = 'filehost:'
+
+
+def get_redis(alias='default'):
+    """
+    Возвращает клиент Redis из django_redis или None, если кеш не на Redis.
+    """
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+
+    try:
+        return get_redis_connection(alias)
+    except NotImplementedError:
+        # Кеш настроен не на django_redis (LocMem в разработке)
+        return None
+    except Exception as e:
+        logger.warning(f"Redis недоступен: {e}")
+        return None
+
+
+def redis_key(name):
+    """Полное имя ключа в Redis"""
+    return f'{KEY_PREFIX}{name}'
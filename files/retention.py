@@ -0,0 +1,514 @@
+"""
+Движок очистки файлов.
+
+Раньше логика истечения и удаления была скопирована в cron.py, tasks.py,
+команды управления, auto_cleanup.py и cleanup_deleted_files.py, и каждая
+копия вела себя по-своему: одни помечали записи удаленными, другие удаляли
+их из БД, третьи забывали сжатый PDF. Теперь все точки входа вызывают один
+движок (RetentionEngine) с одной из политик:
+
+* expire — истекшие файлы: записи помечаются удаленными, файлы удаляются
+  с диска (часовой проход с контрольной точкой);
+* expire_due — то же по расписанию в Redis, без сканирования таблицы
+  (files/expiry_scheduler.py);
+* purge — окончательное удаление записей, помеченных удаленными;
+* orphans — сверка media с БД (files/reconcile.py).
+
+Политика выбирает пачки строк (keyset по id, values_list без моделей) и
+обрабатывает их; движок считает метрики, удаляет файлы в ограниченном пуле
+потоков и соблюдает бюджет ввода-вывода (операций/с и МБ/с), чтобы очистка
+не отнимала диск у скачиваний в часы пик. Метрики каждого запуска пишутся
+в лог и сохраняются в кеш (retention_last_run_<политика>) для мониторинга.
+
+Пакетные UPDATE и DELETE не запускают хуки модели, поэтому статистика, кеш
+метаданных, индексы сессий, журнал sitemap и расписание истечения
+обновляются здесь же пачкой.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import stats
+from .code_index import code_index
+from .caching import TAG_SITEMAP, TAG_STATS, bump_tags, session_tag
+from .expiry_scheduler import expiry_scheduler
+from .metadata import invalidate_metadata
+from .models import File
+from .preview_cache import preview_cache
+from .session_index import session_index
+from .sitemap_journal import mark_dirty as mark_sitemap_dirty
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = 'retention_checkpoint_expire'
+METRICS_KEY_PREFIX = 'retention_last_run_'
+METRICS_KEY = METRICS_KEY_PREFIX + 'expire'
+
+# Колонки, нужные для очистки: модели не создаются
+SWEEP_FIELDS = ('id', 'code', 'session_id', 'is_protected', 'file', 'qr_code', 'compressed_pdf')
+PURGE_FIELDS = SWEEP_FIELDS + ('is_deleted',)
+
+
+def artifact_paths(code, file_name, qr_name, compressed_name):
+    """
+    Абсолютные пути файлов записи. Превью и изображения страниц удаляет
+    preview_cache.discard: так счетчик размера кеша превью не расходится с диском.
+    """
+    root = str(settings.MEDIA_ROOT)
+    return [os.path.join(root, name) for name in (file_name, qr_name, compressed_name) if name]
+
+
+def _unlink(path):
+    """Удаляет файл; возвращает (удален, байт, ошибка)"""
+    try:
+        size = os.stat(path).st_size
+        os.unlink(path)
+        return True, size, None
+    except FileNotFoundError:
+        return False, 0, None
+    except OSError as e:
+        return False, 0, f'{path}: {e}'
+
+
+def unlink_paths(paths, executor):
+    """Удаляет файлы в пуле потоков; возвращает (удалено, байт, [ошибки])"""
+    removed, freed, errors = 0, 0, []
+    for ok, size, error in executor.map(_unlink, paths):
+        removed += ok
+        freed += size
+        if error:
+            errors.append(error)
+    return removed, freed, errors
+
+
+class IOBudget:
+    """
+    Ограничение скорости очистки: два ведра токенов (операции и байты)
+    емкостью в одну секунду. Пачка сначала выполняется, потом оплачивается:
+    если токенов не хватило, движок спит, пока долг не погасится.
+    0 или None — без ограничения.
+    """
+
+    def __init__(self, ops_per_second=None, mb_per_second=None):
+        self.ops_rate = float(ops_per_second or 0)
+        self.bytes_rate = float(mb_per_second or 0) * 1024 * 1024
+        self.ops = self.ops_rate
+        self.bytes = self.bytes_rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, ops_per_second=None, mb_per_second=None):
+        """Бюджет из настроек; явно переданные значения имеют приоритет"""
+        if ops_per_second is None:
+            ops_per_second = getattr(settings, 'RETENTION_MAX_OPS_PER_SECOND', 0)
+        if mb_per_second is None:
+            mb_per_second = getattr(settings, 'RETENTION_MAX_MB_PER_SECOND', 0)
+        return cls(ops_per_second, mb_per_second)
+
+    @property
+    def unlimited(self):
+        return not self.ops_rate and not self.bytes_rate
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        if self.ops_rate:
+            self.ops = min(self.ops_rate, self.ops + elapsed * self.ops_rate)
+        if self.bytes_rate:
+            self.bytes = min(self.bytes_rate, self.bytes + elapsed * self.bytes_rate)
+
+    def spend(self, ops=0, nbytes=0, sleep=time.sleep):
+        """Списывает затраты пачки; возвращает, сколько секунд пришлось ждать"""
+        if self.unlimited:
+            return 0.0
+        with self.lock:
+            self._refill(time.monotonic())
+            wait = 0.0
+            if self.ops_rate:
+                self.ops -= ops
+                wait = max(wait, -self.ops / self.ops_rate)
+            if self.bytes_rate:
+                self.bytes -= nbytes
+                wait = max(wait, -self.bytes / self.bytes_rate)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class SweepMetrics:
+    """Счетчики одного прохода очистки"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = 0
+        self.rows = 0
+        self.marked = 0
+        self.purged = 0
+        self.unlinked = 0
+        self.bytes_freed = 0
+        self.errors = 0
+        self.throttled = 0.0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'marked': self.marked,
+            'purged': self.purged,
+            'unlinked': self.unlinked,
+            'bytes_freed': self.bytes_freed,
+            'errors': self.errors,
+            'throttled': round(self.throttled, 3),
+            'elapsed': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else 0.0,
+            'mb_per_second': round(self.bytes_freed / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def _load_checkpoint():
+    checkpoint = cache.get(CHECKPOINT_KEY)
+    if not checkpoint:
+        return None
+    return checkpoint['last_id'], datetime.fromtimestamp(checkpoint['cutoff'], dt_timezone.utc)
+
+
+def _save_checkpoint(last_id, cutoff):
+    cache.set(CHECKPOINT_KEY, {'last_id': last_id, 'cutoff': cutoff.timestamp()}, 24 * 3600)
+
+
+def keyset_batches(queryset, batch_size, after_id=0):
+    """Пачки строк values_list (первая колонка — id) по возрастанию id"""
+    queryset = queryset.order_by('id')
+    last_id = after_id
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def expired_batches(cutoff, batch_size, after_id=0):
+    """Пачки строк истекших файлов по возрастанию id (индекс по первичному ключу)"""
+    queryset = File.objects.filter(
+        is_deleted=False,
+        is_permanent=False,
+        expires_at__lt=cutoff,
+    ).values_list(*SWEEP_FIELDS)
+    return keyset_batches(queryset, batch_size, after_id)
+
+
+def _unlink_rows(rows, engine, metrics):
+    """Удаляет с диска все файлы пачки строк SWEEP_FIELDS"""
+    paths = [
+        path for row in rows
+        for path in artifact_paths(row[1], row[4], row[5], row[6])
+    ]
+    engine.unlink(paths, metrics)
+
+
+def _after_mark(rows, marked):
+    """То, что при save() сделали бы хуки модели, — одной пачкой"""
+    protected = sum(1 for row in rows if row[3])
+    stats.record_removed(active=marked, protected=min(protected, marked))
+    invalidate_metadata(*(row[1] for row in rows))
+    preview_cache.discard(*(row[1] for row in rows))
+    session_index.remove_many((row[2], row[1]) for row in rows)
+    bump_tags(*(session_tag(row[2]) for row in rows if row[2]))
+    mark_sitemap_dirty(*(row[0] for row in rows if not row[3]))
+    expiry_scheduler.cancel(*(row[0] for row in rows))
+
+
+def _after_purge(rows):
+    """То, что сделали бы хуки File.delete(), — одной пачкой"""
+    active = [row for row in rows if not row[7]]
+    stats.record_removed(active=len(active), protected=sum(1 for row in active if row[3]))
+    for row in rows:
+        code_index.discard(row[1])
+    invalidate_metadata(*(row[1] for row in rows))
+    preview_cache.discard(*(row[1] for row in rows))
+    session_index.remove_many((row[2], row[1]) for row in rows)
+    bump_tags(*(session_tag(row[2]) for row in rows if row[2]))
+    mark_sitemap_dirty(*(row[0] for row in rows))
+    expiry_scheduler.cancel(*(row[0] for row in rows))
+
+
+class RetentionPolicy:
+    """
+    Политика очистки: batches() выбирает пачки, apply() обрабатывает пачку,
+    finish() вызывается после последней пачки (не в режиме dry_run).
+    """
+
+    name = None
+    metrics_class = SweepMetrics
+    # Писать в лог и кеш метрик только запуски, которые что-то нашли
+    quiet = False
+
+    def batches(self, engine, metrics):
+        raise NotImplementedError
+
+    def apply(self, rows, engine, metrics):
+        raise NotImplementedError
+
+    def finish(self, engine, metrics):
+        pass
+
+    def describe(self, result):
+        return (
+            f"{result['rows']} строк за {result['elapsed']} с ({result['rows_per_second']} строк/с), "
+            f"помечено {result['marked']}, удалено записей {result['purged']}, "
+            f"удалено файлов {result['unlinked']}, освобождено {result['bytes_freed']} байт, "
+            f"ожидание бюджета {result['throttled']} с, ошибок {result['errors']}"
+        )
+
+
+class ExpirePolicy(RetentionPolicy):
+    """
+    Помечает удаленными истекшие файлы и удаляет их с диска.
+    limit — максимум строк за запуск (остаток доберет следующий запуск с контрольной точки).
+    """
+
+    name = 'expire'
+
+    def __init__(self, cutoff=None, limit=None):
+        self.cutoff = cutoff
+        self.limit = limit
+        self.public_removed = False
+        self.completed = False
+
+    def batches(self, engine, metrics):
+        checkpoint = None if engine.dry_run or self.cutoff else _load_checkpoint()
+        if checkpoint:
+            after_id, self.cutoff = checkpoint
+            logger.info(f"Продолжаем очистку с id {after_id}")
+        else:
+            after_id, self.cutoff = 0, self.cutoff or timezone.now()
+
+        for rows in expired_batches(self.cutoff, engine.batch_size, after_id):
+            if self.limit is not None and metrics.rows >= self.limit:
+                return
+            yield rows
+        self.completed = True
+
+    def apply(self, rows, engine, metrics):
+        # Сначала диск, потом БД: при сбое между ними пачка будет выбрана
+        # снова, а повторное удаление уже удаленных файлов безвредно
+        self.public_removed = expire_rows(rows, engine, metrics) or self.public_removed
+        _save_checkpoint(rows[-1][0], self.cutoff)
+
+    def finish(self, engine, metrics):
+        if self.completed:
+            cache.delete(CHECKPOINT_KEY)
+        if metrics.marked:
+            bump_tags(TAG_STATS, *([TAG_SITEMAP] if self.public_removed else []))
+
+
+class ExpireDuePolicy(RetentionPolicy):
+    """
+    Удаляет файлы, срок которых наступил, по расписанию в Redis
+    (files/expiry_scheduler.py): небольшими пачками, без сканирования таблицы.
+    """
+
+    name = 'expire_due'
+    quiet = True
+
+    def __init__(self, max_batches=10):
+        self.max_batches = max_batches
+        self.public_removed = False
+
+    def batches(self, engine, metrics):
+        now = timezone.now()
+        for _ in range(self.max_batches):
+            ids = expiry_scheduler.pop_due(engine.batch_size, now.timestamp())
+            if not ids:
+                return
+            rows = File.objects.filter(
+                id__in=ids, is_deleted=False, is_permanent=False
+            ).values_list(*SWEEP_FIELDS, 'expires_at')
+            due, extended = [], []
+            for row in rows:
+                (due if row[7] <= now else extended).append(row)
+
+            # Срок продлили после постановки в расписание — переносим
+            expiry_scheduler.schedule_many((row[0], row[7]) for row in extended)
+            if due:
+                yield due
+
+    def apply(self, rows, engine, metrics):
+        self.public_removed = expire_rows(rows, engine, metrics) or self.public_removed
+
+    def finish(self, engine, metrics):
+        if metrics.marked:
+            bump_tags(TAG_STATS, *([TAG_SITEMAP] if self.public_removed else []))
+
+
+class PurgeDeletedPolicy(RetentionPolicy):
+    """
+    Окончательно удаляет записи, помеченные удаленными (частичный индекс
+    files_file_deleted_idx). expired_before — удалять только записи, срок
+    которых истек раньше этого момента.
+    """
+
+    name = 'purge'
+
+    def __init__(self, expired_before=None):
+        self.expired_before = expired_before
+
+    def batches(self, engine, metrics):
+        queryset = File.objects.filter(is_deleted=True, is_permanent=False)
+        if self.expired_before is not None:
+            queryset = queryset.filter(expires_at__lt=self.expired_before)
+        return keyset_batches(queryset.values_list(*PURGE_FIELDS), engine.batch_size)
+
+    def apply(self, rows, engine, metrics):
+        purge_rows(rows, engine, metrics)
+
+
+POLICIES = {
+    'expire': ExpirePolicy,
+    'expire_due': ExpireDuePolicy,
+    'purge': PurgeDeletedPolicy,
+    'orphans': 'files.reconcile.OrphanSweepPolicy',
+}
+
+
+def get_policy(name, **options):
+    """Создает политику по имени из POLICIES"""
+    try:
+        policy_class = POLICIES[name]
+    except KeyError:
+        raise ValueError(f"Неизвестная политика очистки: {name}")
+    if isinstance(policy_class, str):
+        # Сверка с диском импортирует этот модуль, поэтому подключается лениво
+        policy_class = import_string(policy_class)
+    return policy_class(**options)
+
+
+class RetentionEngine:
+    """Выполняет политику очистки: пачки, пул потоков, бюджет ввода-вывода, метрики"""
+
+    def __init__(self, batch_size=None, workers=None, budget=None, dry_run=False):
+        self.batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+        self.workers = workers or getattr(settings, 'RETENTION_UNLINK_WORKERS', 8)
+        self.budget = budget if budget is not None else IOBudget.from_settings()
+        self.dry_run = dry_run
+        self.executor = None
+
+    def unlink(self, paths, metrics):
+        """Удаляет файлы с диска в пуле потоков и учитывает их в метриках"""
+        removed, freed, errors = unlink_paths(paths, self.executor)
+        metrics.unlinked += removed
+        metrics.bytes_freed += freed
+        metrics.errors += len(errors)
+        for error in errors[:10]:
+            logger.warning(f"Не удалось удалить файл: {error}")
+
+    def run(self, policy):
+        """Выполняет политику и возвращает словарь метрик"""
+        metrics = policy.metrics_class()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='retention') as executor:
+            self.executor = executor
+            try:
+                for rows in policy.batches(self, metrics):
+                    metrics.batches += 1
+                    metrics.rows += len(rows)
+                    if self.dry_run:
+                        continue
+                    ops, freed = metrics.unlinked, metrics.bytes_freed
+                    policy.apply(rows, self, metrics)
+                    # Операции: удаленные файлы плюс запрос к БД на пачку
+                    metrics.throttled += self.budget.spend(
+                        metrics.unlinked - ops + 1, metrics.bytes_freed - freed
+                    )
+                if not self.dry_run:
+                    policy.finish(self, metrics)
+            finally:
+                self.executor = None
+
+        result = metrics.as_dict()
+        if self.dry_run or (policy.quiet and not metrics.rows):
+            return result
+        cache.set(METRICS_KEY_PREFIX + policy.name, dict(result, finished_at=timezone.now().timestamp()), None)
+        logger.info(f"Очистка ({policy.name}): {policy.describe(result)}")
+        return result
+
+
+def run_retention(names, batch_size=None, workers=None, budget=None, dry_run=False, **options):
+    """
+    Выполняет политики по очереди с общим бюджетом.
+    options передаются политикам как есть. Возвращает {политика: метрики}.
+    """
+    engine = RetentionEngine(batch_size=batch_size, workers=workers, budget=budget, dry_run=dry_run)
+    return {name: engine.run(get_policy(name, **options.get(name, {}))) for name in names}
+
+
+def last_run_metrics(name):
+    """Метрики последнего запуска политики (для мониторинга)"""
+    return cache.get(METRICS_KEY_PREFIX + name)
+
+
+def expire_rows(rows, engine, metrics):
+    """
+    Удаляет с диска файлы пачки строк SWEEP_FIELDS и помечает записи удаленными.
+    Возвращает True, если среди них были публичные файлы (меняется sitemap).
+    """
+    _unlink_rows(rows, engine, metrics)
+
+    ids = [row[0] for row in rows]
+    marked = File.objects.filter(id__in=ids, is_deleted=False).update(is_deleted=True)
+    metrics.marked += marked
+    try:
+        _after_mark(rows, marked)
+    except Exception as e:
+        # Расхождение статистики исправит reconcile_stats, кешей — TTL
+        logger.warning(f"Не удалось обновить статистику и индексы после очистки: {e}")
+    return any(not row[3] for row in rows)
+
+
+def purge_rows(rows, engine, metrics):
+    """
+    Удаляет записи (строки PURGE_FIELDS) из БД вместе с файлами на диске.
+    Это пакетный аналог File.delete(): его хуки выполняются здесь для всей пачки.
+    """
+    _unlink_rows(rows, engine, metrics)
+
+    deleted, _ = File.objects.filter(id__in=[row[0] for row in rows], is_permanent=False).delete()
+    metrics.purged += deleted
+    try:
+        _after_purge(rows)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить статистику и индексы после удаления записей: {e}")
+
+
+def sweep_expired(batch_size=None, workers=None, cutoff=None, limit=None, dry_run=False, budget=None):
+    """Помечает удаленными истекшие файлы и удаляет их с диска (политика expire)"""
+    engine = RetentionEngine(batch_size=batch_size, workers=workers, budget=budget, dry_run=dry_run)
+    return engine.run(ExpirePolicy(cutoff=cutoff, limit=limit))
+
+
+def expire_due(batch_size=None, max_batches=10, workers=None, budget=None):
+    """Удаляет наступившие по расписанию в Redis файлы (политика expire_due)"""
+    batch_size = batch_size or getattr(settings, 'EXPIRY_SCHEDULER_BATCH_SIZE', 100)
+    engine = RetentionEngine(batch_size=batch_size, workers=workers, budget=budget)
+    return engine.run(ExpireDuePolicy(max_batches=max_batches))
+
+
+def purge_soft_deleted(batch_size=None, workers=None, dry_run=False, budget=None, expired_before=None):
+    """Окончательно удаляет записи, помеченные удаленными (политика purge)"""
+    engine = RetentionEngine(batch_size=batch_size, workers=workers, budget=budget, dry_run=dry_run)
+    return engine.run(PurgeDeletedPolicy(expired_before=expired_before))
@@ -0,0 +1,154 @@
+"""
+Поиск файлов по коду и имени с использованием индексов.
+
+Условие icontains превращается в LIKE '%...%', который не может использовать
+обычный индекс. Поэтому:
+
+* в PostgreSQL создаются GIN-индексы pg_trgm по UPPER(filename) и UPPER(code):
+  именно в такое выражение Django переводит icontains, и планировщик
+  использует индекс для поиска подстроки;
+* в SQLite создается теневая таблица FTS5 с токенизатором trigram, которую
+  триггеры синхронизируют с files_file; поиск подстроки от трех символов
+  идет через MATCH.
+
+Результаты ранжируются целым числом match_rank (точное совпадение кода,
+совпадение начала имени или кода, вхождение подстроки), которое
+используется и для курсорной пагинации.
+"""
+
+import logging
+
+from django.db import connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'files_file_fts'
+
+# Токенизатор trigram не находит подстроки короче трех символов
+FTS_MIN_QUERY = 3
+
+RANK_EXACT_CODE = 3
+RANK_PREFIX = 2
+RANK_SUBSTRING = 1
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        code, filename, content='files_file', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON files_file BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, code, filename) VALUES (new.id, new.code, new.filename);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON files_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, code, filename)
+        VALUES ('delete', old.id, old.code, old.filename);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF code, filename ON files_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, code, filename)
+        VALUES ('delete', old.id, old.code, old.filename);
+        INSERT INTO {FTS_TABLE}(rowid, code, filename) VALUES (new.id, new.code, new.filename);
+    END""",
+]
+
+SQLITE_UNINSTALL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS files_file_filename_trgm ON files_file USING gin (UPPER(filename) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS files_file_code_trgm ON files_file USING gin (UPPER(code) gin_trgm_ops)',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS files_file_filename_trgm',
+    'DROP INDEX IF EXISTS files_file_code_trgm',
+]
+
+# Наличие таблицы FTS по алиасу БД (проверяется один раз на процесс)
+_fts_available = {}
+
+
+def install_search_index(connection, rebuild=True):
+    """
+    Создает поисковые индексы для текущей СУБД.
+    Ошибки (нет прав на расширение, SQLite без trigram) не фатальны:
+    поиск тогда работает через обычный icontains.
+    """
+    if connection.vendor == 'sqlite':
+        statements = SQLITE_INSTALL + ([f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"] if rebuild else [])
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRES_INSTALL
+    else:
+        return False
+
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+    except Exception as e:
+        logger.warning(f"Поисковый индекс не создан, поиск будет без индекса: {e}")
+        return False
+    finally:
+        _fts_available.pop(connection.alias, None)
+    return True
+
+
+def uninstall_search_index(connection):
+    """Удаляет поисковые индексы"""
+    statements = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    _fts_available.pop(connection.alias, None)
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    """
+    Восстанавливает триггеры FTS после миграций.
+    SQLite пересоздает таблицу при изменении ее схемы, и триггеры теряются.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        install_search_index(connection, rebuild=False)
+
+
+def fts_available(connection):
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = (
+            connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[connection.alias]
+
+
+def fts_phrase(query):
+    """Экранирует запрос как фразу FTS5 (поиск подстроки, без операторов)"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def search_queryset(queryset, query):
+    """
+    Фильтрует queryset файлов по коду или имени и добавляет аннотацию match_rank.
+    """
+    query = query.strip()
+    connection = connections[queryset.db]
+
+    if len(query) >= FTS_MIN_QUERY and fts_available(connection):
+        matches = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_phrase(query)])
+        )
+    else:
+        # PostgreSQL: icontains обслуживается GIN-индексами pg_trgm
+        matches = queryset.filter(Q(code__icontains=query) | Q(filename__icontains=query))
+
+    return matches.annotate(match_rank=Case(
+        When(code__iexact=query, then=Value(RANK_EXACT_CODE)),
+        When(Q(code__istartswith=query) | Q(filename__istartswith=query), then=Value(RANK_PREFIX)),
+        default=Value(RANK_SUBSTRING),
+        output_field=IntegerField(),
+    ))
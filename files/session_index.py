@@ -0,0 +1,231 @@
+"""
+Индекс файлов анонимной сессии в Redis.
+
+Главная страница и «Мои файлы» раньше на каждый просмотр выбирали файлы
+сессии из общей таблицы. Теперь для каждой сессии в Redis хранятся два
+сортированных множества кодов живых файлов:
+
+* session:<id>:files — score = время создания (порядок списка);
+* session:<id>:expiry — score = срок истечения (для вычистки истекших).
+
+Индекс обновляется при загрузке, изменении, пометке удаления и удалении
+файла. Страница списка — это ZREVRANGE по позиции плюс пакетное чтение
+снимков метаданных, поэтому ее стоимость не зависит от размера таблицы.
+Индекс сессии строится из БД при первом обращении (метка ready);
+без Redis списки по-прежнему читаются из БД. На время перестроения
+ставится метка building: add/remove, попавшие между выборкой из БД и
+записью, снимают ее, и перестроение отменяется вместо того, чтобы затереть
+их результат и пометить неполный индекс готовым.
+"""
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from .redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+FILES_KEY = redis_key('session:{}:files')
+EXPIRY_KEY = redis_key('session:{}:expiry')
+READY_KEY = redis_key('session:{}:ready')
+BUILDING_KEY = redis_key('session:{}:building')
+
+# Сколько может длиться перестроение индекса одной сессии
+BUILD_TIMEOUT = 60
+
+
+class SessionFileIndex:
+    """Сортированные множества кодов файлов по сессиям"""
+
+    @property
+    def ttl(self):
+        # Индекс неактивной сессии удаляется сам; при следующем визите строится заново
+        return getattr(settings, 'SESSION_INDEX_TTL', 7 * 24 * 3600)
+
+    def _keys(self, session_id):
+        return FILES_KEY.format(session_id), EXPIRY_KEY.format(session_id), READY_KEY.format(session_id)
+
+    def add(self, file):
+        """Добавляет файл в индекс его сессии (или обновляет сроки)"""
+        if not file.session_id:
+            return
+        redis = get_redis()
+        if redis is None:
+            return
+        files_key, expiry_key, ready_key = self._keys(file.session_id)
+        expires = float('inf') if file.is_permanent else file.expires_at.timestamp()
+        try:
+            pipe = redis.pipeline()
+            pipe.zadd(files_key, {file.code: file.created_at.timestamp()})
+            pipe.zadd(expiry_key, {file.code: expires})
+            pipe.delete(BUILDING_KEY.format(file.session_id))
+            for key in (files_key, expiry_key, ready_key):
+                pipe.expire(key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось добавить {file.code} в индекс сессии: {e}")
+            self._invalidate(redis, file.session_id)
+
+    def remove(self, session_id, code):
+        """Убирает код из индекса сессии"""
+        if not session_id:
+            return
+        redis = get_redis()
+        if redis is None:
+            return
+        files_key, expiry_key, _ = self._keys(session_id)
+        try:
+            pipe = redis.pipeline()
+            pipe.zrem(files_key, code)
+            pipe.zrem(expiry_key, code)
+            pipe.delete(BUILDING_KEY.format(session_id))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось убрать {code} из индекса сессии: {e}")
+            self._invalidate(redis, session_id)
+
+    def remove_many(self, entries):
+        """Убирает пары (session_id, code) одним конвейером (пакетная очистка)"""
+        entries = [(session_id, code) for session_id, code in entries if session_id]
+        if not entries:
+            return
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for session_id, code in entries:
+                files_key, expiry_key, _ = self._keys(session_id)
+                pipe.zrem(files_key, code)
+                pipe.zrem(expiry_key, code)
+            for session_id in {session_id for session_id, _ in entries}:
+                pipe.delete(BUILDING_KEY.format(session_id))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось убрать {len(entries)} кодов из индексов сессий: {e}")
+            for session_id in {session_id for session_id, _ in entries}:
+                self._invalidate(redis, session_id)
+
+    def _invalidate(self, redis, session_id):
+        """Индекс мог разойтись с БД — при следующем чтении он будет перестроен"""
+        try:
+            redis.delete(READY_KEY.format(session_id))
+        except Exception:
+            pass
+
+    def rebuild(self, session_id, redis=None):
+        """
+        Строит индекс сессии по БД (один запрос по индексу session_id).
+        Возвращает число файлов или None, если Redis недоступен или во время
+        выборки индекс сессии изменился (тогда он останется неготовым).
+        """
+        from django.utils import timezone
+        from redis.exceptions import WatchError
+        from .models import File
+
+        redis = redis or get_redis()
+        if redis is None:
+            return None
+
+        files_key, expiry_key, ready_key = self._keys(session_id)
+        building_key = BUILDING_KEY.format(session_id)
+        token = uuid.uuid4().hex
+        redis.set(building_key, token, ex=BUILD_TIMEOUT)
+
+        rows = File.objects.filter(
+            session_id=session_id,
+            expires_at__gt=timezone.now(),
+            is_deleted=False
+        ).values_list('code', 'created_at', 'expires_at', 'is_permanent')
+        created, expiry = {}, {}
+        for code, created_at, expires_at, is_permanent in rows.iterator(chunk_size=2000):
+            created[code] = created_at.timestamp()
+            expiry[code] = float('inf') if is_permanent else expires_at.timestamp()
+
+        with redis.pipeline(transaction=True) as pipe:
+            try:
+                # add/remove после выборки сняли метку — их результата в rows может не быть
+                pipe.watch(building_key)
+                value = pipe.get(building_key)
+                if value not in (token, token.encode()):
+                    return None
+                pipe.multi()
+                pipe.delete(files_key, expiry_key)
+                if created:
+                    pipe.zadd(files_key, created)
+                    pipe.zadd(expiry_key, expiry)
+                pipe.set(ready_key, 1, ex=self.ttl)
+                for key in (files_key, expiry_key):
+                    pipe.expire(key, self.ttl)
+                pipe.delete(building_key)
+                pipe.execute()
+            except WatchError:
+                return None
+        return len(created)
+
+    def page(self, session_id, offset, limit):
+        """
+        Возвращает (коды, всего) для страницы списка сессии, от новых к старым,
+        или None, если Redis недоступен.
+        """
+        redis = get_redis()
+        if redis is None or not session_id:
+            return None
+
+        files_key, expiry_key, ready_key = self._keys(session_id)
+        try:
+            if not redis.exists(ready_key) and self.rebuild(session_id, redis) is None:
+                # Индекс менялся во время перестроения — эту страницу читаем из БД
+                return None
+
+            # Вычищаем истекшие коды, не дожидаясь задачи очистки
+            expired = redis.zrangebyscore(expiry_key, '-inf', time.time())
+            pipe = redis.pipeline()
+            if expired:
+                pipe.zrem(files_key, *expired)
+                pipe.zrem(expiry_key, *expired)
+            pipe.zrevrange(files_key, offset, offset + limit - 1)
+            pipe.zcard(files_key)
+            result = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Индекс сессии недоступен, читаем из БД: {e}")
+            return None
+
+        codes, total = result[-2], result[-1]
+        return [code.decode() if isinstance(code, bytes) else code for code in codes], total
+
+
+session_index = SessionFileIndex()
+
+
+def session_files_page(session_id, cursor, per_page):
+    """
+    Страница файлов сессии из индекса Redis: OffsetPage с карточками FileCard
+    или None, если нужно читать из БД.
+    """
+    from .cards import FileCard
+    from .code_index import normalize_code
+    from .metadata import get_metadata_many
+    from .pagination import OffsetPage, decode_offset_cursor
+
+    offset, number = decode_offset_cursor(cursor) or (0, 1)
+    result = session_index.page(session_id, offset, per_page)
+    if result is None:
+        return None
+    codes, total = result
+
+    snapshots = get_metadata_many(codes)
+    cards = []
+    for code in codes:
+        snapshot = snapshots.get(normalize_code(code))
+        if not snapshot or snapshot['deleted']:
+            # Устаревший код (файл удален в обход модели) — убираем из индекса
+            session_index.remove(session_id, code)
+            total -= 1
+            continue
+        cards.append(FileCard.from_snapshot(snapshot))
+
+    return OffsetPage(cards, number, offset, per_page, total)
@@ -0,0 +1,72 @@
+"""
+Журнал изменений для инкрементальной сборки карты сайта.
+
+Карта сайта разбита на части по диапазонам id (files/sitemaps.py). При
+загрузке, изменении и удалении файла номер его части добавляется в множество
+в Redis; задача generate_sitemap забирает множество и пересобирает только эти
+части. Истечение срока событий не порождает — такие части задача находит сама
+по expires_at. Без Redis журнал не ведется и задача собирает карту целиком.
+"""
+
+import logging
+
+from django.conf import settings
+
+from .redis_utils import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = redis_key('sitemap:dirty')
+
+
+def shard_size():
+    return getattr(settings, 'SITEMAP_SHARD_SIZE', 50000)
+
+
+def shard_of(pk):
+    """Номер части карты сайта для id файла"""
+    return pk // shard_size()
+
+
+def mark_dirty(*pks):
+    """Отмечает части с указанными файлами для пересборки"""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        redis.sadd(DIRTY_KEY, *{shard_of(pk) for pk in pks})
+    except Exception as e:
+        logger.warning(f"Не удалось записать изменение в журнал sitemap: {e}")
+
+
+def mark_shards(shards):
+    """Возвращает части в журнал (например, если сборка упала)"""
+    redis = get_redis()
+    if redis is None or not shards:
+        return
+    try:
+        redis.sadd(DIRTY_KEY, *shards)
+    except Exception as e:
+        logger.warning(f"Не удалось вернуть части в журнал sitemap: {e}")
+
+
+def take_dirty():
+    """
+    Атомарно забирает накопленные номера частей.
+    Возвращает None, если журнала нет (Redis недоступен) — тогда нужна полная сборка.
+    """
+    redis = get_redis()
+    if redis is None:
+        return None
+    try:
+        pipe = redis.pipeline(transaction=True)
+        pipe.smembers(DIRTY_KEY)
+        pipe.delete(DIRTY_KEY)
+        members, _ = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Журнал sitemap недоступен: {e}")
+        return None
+    return {int(member) for member in members}
@@ -0,0 +1,278 @@
+"""
+Потоковая генерация карты сайта.
+
+Раньше XML собирался сложением строк (квадратичная стоимость) в двух копиях —
+во view и в команде generate_sitemap — и ограничивался 1000 файлами.
+Теперь карта разбита на части:
+
+* sitemap.xml — индекс (sitemapindex) со ссылками на части;
+* sitemap-pages.xml — статические страницы;
+* sitemap-<n>.xml — публичные файлы с id в диапазоне [n * SHARD, (n + 1) * SHARD),
+  не больше 50 000 адресов в части, как требует протокол.
+
+Части генерируются итератором по двум колонкам (.values_list().iterator()),
+поэтому память не зависит от количества файлов.
+
+Задача generate_sitemap заранее записывает части в SITEMAP_ROOT, откуда их
+отдает nginx (с Last-Modified и ETag), — запросы поисковиков не доходят до БД.
+Пересобираются только части из журнала изменений (files/sitemap_journal.py).
+Потоковая отдача из БД остается запасным вариантом до первой сборки.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import File
+from .sitemap_journal import mark_shards, shard_of, shard_size, take_dirty
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Статические страницы: (имя маршрута, priority, changefreq)
+STATIC_PAGES = [
+    ('files:home', '1.0', 'daily'),
+    ('files:recent_files', '0.8', 'daily'),
+]
+
+# Сколько адресов собирать в один кусок потока
+CHUNK_URLS = 500
+
+# Состояние последней сборки в SITEMAP_ROOT (номера частей, время сборки, домен)
+MANIFEST_NAME = 'sitemap-manifest.json'
+
+
+def sitemap_domain():
+    """Домен из Sites framework"""
+    from django.contrib.sites.models import Site
+
+    try:
+        return Site.objects.get_current().domain
+    except Site.DoesNotExist:
+        return '0123.ru'
+
+
+def public_files():
+    """Файлы, которые можно показывать поисковикам"""
+    return File.objects.filter(
+        is_protected=False,
+        expires_at__gt=timezone.now(),
+        is_deleted=False
+    )
+
+
+def list_shards():
+    """
+    Возвращает [(номер части, дата последнего файла)] для непустых частей.
+    Один агрегирующий запрос по публичным файлам.
+    """
+    rows = public_files().annotate(
+        shard=F('id') / shard_size()
+    ).values('shard').annotate(lastmod=Max('created_at')).order_by('shard')
+    return [(row['shard'], row['lastmod']) for row in rows]
+
+
+def _url(domain, path, lastmod=None, changefreq='daily', priority='0.6'):
+    parts = [f'  <url>\n    <loc>https://{domain}{escape(path)}</loc>\n']
+    if lastmod is not None:
+        parts.append(f'    <lastmod>{lastmod.strftime("%Y-%m-%d")}</lastmod>\n')
+    parts.append(f'    <changefreq>{changefreq}</changefreq>\n    <priority>{priority}</priority>\n  </url>\n')
+    return ''.join(parts)
+
+
+def iter_index(domain, shards):
+    """Индекс карты сайта"""
+    yield XML_HEADER + f'<sitemapindex xmlns="{SITEMAP_NS}">\n'
+    sections = [('pages', None)] + list(shards)
+    for section, lastmod in sections:
+        entry = f'  <sitemap>\n    <loc>https://{domain}/sitemap-{section}.xml</loc>\n'
+        if lastmod is not None:
+            entry += f'    <lastmod>{lastmod.strftime("%Y-%m-%d")}</lastmod>\n'
+        yield entry + '  </sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def iter_pages(domain):
+    """Часть со статическими страницами"""
+    yield XML_HEADER + f'<urlset xmlns="{SITEMAP_NS}">\n'
+    for name, priority, changefreq in STATIC_PAGES:
+        yield _url(domain, reverse(name), changefreq=changefreq, priority=priority)
+    yield '</urlset>\n'
+
+
+def iter_shard(domain, shard):
+    """Часть с публичными файлами одного диапазона id, кусками по CHUNK_URLS адресов"""
+    size = shard_size()
+    rows = public_files().filter(
+        id__gte=shard * size, id__lt=(shard + 1) * size
+    ).order_by('id').values_list('code', 'created_at')
+
+    # reverse() на каждый адрес заметно дороже подстановки кода в готовый путь
+    detail_path = reverse('files:file_detail', kwargs={'code': 'CODE'}).replace('CODE', '{}')
+
+    yield XML_HEADER + f'<urlset xmlns="{SITEMAP_NS}">\n'
+    chunk = []
+    for code, created_at in rows.iterator(chunk_size=2000):
+        chunk.append(_url(domain, detail_path.format(code), lastmod=created_at))
+        if len(chunk) >= CHUNK_URLS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+    yield '</urlset>\n'
+
+
+def iter_section(domain, section):
+    """Генератор части по имени из URL ('pages' или номер); None — нет такой части"""
+    if section == 'pages':
+        return iter_pages(domain)
+    if section.isdigit():
+        return iter_shard(domain, int(section))
+    return None
+
+
+def write_atomic(path, chunks):
+    """
+    Пишет поток во временный файл рядом и атомарно заменяет им path.
+    Если содержимое не изменилось, файл не трогается (mtime и ETag остаются прежними).
+    Возвращает True, если файл заменен.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sitemap-', suffix='.tmp')
+    digest = hashlib.sha1()
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk.encode('utf-8'))
+        if file_digest(path) == digest.hexdigest():
+            os.unlink(tmp_path)
+            return False
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1()
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+            return digest.hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def section_path(root, section):
+    return os.path.join(root, f'sitemap-{section}.xml')
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def expired_shards(since, until):
+    """
+    Части, в которых с прошлой сборки истек срок хотя бы одного файла.
+    Условия совпадают с частичным индексом files_file_expiry_idx, сортировка
+    модели отключена — запрос идет по индексу. Файлы, уже помеченные
+    удаленными, попадают в журнал при пометке (retention._after_mark).
+    """
+    ids = File.objects.filter(
+        is_deleted=False, is_permanent=False, expires_at__gt=since, expires_at__lte=until
+    ).order_by().values_list('id', flat=True)
+    return {shard_of(pk) for pk in ids.iterator(chunk_size=5000)}
+
+
+def _shard_mtime(root, shard):
+    mtime = os.stat(section_path(root, shard)).st_mtime
+    return datetime.fromtimestamp(mtime, dt_timezone.utc)
+
+
+def build_sitemaps(root=None, domain=None, full=False):
+    """
+    Собирает карту сайта в root (SITEMAP_ROOT), откуда ее отдает nginx.
+
+    Полная сборка — при первом запуске, смене домена, без журнала изменений
+    и раз в SITEMAP_FULL_REBUILD_SECONDS. Иначе пересобираются только части
+    из журнала и части с истекшими файлами, а индекс пишется по манифесту
+    без запросов к БД. Возвращает словарь со статистикой сборки.
+    """
+    root = root or settings.SITEMAP_ROOT
+    domain = domain or sitemap_domain()
+    os.makedirs(root, exist_ok=True)
+
+    started = timezone.now()
+    manifest = load_manifest(root)
+    dirty = take_dirty()
+    try:
+        full = (
+            full or dirty is None or manifest is None
+            or manifest.get('domain') != domain
+            or started.timestamp() - manifest.get('full_built_at', 0) > settings.SITEMAP_FULL_REBUILD_SECONDS
+        )
+
+        if full:
+            shards = {shard for shard, _ in list_shards()}
+            rebuild = set(shards)
+            known = set(manifest['shards']) if manifest else set()
+            stale = known - shards
+        else:
+            since = datetime.fromtimestamp(manifest['built_at'], dt_timezone.utc)
+            rebuild = dirty | expired_shards(since, started)
+            shards = set(manifest['shards'])
+            stale = set()
+
+        changed = 0
+        changed += write_atomic(section_path(root, 'pages'), iter_pages(domain))
+        for shard in sorted(rebuild):
+            if not full and not public_files().filter(
+                id__gte=shard * shard_size(), id__lt=(shard + 1) * shard_size()
+            ).exists():
+                # Все файлы части удалены или истекли — убираем ее из индекса
+                shards.discard(shard)
+                stale.add(shard)
+                continue
+            shards.add(shard)
+            changed += write_atomic(section_path(root, shard), iter_shard(domain, shard))
+
+        for shard in stale:
+            try:
+                os.unlink(section_path(root, shard))
+            except FileNotFoundError:
+                pass
+
+        # Индекс — последним: он ссылается только на уже записанные части
+        index = [(shard, _shard_mtime(root, shard)) for shard in sorted(shards)]
+        changed += write_atomic(os.path.join(root, 'sitemap.xml'), iter_index(domain, index))
+
+        manifest = {
+            'domain': domain,
+            'built_at': started.timestamp(),
+            'full_built_at': started.timestamp() if full else manifest['full_built_at'],
+            'shards': sorted(shards),
+        }
+        write_atomic(os.path.join(root, MANIFEST_NAME), [json.dumps(manifest)])
+    except BaseException:
+        # Отмеченные части не должны потеряться при неудачной сборке
+        mark_shards(dirty)
+        raise
+
+    return {'full': full, 'rebuilt': len(rebuild), 'changed': changed, 'removed': len(stale), 'shards': len(shards)}
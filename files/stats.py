@@ -0,0 +1,169 @@
+"""
+Глобальная статистика сервиса (счетчики главной страницы).
+
+Раньше главная страница на каждый просмотр считала COUNT и SUM по всей
+таблице файлов. Теперь числа хранятся в одной строке SiteStats и меняются
+атомарными UPDATE с F-выражениями в момент загрузки, удаления и истечения
+файла. Периодическая сверка (reconcile_stats) исправляет накопившийся дрейф.
+
+Скачивания строку не трогают: на каждое скачивание UPDATE одной и той же
+строки выстраивал бы запросы в очередь на ее блокировке. Они копятся в
+счетчике кеша (cache.incr — INCR в Redis) и переносятся в строку сверкой;
+get_stats прибавляет еще не перенесенный остаток. Если кеш потерял счетчик,
+сверка восстановит сумму по download_count файлов.
+
+Активными считаются неудаленные файлы: истекший файл перестает быть
+активным, когда его пометит задача очистки.
+"""
+
+import logging
+
+from django.core.cache import cache
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATS_PK = 1
+
+# Скачивания, еще не перенесенные в строку статистики
+PENDING_DOWNLOADS_KEY = 'stats_pending_downloads'
+
+
+def _apply(**changes):
+    """Атомарно применяет изменения к строке статистики (создает ее при необходимости)"""
+    from .models import SiteStats
+
+    try:
+        if not SiteStats.objects.filter(pk=STATS_PK).update(**changes):
+            SiteStats.objects.get_or_create(pk=STATS_PK)
+            SiteStats.objects.filter(pk=STATS_PK).update(**changes)
+    except Exception as e:
+        # Статистика не должна ломать загрузку и скачивание — дрейф исправит сверка
+        logger.warning(f"Не удалось обновить статистику: {e}")
+
+
+def _decrement(field, value):
+    return Greatest(F(field) - value, Value(0))
+
+
+def record_upload(protected=False):
+    """Учитывает новый файл"""
+    today = timezone.localdate()
+    _apply(
+        total_files=F('total_files') + 1,
+        active_files=F('active_files') + 1,
+        protected_files=F('protected_files') + int(bool(protected)),
+        # Обе части вычисляются по старым значениям строки: счетчик дня
+        # сбрасывается первой загрузкой нового дня
+        today_files=Case(When(today_date=today, then=F('today_files') + 1), default=Value(1)),
+        today_date=Value(today),
+    )
+
+
+def record_downloads(count=1):
+    """Учитывает скачивания в счетчике кеша (в строку их переносит сверка)"""
+    if not count:
+        return
+    try:
+        try:
+            cache.incr(PENDING_DOWNLOADS_KEY, count)
+        except ValueError:
+            # Счетчика еще нет; add не затрет значение, созданное параллельно
+            if not cache.add(PENDING_DOWNLOADS_KEY, count, None):
+                cache.incr(PENDING_DOWNLOADS_KEY, count)
+    except Exception as e:
+        logger.warning(f"Не удалось учесть скачивание: {e}")
+
+
+def pending_downloads():
+    try:
+        return cache.get(PENDING_DOWNLOADS_KEY) or 0
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать счетчик скачиваний: {e}")
+        return 0
+
+
+def flush_downloads():
+    """
+    Переносит накопленные скачивания в строку статистики.
+    Из счетчика вычитается ровно перенесенное, поэтому скачивания,
+    учтенные во время переноса, остаются до следующей сверки.
+    """
+    count = pending_downloads()
+    if not count:
+        return 0
+    try:
+        cache.decr(PENDING_DOWNLOADS_KEY, count)
+    except Exception as e:
+        logger.warning(f"Не удалось списать счетчик скачиваний: {e}")
+        return 0
+    _apply(total_downloads=F('total_downloads') + count)
+    return count
+
+
+def record_removed(active=1, protected=0):
+    """Учитывает файлы, которые перестали быть активными (истекли или удалены)"""
+    if active or protected:
+        _apply(
+            active_files=_decrement('active_files', active),
+            protected_files=_decrement('protected_files', protected),
+        )
+
+
+def record_protection_change(delta):
+    """Учитывает установку (+1) или снятие (-1) пароля у активного файла"""
+    if delta > 0:
+        _apply(protected_files=F('protected_files') + delta)
+    elif delta < 0:
+        _apply(protected_files=_decrement('protected_files', -delta))
+
+
+def get_stats():
+    """Возвращает счетчики главной страницы одним запросом по первичному ключу"""
+    from .models import SiteStats
+
+    row = SiteStats.objects.filter(pk=STATS_PK).first()
+    if row is None:
+        row = reconcile_stats()
+
+    return {
+        'total_files': row.total_files,
+        'total_downloads': row.total_downloads + pending_downloads(),
+        'active_files': row.active_files,
+        'protected_files': row.protected_files,
+        'today_files': row.today_files if row.today_date == timezone.localdate() else 0,
+    }
+
+
+def reconcile_stats():
+    """
+    Пересчитывает счетчики по таблице файлов.
+    Сначала переносит в строку накопленные в кеше скачивания.
+    Всего файлов и скачиваний не уменьшаются: записи удаленных файлов
+    исчезают из БД, но продолжают входить в общую статистику.
+    """
+    from .models import File, SiteStats
+
+    flush_downloads()
+    today = timezone.localdate()
+    alive = File.objects.filter(is_deleted=False)
+    counted = {
+        'total_files': File.objects.count(),
+        'total_downloads': File.objects.aggregate(total=Sum('download_count'))['total'] or 0,
+        'active_files': alive.count(),
+        'protected_files': alive.filter(is_protected=True).count(),
+        'today_files': File.objects.filter(created_at__date=today).count(),
+    }
+
+    row, _ = SiteStats.objects.get_or_create(pk=STATS_PK)
+    row.total_files = max(row.total_files, counted['total_files'])
+    row.total_downloads = max(row.total_downloads, counted['total_downloads'])
+    row.active_files = counted['active_files']
+    row.protected_files = counted['protected_files']
+    row.today_files = counted['today_files']
+    row.today_date = today
+    row.reconciled_at = timezone.now()
+    row.save()
+    return row
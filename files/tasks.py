@@ -3,13 +3,19 @@ Celery tasks for 0123.ru file hosting
 """
 import os
 import logging
+from datetime import timedelta
 from celery import shared_task
 from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
 from django.db import connection
 from .models import File
-from .management.commands.generate_sitemap import generate_sitemap
+from .code_index import code_index
+from .stats import reconcile_stats
+from .retention import expire_due, purge_soft_deleted, sweep_expired
+from .caching import acquire_lock, release_lock
+from .preview_cache import preview_cache
 
 logger = logging.getLogger(__name__)
 
@@ -22,54 +28,69 @@ def cleanup_expired_files(self):
     try:
         logger.info("Начинаем очистку истекших файлов...")
         
-        # Находим истекшие файлы
-        expired_files = File.objects.filter(
-            expires_at__lt=timezone.now(),
-            is_deleted=False
-        )
-        
-        count = expired_files.count()
-        
-        if count == 0:
-            logger.info("Нет истекших файлов для удаления")
-            return f"Удалено файлов: 0"
-        
-        logger.info(f"Найдено {count} истекших файлов для удаления")
-        
-        # Удаляем файлы
-        deleted_count = 0
-        for file in expired_files:
-            try:
-                # Удаляем физический файл
-                if file.file and os.path.exists(file.file.path):
-                    os.remove(file.file.path)
-                    logger.debug(f"Удален физический файл: {file.file.path}")
-                
-                # Удаляем QR код
-                if file.qr_code and os.path.exists(file.qr_code.path):
-                    os.remove(file.qr_code.path)
-                    logger.debug(f"Удален QR код: {file.qr_code.path}")
-                
-                # Помечаем как удаленный
-                file.is_deleted = True
-                file.save()
-                
-                deleted_count += 1
-                logger.debug(f"Удален файл: {file.filename} (код: {file.code})")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при удалении {file.filename}: {e}")
-        
-        # Очищаем кеш
-        cache.clear()
-        
-        logger.info(f"Успешно удалено {deleted_count} из {count} истекших файлов")
-        return f"Удалено файлов: {deleted_count}"
+        # Пачки по id, один UPDATE на пачку, удаление с диска в пуле потоков
+        # (files/retention.py). Кеш сбрасывается по тегам, а не cache.clear():
+        # в том же кеше живут сессии и ratelimit
+        metrics = sweep_expired()
+        
+        logger.info(f"Успешно удалено {metrics['marked']} истекших файлов")
+        return f"Удалено файлов: {metrics['marked']}"
         
     except Exception as e:
         logger.error(f"Ошибка в задаче очистки файлов: {e}")
         raise
 
+@shared_task(bind=True, name='files.tasks.purge_deleted_files')
+def purge_deleted_files(self):
+    """
+    Окончательно удаляет записи файлов, помеченных удаленными, пачками.
+    Счетчики уже учтены в SiteStats, поэтому таблица и ее индексы
+    не растут за счет удаленных файлов.
+    """
+    if not acquire_lock('purge_deleted_files', 3600):
+        return "Предыдущий запуск еще выполняется"
+    try:
+        expired_before = timezone.now() - timedelta(hours=settings.RETENTION_PURGE_AFTER_HOURS)
+        metrics = purge_soft_deleted(expired_before=expired_before)
+        return f"Удалено записей: {metrics['purged']}"
+    except Exception as e:
+        logger.error(f"Ошибка при удалении записей удаленных файлов: {e}")
+        raise
+    finally:
+        release_lock('purge_deleted_files')
+
+@shared_task(bind=True, name='files.tasks.expire_due_files')
+def expire_due_files(self):
+    """
+    Удаляет файлы, срок которых наступил, по расписанию в Redis.
+    Запускается каждые несколько секунд; cleanup_expired_files остается страховкой.
+    """
+    # Тики не должны накладываться: следующий ждет, пока текущий закончит
+    if not acquire_lock('expire_due_files', 60):
+        return "Предыдущий запуск еще выполняется"
+    try:
+        metrics = expire_due()
+        return f"Удалено файлов: {metrics['marked']}"
+    except Exception as e:
+        logger.error(f"Ошибка при удалении файлов по расписанию: {e}")
+        raise
+    finally:
+        release_lock('expire_due_files')
+
+@shared_task(bind=True, name='files.tasks.evict_preview_cache')
+def evict_preview_cache(self):
+    """
+    Пересчитывает объем кеша превью и вытесняет давно не открытые превью,
+    если он больше PREVIEW_CACHE_MAX_BYTES.
+    """
+    try:
+        preview_cache.cleanup_tempdirs()
+        evicted, freed = preview_cache.evict()
+        return f"Вытеснено превью: {evicted} ({freed} байт)"
+    except Exception as e:
+        logger.error(f"Ошибка при вытеснении кеша превью: {e}")
+        raise
+
 @shared_task(bind=True, name='files.tasks.generate_sitemap')
 def generate_sitemap_task(self):
     """
@@ -77,13 +98,42 @@ def generate_sitemap_task(self):
     """
     try:
         logger.info("Начинаем генерацию sitemap...")
-        result = generate_sitemap()
-        logger.info(f"Sitemap сгенерирован: {result}")
-        return result
+        call_command('generate_sitemap')
+        logger.info("Sitemap сгенерирован")
+        return "Sitemap сгенерирован"
     except Exception as e:
         logger.error(f"Ошибка при генерации sitemap: {e}")
         raise
 
+@shared_task(bind=True, name='files.tasks.rebuild_code_index')
+def rebuild_code_index(self):
+    """
+    Асинхронная задача для перестройки множества занятых кодов в Redis.
+    Множество обновляется при загрузке и удалении; перестройка убирает накопившийся дрейф.
+    """
+    try:
+        count = code_index.rebuild_occupied()
+        if count is None:
+            return "Redis не настроен, перестройка не требуется"
+        return f"Кодов в индексе: {count}"
+    except Exception as e:
+        logger.error(f"Ошибка при перестройке индекса кодов: {e}")
+        raise
+
+@shared_task(bind=True, name='files.tasks.reconcile_stats')
+def reconcile_stats_task(self):
+    """
+    Асинхронная задача для сверки глобальной статистики с таблицей файлов.
+    Счетчики обновляются инкрементально; сверка исправляет накопившийся дрейф.
+    """
+    try:
+        row = reconcile_stats()
+        logger.info(f"Статистика сверена: {row}")
+        return f"Активных файлов: {row.active_files}"
+    except Exception as e:
+        logger.error(f"Ошибка при сверке статистики: {e}")
+        raise
+
 @shared_task(bind=True, name='files.tasks.cleanup_old_logs')
 def cleanup_old_logs(self):
     """
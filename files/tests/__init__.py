@@ -1 +1,23 @@
 # Тесты для приложения files
+
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class TempMediaMixin:
+    """
+    Подменяет MEDIA_ROOT временным каталогом на время класса тестов,
+    чтобы QR-коды и загрузки не оставались в media/ проекта.
+    Включается до setUpTestData и удаляется после класса.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        cls.addClassCleanup(override.disable)
+        super().setUpClass()
@@ -0,0 +1,141 @@
+"""
+Тесты уровня L1 двухуровневого кеша
+"""
+
+import json
+import time
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from .. import cache_backends
+from ..cache_backends import LocalTier, SharedTier, TwoTierRedisCache
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class LocalTierTestCase(SimpleTestCase):
+    """Тесты LRU-кеша в памяти процесса"""
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не читанная запись"""
+        tier = LocalTier(max_entries=2, timeout=60)
+        tier.set('a', 1)
+        tier.set('b', 2)
+        tier.get('a')
+        tier.set('c', 3)
+        self.assertEqual(tier.get('a'), (True, 1))
+        self.assertEqual(tier.get('b'), (False, None))
+        self.assertEqual(len(tier), 2)
+
+    def test_timeout_capped(self):
+        """Время жизни в L1 не превышает L1_TIMEOUT"""
+        tier = LocalTier(timeout=0.05)
+        tier.set('a', 1, timeout=3600)
+        time.sleep(0.1)
+        self.assertEqual(tier.get('a'), (False, None))
+
+    def test_values_are_copies(self):
+        """Изменение полученного значения не портит кеш"""
+        tier = LocalTier()
+        tier.set('a', {'n': 1})
+        found, value = tier.get('a')
+        value['n'] = 2
+        self.assertEqual(tier.get('a'), (True, {'n': 1}))
+
+
+class SharedTierTestCase(SimpleTestCase):
+    """Тесты обработки сообщений инвалидации"""
+
+    def test_foreign_invalidation(self):
+        """Сообщение другого процесса удаляет ключ, свое — игнорируется"""
+        tier = SharedTier(100, 60, 'channel')
+        tier.sender = 'me'
+        tier.local.set('key', 1)
+
+        tier.handle_message(json.dumps(['me', ['key']]))
+        self.assertEqual(tier.local.get('key'), (True, 1))
+
+        generation = tier.generation
+        tier.handle_message(json.dumps(['other', ['key']]))
+        self.assertEqual(tier.local.get('key'), (False, None))
+        self.assertGreater(tier.generation, generation)
+
+        tier.local.set('key', 1)
+        tier.handle_message(json.dumps(['other', '*']))
+        self.assertEqual(len(tier.local), 0)
+
+
+@skipUnless(fakeredis, 'fakeredis не установлен')
+class TwoTierRedisCacheTestCase(SimpleTestCase):
+    """Два процесса (два экземпляра со своими L1) на одном Redis"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    def make_cache(self):
+        # Отдельный реестр уровней — у экземпляра свой L1, как в другом процессе
+        with mock.patch.dict(cache_backends._shared_tiers, clear=True):
+            cache = TwoTierRedisCache('redis://localhost:6379/0', {'OPTIONS': {
+                'L1_KEY_PREFIXES': ['meta'],
+                'L1_TIMEOUT': 60,
+                'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection, 'server': self.server},
+            }})
+        cache._l1_enabled('meta')
+        # Останавливаем подписку после теста
+        self.addCleanup(setattr, cache._tier, 'pid', None)
+        self.wait_for(lambda: cache._tier.connected)
+        return cache
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Условие не выполнено за отведенное время')
+            time.sleep(0.01)
+
+    def in_l1(self, cache, key):
+        return cache._tier.local.get(cache.make_key(key))[0]
+
+    def test_l1_hits(self):
+        """Повторное чтение L1-ключа не ходит в Redis, остальные ключи — ходят"""
+        self.first.set('meta:a', 'v1')
+        self.first.set('other:a', 'v1')
+        self.assertEqual(self.second.get('meta:a'), 'v1')
+        self.assertEqual(self.second.get('meta:a'), 'v1')
+        self.assertEqual(self.second.get('other:a'), 'v1')
+        self.assertFalse(self.in_l1(self.second, 'other:a'))
+
+        stats = self.second.tier_stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits']), (1, 1))
+
+        # Запись в Redis в обход бэкенда не рассылается — L1 отдает свою копию
+        self.second.client.get_client(write=True).delete(self.second.make_key('meta:a'))
+        self.assertEqual(self.second.get('meta:a'), 'v1')
+
+    def test_set_invalidates_other_process(self):
+        """Запись в одном процессе выбрасывает копию из L1 другого"""
+        self.first.set('meta:a', 'v1')
+        self.assertEqual(self.second.get('meta:a'), 'v1')
+        self.assertTrue(self.in_l1(self.second, 'meta:a'))
+
+        self.first.set('meta:a', 'v2')
+        self.wait_for(lambda: not self.in_l1(self.second, 'meta:a'))
+        self.assertEqual(self.second.get('meta:a'), 'v2')
+        # Свой L1 пишущий процесс обновил сразу
+        self.assertEqual(self.first._tier.local.get(self.first.make_key('meta:a')), (True, 'v2'))
+
+    def test_delete_invalidates_other_process(self):
+        """Удаление в одном процессе выбрасывает копию из L1 другого"""
+        self.first.set('meta:a', 'v1')
+        self.assertEqual(self.second.get('meta:a'), 'v1')
+
+        self.first.delete('meta:a')
+        self.wait_for(lambda: not self.in_l1(self.second, 'meta:a'))
+        self.assertIsNone(self.second.get('meta:a'))
+        self.assertGreaterEqual(self.second.tier_stats()['invalidations'], 1)
@@ -0,0 +1,108 @@
+"""
+Тесты защиты от одновременного пересчета кеша
+"""
+
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..caching import (
+    TAG_SITEMAP, TAG_STATS, acquire_lock, bump_tags, cached_compute, make_entry,
+    session_tag, should_refresh, store, versioned_key,
+)
+from . import TempMediaMixin
+from ..models import File
+from ..tasks import cleanup_expired_files
+
+
+class CachedComputeTestCase(TestCase):
+    """Тесты cached_compute"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def tearDown(self):
+        cache.clear()
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_computes_once_while_fresh(self):
+        """Свежее значение берется из кеша"""
+        self.assertEqual(cached_compute('value', 60, self.compute), 1)
+        self.assertEqual(cached_compute('value', 60, self.compute), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_locked(self):
+        """Пока другой воркер пересчитывает, отдается устаревшее значение"""
+        store('value', 'old', 60)
+        entry = cache.get('value')
+        entry['expires'] = time.time() - 1
+        cache.set('value', entry, 60)
+
+        self.assertTrue(acquire_lock('value', 30))
+        self.assertEqual(cached_compute('value', 60, self.compute), 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_stale_value_refreshed_by_lock_holder(self):
+        """Истекшее значение пересчитывает тот, кто взял блокировку"""
+        cache.set('value', make_entry('old', -1), 60)
+        self.assertEqual(cached_compute('value', 60, self.compute), 1)
+        self.assertEqual(cached_compute('value', 60, self.compute), 1)
+
+    def test_xfetch_probability(self):
+        """Раннее обновление вероятнее для долгих вычислений ближе к сроку"""
+        now = time.time()
+        entry = {'value': 1, 'expires': now + 10, 'delta': 1.0}
+        with mock.patch('files.caching.random.random', return_value=0.5):
+            self.assertFalse(should_refresh(entry, now=now))
+        with mock.patch('files.caching.random.random', return_value=1e-6):
+            # -ln(1e-6) ≈ 13.8 секунды вперед — обновляем заранее
+            self.assertTrue(should_refresh(entry, now=now))
+
+
+class VersionedKeysTestCase(TempMediaMixin, TestCase):
+    """Тесты сброса кеша по тегам"""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_bump_changes_only_tagged_keys(self):
+        """Смена версии тега не затрагивает другие ключи"""
+        stats_key = versioned_key('home_stats', TAG_STATS)
+        sitemap_key = versioned_key('sitemap_xml', TAG_SITEMAP)
+
+        bump_tags(TAG_STATS)
+        self.assertNotEqual(versioned_key('home_stats', TAG_STATS), stats_key)
+        self.assertEqual(versioned_key('sitemap_xml', TAG_SITEMAP), sitemap_key)
+
+    def test_cleanup_does_not_flush_cache(self):
+        """Очистка истекших файлов сбрасывает свои группы, а не весь кеш"""
+        File.objects.create(
+            file='uploads/old.txt',
+            filename='old.txt',
+            file_size=10,
+            code='OLD001',
+            session_id='session-1',
+            expires_at=timezone.now() - timedelta(hours=1)
+        )
+        cache.set('unrelated', 'kept', 60)  # например, сессия или счетчик ratelimit
+        stats_key = versioned_key('home_stats', TAG_STATS)
+        session_key = versioned_key('recent_files', session_tag('session-1'))
+        other_session_key = versioned_key('recent_files', session_tag('session-2'))
+
+        cleanup_expired_files()
+
+        self.assertEqual(cache.get('unrelated'), 'kept')
+        self.assertNotEqual(versioned_key('home_stats', TAG_STATS), stats_key)
+        self.assertNotEqual(versioned_key('recent_files', session_tag('session-1')), session_key)
+        self.assertEqual(versioned_key('recent_files', session_tag('session-2')), other_session_key)
@@ -0,0 +1,57 @@
+"""
+Тесты компактных карточек файлов
+"""
+
+from django.test import TestCase, Client
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from ..cards import FileCard, pack_cards, unpack_cards
+from . import TempMediaMixin
+from ..models import File
+
+
+class FileCardTestCase(TempMediaMixin, TestCase):
+    """Тесты FileCard и кеша недавних файлов"""
+
+    def setUp(self):
+        cache.clear()
+        self.file = File.objects.create(
+            file='uploads/photo.jpg',
+            filename='photo.jpg',
+            file_size=3 * 1024 * 1024,
+            code='CARD01',
+            session_id='card-session',
+            download_count=5,
+            expires_at=timezone.now() + timedelta(hours=2)
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_round_trip_matches_model(self):
+        """Карточка после сериализации отдает те же значения, что и модель"""
+        card, = unpack_cards(pack_cards([self.file]))
+        self.assertIsInstance(card, FileCard)
+        self.assertEqual(card.code, 'CARD01')
+        self.assertAlmostEqual(card.created_at.timestamp(), self.file.created_at.timestamp(), places=3)
+        for method in ['get_file_type_icon', 'get_file_type_name', 'get_file_type_color',
+                       'get_file_size_mb', 'is_expired']:
+            self.assertEqual(getattr(card, method)(), getattr(self.file, method)())
+        self.assertFalse(card.is_expired())
+
+    def test_home_renders_cards(self):
+        """Главная страница показывает недавние файлы из компактного кеша"""
+        client = Client()
+        client.get('/')
+        session_id = client.cookies['anonymous_session_id'].value
+        self.file.session_id = session_id
+        self.file.save()
+
+        for _ in range(2):
+            response = client.get('/')
+            recent = response.context['recent_files']
+            self.assertEqual(len(recent), 1)
+            self.assertIsInstance(recent[0], FileCard)
+            self.assertContains(response, 'photo.jpg')
@@ -0,0 +1,175 @@
+"""
+Тесты индекса кодов и отсечения промахов на маршруте <str:code>/
+"""
+
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from . import TempMediaMixin
+from ..models import File
+from ..code_index import BloomFilter, code_index
+
+
+class BloomFilterTestCase(TestCase):
+    """Тесты фильтра Блума"""
+
+    def test_no_false_negatives(self):
+        """Все добавленные элементы находятся"""
+        bloom = BloomFilter(1000)
+        codes = [f'CODE{i}' for i in range(1000)]
+        for code in codes:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in codes))
+
+    def test_false_positive_rate(self):
+        """Доля ложноположительных ответов близка к заданной"""
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'IN{i}')
+        false_positives = sum(1 for i in range(10000) if f'OUT{i}' in bloom)
+        self.assertLess(false_positives, 300)
+
+
+class DirectViewMissTestCase(TempMediaMixin, TestCase):
+    """Тесты быстрых промахов прямого просмотра"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.file_instance = File.objects.create(
+            file='uploads/test.txt',
+            filename='test.txt',
+            file_size=12,
+            code='LIVE01',
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        code_index.rebuild()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_unknown_code_skips_database(self):
+        """Неизвестный код получает 404 без запросов к БД"""
+        with self.assertNumQueries(0):
+            response = self.client.get('/wp-login.php/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_known_code_reaches_view(self):
+        """Существующий код проходит фильтр (в том числе в нижнем регистре)"""
+        response = self.client.get('/live01/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_new_code_visible_before_rebuild(self):
+        """Код, загруженный после построения фильтра, сразу доступен"""
+        # Код попадает в индекс после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            File.objects.create(
+                file='uploads/new.txt',
+                filename='new.txt',
+                file_size=12,
+                code='FRESH1',
+                expires_at=timezone.now() + timedelta(hours=24)
+            )
+        self.assertTrue(code_index.might_exist('fresh1'))
+
+    def test_add_only_for_new_or_renamed(self):
+        """Индекс обновляется при создании и смене кода, но не при скачиваниях и правках"""
+        with mock.patch.object(code_index, 'add') as add:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.file_instance.increment_download_count()
+                self.file_instance.filename = 'renamed.txt'
+                self.file_instance.save()
+            add.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.file_instance.code = 'LIVE02'
+                self.file_instance.save()
+            add.assert_called_once_with('LIVE02')
+
+    def test_rollback_leaves_index(self):
+        """Откаченная загрузка не попадает в индекс"""
+        from django.db import transaction
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    File.objects.create(
+                        file='uploads/gone.txt',
+                        filename='gone.txt',
+                        file_size=12,
+                        code='GONE01',
+                        expires_at=timezone.now() + timedelta(hours=24)
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertNotIn('GONE01', code_index._filter)
+
+    def test_background_rebuild_closes_connection(self):
+        """Фоновая перестройка закрывает соединение с БД своего потока"""
+        with mock.patch('django.db.connection.close') as close:
+            code_index._rebuild_in_background()
+        close.assert_called_once()
+
+    def test_negative_cache(self):
+        """Удаленный код отсекается негативным кешем и снова виден после загрузки"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file_instance.delete()
+        # Фильтр Блума еще помнит код, но промах уже закеширован
+        self.assertIn('LIVE01', code_index._filter)
+        self.assertFalse(code_index.might_exist('LIVE01'))
+
+        code_index.add('LIVE01')
+        self.assertTrue(code_index.might_exist('LIVE01'))
+
+    @override_settings(CODE_MISS_RATE_LIMIT='3/m')
+    def test_misses_feed_rate_limiter(self):
+        """IP, набравший лимит промахов, получает 429"""
+        statuses = [self.client.get(f'/missing{i}/').status_code for i in range(5)]
+        self.assertEqual(statuses[:3], [404, 404, 404])
+        self.assertEqual(statuses[3:], [429, 429])
+
+
+class CodeAvailabilityTestCase(TempMediaMixin, TestCase):
+    """Тесты проверки занятости кода"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        File.objects.create(
+            file='uploads/test.txt',
+            filename='test.txt',
+            file_size=12,
+            code='TAKEN1',
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_lookup_is_case_insensitive(self):
+        """Код в нижнем регистре считается занятым"""
+        response = self.client.get('/api/check-code/', {'code': ' taken1 '})
+        self.assertEqual(response.json(), {'available': False, 'code': 'TAKEN1', 'occupied': True})
+
+    def test_free_code(self):
+        """Свободный код доступен"""
+        response = self.client.get('/api/check-code/', {'code': 'free1'})
+        self.assertTrue(response.json()['available'])
+
+    def test_endpoint_skips_session_middleware(self):
+        """Проверка кода не создает анонимную сессию и не ставит cookie"""
+        response = self.client.get('/api/check-code/', {'code': 'free1'})
+        self.assertNotIn('anonymous_session_id', response.cookies)
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_edit_form_excludes_current_file(self):
+        """Свой собственный код при редактировании не считается занятым"""
+        file_instance = File.objects.get(code='TAKEN1')
+        self.assertTrue(code_index.is_available('taken1', exclude_pk=file_instance.pk))
+        self.assertFalse(code_index.is_available('taken1'))
@@ -0,0 +1,112 @@
+"""
+Тесты команды compress_pdfs: пофайловое сохранение и продолжение после прерывания.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..management.commands.compress_pdfs import CHECKPOINT_KEY
+from ..models import File
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+
+@skipUnless(fitz, 'PyMuPDF не установлен')
+class CompressPdfsCommandTestCase(TestCase):
+    """Тесты команды compress_pdfs"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        cache.clear()
+
+    def create(self, code, image=False, exists=True):
+        from PIL import Image
+
+        path = os.path.join(self.media, 'uploads', f'{code}.pdf')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if exists:
+            with fitz.open() as doc:
+                page = doc.new_page(width=595, height=842)
+                page.insert_text((50, 60), f'{code} ' * 20)
+                if image:
+                    pix = Image.effect_noise((1200, 900), 60).convert('RGB')
+                    page.insert_image(fitz.Rect(50, 100, 545, 471), pixmap=fitz.Pixmap(fitz.csRGB, 1200, 900, pix.tobytes(), False))
+                doc.save(path, deflate=True)
+        return File.objects.create(
+            file=f'uploads/{code}.pdf',
+            filename=f'{code}.pdf',
+            file_size=os.path.getsize(path) if exists else 1,
+            code=code,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('compress_pdfs', '--max-size', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_failure_does_not_roll_back(self):
+        """Ошибка на одном файле не откатывает уже сжатые, точка по завершении удаляется"""
+        photo = self.create('PDF001', image=True)
+        self.create('PDF002', exists=False)
+        text = self.create('PDF003')
+
+        output = self.run_command()
+        self.assertIn('Успешно сжато: 1', output)
+        self.assertIn('Файл не найден: PDF002', output)
+        self.assertIn('3/3 (100%)', output)
+
+        photo.refresh_from_db()
+        self.assertTrue(photo.has_compressed_pdf())
+        text.refresh_from_db()
+        self.assertFalse(text.compressed_pdf)
+        self.assertIsNone(cache.get(CHECKPOINT_KEY))
+
+    def test_resume_after_interrupt(self):
+        """Прерванный запуск продолжается с первого необработанного файла"""
+        files = [self.create(f'PDF10{i}') for i in range(3)]
+        calls = []
+
+        def interrupted(file_id, **kwargs):
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            calls.append(file_id)
+            return {'id': file_id, 'code': None, 'status': 'no_gain', 'original_size': 0, 'compressed_size': 0, 'error': None}
+
+        target = 'files.management.commands.compress_pdfs.compress_file_by_id'
+        with mock.patch(target, side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_command()
+        self.assertEqual(cache.get(CHECKPOINT_KEY)['last_id'], files[1].id)
+
+        # Запуск с другими параметрами точку не использует
+        with mock.patch(target, side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_command('--quality', '50')
+        self.assertEqual(cache.get(CHECKPOINT_KEY)['last_id'], files[1].id)
+
+        calls.clear()
+        with mock.patch(target, side_effect=interrupted):
+            output = self.run_command()
+        self.assertIn(f'id > {files[1].id}', output)
+        self.assertEqual(calls, [files[2].id])
+        self.assertIsNone(cache.get(CHECKPOINT_KEY))
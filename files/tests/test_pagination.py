@@ -0,0 +1,94 @@
+"""
+Тесты курсорной пагинации
+"""
+
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from . import TempMediaMixin
+from ..models import File
+from ..pagination import KeysetPaginator, decode_cursor
+
+
+class KeysetPaginatorTestCase(TempMediaMixin, TestCase):
+    """Тесты KeysetPaginator"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        for index in range(25):
+            File.objects.create(
+                file=f'uploads/page{index}.txt',
+                filename=f'page{index}.txt',
+                file_size=10,
+                code=f'PAGE{index:02d}',
+                session_id='page-session',
+                expires_at=now + timedelta(hours=1)
+            )
+        # Одинаковое время создания у части файлов проверяет разрешение по id
+        File.objects.filter(code__in=['PAGE10', 'PAGE11', 'PAGE12']).update(created_at=now)
+
+    def setUp(self):
+        cache.clear()
+        self.files = File.objects.filter(session_id='page-session')
+
+    def test_walk_forward_and_back(self):
+        """Проход вперед и назад без пропусков и повторов"""
+        paginator = KeysetPaginator(self.files, 10)
+        expected = list(self.files.order_by('-created_at', '-id').values_list('code', flat=True))
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertEqual([file.code for page in pages for file in page], expected)
+
+        previous = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(previous.number, 2)
+        self.assertEqual([file.code for file in previous], expected[10:20])
+        first = paginator.page(previous.previous_cursor)
+        self.assertFalse(first.has_previous())
+        self.assertEqual([file.code for file in first], expected[:10])
+
+    def test_estimated_total(self):
+        """Общее количество оценивается с ограничением"""
+        page = KeysetPaginator(self.files, 10, estimate_cap=20).page()
+        self.assertEqual(page.total_display, '20+')
+        page = KeysetPaginator(self.files, 10).page()
+        self.assertEqual(page.total_display, 25)
+        self.assertEqual(page.num_pages, 3)
+
+    def test_invalid_cursor(self):
+        """Некорректный курсор открывает первую страницу"""
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = KeysetPaginator(self.files, 10).page('not-a-cursor')
+        self.assertEqual(page.number, 1)
+
+    def test_recent_files_view(self):
+        """Страница «Мои файлы» листается по курсору"""
+        client = Client()
+        client.get('/')
+        session_id = client.cookies['anonymous_session_id'].value
+        self.files.update(session_id=session_id)
+
+        response = client.get(reverse('files:recent_files'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 20)
+        self.assertEqual(response.context['total_files'], 25)
+
+        response = client.get(reverse('files:recent_files'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['page_obj']), 5)
+
+    def test_search_view(self):
+        """Результаты поиска листаются по курсору"""
+        client = Client()
+        client.get('/')
+        self.files.update(session_id=client.cookies['anonymous_session_id'].value)
+
+        response = client.get(reverse('files:search_files'), {'q': 'page'})
+        page = response.context['page_obj']
+        self.assertEqual(response.context['files_count'], 25)
+        self.assertContains(response, f'cursor={page.next_cursor}')
@@ -0,0 +1,121 @@
+"""
+Тесты постраничного предпросмотра PDF (/<код>/page/<n>.webp)
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import skipUnless
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import File
+from ..preview_cache import preview_cache
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+
+@skipUnless(fitz, 'PyMuPDF не установлен')
+class PdfPageTestCase(TestCase):
+    """Тесты представления pdf_page и кеша страниц"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, PDF_PAGE_PREVIEW_LIMIT=3)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        cache.clear()
+
+    def create(self, code, pages=5, filename=None, **kwargs):
+        filename = filename or f'{code}.pdf'
+        path = os.path.join(self.media, 'uploads', filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with fitz.open() as doc:
+            for i in range(pages):
+                doc.new_page(width=595, height=842).insert_text((50, 60), f'Page {i + 1}')
+            doc.save(path)
+        return File.objects.create(
+            file=f'uploads/{filename}',
+            filename=filename,
+            file_size=os.path.getsize(path),
+            code=code,
+            expires_at=timezone.now() + timedelta(hours=1),
+            **kwargs
+        )
+
+    def url(self, code, page, **params):
+        query = '&'.join(f'{k}={v}' for k, v in params.items())
+        return reverse('files:pdf_page', args=[code, page]) + (f'?{query}' if query else '')
+
+    def test_renders_and_caches_page(self):
+        """Страница рендерится в WebP допустимой ширины и отдается из кеша"""
+        from PIL import Image
+
+        file = self.create('PAGE01')
+        response = self.client.get(self.url('PAGE01', 2, w=500))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.format, 'WEBP')
+        # 500 округляется вверх до 800
+        self.assertEqual(image.width, 800)
+        self.assertTrue(os.path.exists(preview_cache.page_path('PAGE01', 2, 800)))
+
+        hits = preview_cache.stats()['hits']
+        response = self.client.get(self.url('PAGE01', 2, w=800, v=file.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(preview_cache.stats()['hits'], hits + 1)
+
+        response = self.client.get(self.url('PAGE01', 2, w=800), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Страницы удаляются вместе с файлом
+        file.delete()
+        self.assertFalse(os.path.exists(preview_cache.page_dir('PAGE01')))
+
+    def test_missing_page_and_access(self):
+        """Несуществующая страница, не-PDF и защищенный файл не рендерятся"""
+        self.create('PAGE02', pages=2)
+        self.assertEqual(self.client.get(self.url('PAGE02', 3)).status_code, 404)
+        self.assertEqual(self.client.get(self.url('PAGE02', 0)).status_code, 404)
+
+        self.create('PAGE03', filename='PAGE03.txt')
+        self.assertEqual(self.client.get(self.url('PAGE03', 1)).status_code, 404)
+
+        self.create('PAGE04', is_protected=True, password=make_password('secret'))
+        self.assertEqual(self.client.get(self.url('PAGE04', 1)).status_code, 403)
+        self.assertFalse(os.path.exists(preview_cache.page_dir('PAGE04')))
+
+    def test_detail_lazy_loads_pages(self):
+        """Страница файла показывает первые страницы сразу, остальные лениво"""
+        file = self.create('PAGE05')
+        response = self.client.get(reverse('files:file_detail', args=['PAGE05']))
+        self.assertContains(response, self.url('PAGE05', 1, w=800) + f'&amp;v={file.pk}')
+        self.assertContains(response, self.url('PAGE05', 3, w=800))
+        self.assertNotContains(response, self.url('PAGE05', 4, w=800))
+        self.assertContains(response, 'loading="lazy"', count=1)
+
+    def test_pages_share_budget(self):
+        """Изображения страниц учитываются и вытесняются в общем бюджете кеша"""
+        preview_cache.store_page('PAGE06', 1, 800, b'x' * 400)
+        preview_cache.store_page('PAGE06', 2, 800, b'x' * 400)
+        self.assertEqual(preview_cache.stats()['bytes'], 800)
+        self.assertEqual(len(preview_cache.scan()), 2)
+
+        self.assertEqual(preview_cache.evict(max_bytes=300), (2, 800))
+        self.assertFalse(os.path.exists(preview_cache.page_dir('PAGE06')))
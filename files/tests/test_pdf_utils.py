@@ -0,0 +1,287 @@
+"""
+Тесты сжатия PDF
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ..models import CompressionRecord, File
+from ..pdf_utils import analyze_pdf, assemble_parts, compress_file_pdf, compress_pdf, optimize_pdf, page_ranges, render_pages
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+
+@skipUnless(fitz, 'PyMuPDF не установлен')
+class CompressPdfTestCase(SimpleTestCase):
+    """Тесты compress_pdf"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def make_pdf(self, pages=6):
+        """PDF, у страниц которого разная ширина — по ней проверяется порядок"""
+        path = os.path.join(self.tmp, 'source.pdf')
+        with fitz.open() as doc:
+            for i in range(pages):
+                page = doc.new_page(width=300 + i * 10, height=400)
+                page.insert_text((50, 100), f'Page {i + 1}')
+            doc.save(path)
+        return path
+
+    def widths(self, path):
+        with fitz.open(path) as doc:
+            return [round(page.rect.width) for page in doc]
+
+    def test_page_ranges(self):
+        """Диапазоны покрывают все страницы без пропусков"""
+        ranges = page_ranges(10, 2)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], 10)
+        self.assertTrue(all(a[1] == b[0] for a, b in zip(ranges, ranges[1:])))
+        self.assertEqual(page_ranges(3, 8), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(page_ranges(0, 4), [])
+
+    def test_pages_in_order(self):
+        """Части, отрендеренные в пуле процессов, собираются в исходном порядке"""
+        source = self.make_pdf()
+        for workers in (1, 2):
+            parts_dir = tempfile.mkdtemp(dir=self.tmp)
+            parts = render_pages(source, 6, parts_dir, workers=workers)
+            output = os.path.join(self.tmp, f'out-{workers}.pdf')
+            assemble_parts(parts, output)
+            self.assertEqual(self.widths(output), [300 + i * 10 for i in range(6)])
+
+    def make_photo_pdf(self, pages=2):
+        """PDF с текстом и крупной фотографией на каждой странице"""
+        from PIL import Image
+
+        path = os.path.join(self.tmp, 'photo.pdf')
+        image = Image.effect_noise((1600, 1200), 60).convert('RGB')
+        with fitz.open() as doc:
+            for i in range(pages):
+                page = doc.new_page(width=595, height=842)
+                page.insert_text((50, 60), f'Photo {i + 1}')
+                pix = fitz.Pixmap(fitz.csRGB, 1600, 1200, image.tobytes(), False)
+                page.insert_image(fitz.Rect(50, 100, 545, 471), pixmap=pix)
+            doc.save(path, deflate=True)
+        return path
+
+    def test_text_pdf_is_not_rasterized(self):
+        """Текстовый PDF сжимается без потерь, текст остается извлекаемым"""
+        source = self.make_pdf()
+        output = os.path.join(self.tmp, 'out.pdf')
+        ok, path, size = compress_pdf(source, output, max_size_mb=0, workers=1, time_budget=0)
+        self.assertEqual((ok, path), (True, output))
+        self.assertLess(size, os.path.getsize(source))
+        with fitz.open(output) as doc:
+            self.assertIn('Page 6', doc[5].get_text())
+
+    def test_images_recompressed_with_quality(self):
+        """Изображения перекодируются, и качество влияет на размер"""
+        source = self.make_photo_pdf()
+        sizes = {}
+        for quality in (30, 90):
+            output = os.path.join(self.tmp, f'photo-{quality}.pdf')
+            strategy, sizes[quality] = optimize_pdf(
+                source, output, quality=quality, target_size=0, strategies=['images']
+            )
+            self.assertEqual(strategy, 'images')
+            with fitz.open(output) as doc:
+                self.assertIn('Photo 1', doc[0].get_text())
+        self.assertLess(sizes[30], sizes[90])
+        self.assertLess(sizes[90], os.path.getsize(source))
+
+    def test_strategies_supported(self):
+        """Стратегии без растеризации работают в установленной версии PyMuPDF"""
+        source = self.make_photo_pdf(pages=1)
+        for name in ('lossless', 'images', 'images_low'):
+            output = os.path.join(self.tmp, f'{name}.pdf')
+            # Ошибка стратегии внутри optimize_pdf превращается в предупреждение
+            with self.assertNoLogs('files.pdf_utils', level='WARNING'):
+                strategy, _ = optimize_pdf(source, output, target_size=0, strategies=[name])
+            self.assertEqual(strategy, name)
+
+    def test_time_budget(self):
+        """Документ, не уложившийся в бюджет времени, не сжимается"""
+        source = self.make_pdf()
+        output = os.path.join(self.tmp, 'out.pdf')
+        self.assertEqual(compress_pdf(source, output, max_size_mb=0, workers=1, time_budget=1e-9), (False, None, 0))
+        self.assertFalse(os.path.exists(output))
+
+
+@skipUnless(fitz, 'PyMuPDF не установлен')
+class AnalyzePdfTestCase(TestCase):
+    """Тесты анализатора PDF и статистики сжатия"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def make_pdf(self, name, image=None, text=True):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, name)
+        with fitz.open() as doc:
+            for i in range(3):
+                page = doc.new_page(width=595, height=842)
+                if text:
+                    page.insert_text((50, 60), f'Page {i + 1} ' * 20)
+                if image:
+                    pix = Image.effect_noise((1200, 900), 60).convert('RGB')
+                    page.insert_image(fitz.Rect(50, 100, 545, 471), pixmap=fitz.Pixmap(fitz.csRGB, 1200, 900, pix.tobytes(), False))
+            doc.save(path, deflate=True)
+        return path
+
+    def test_text_pdf_skipped(self):
+        """Сжатый текстовый PDF не окупается — сжатие пропускается и это записывается"""
+        source = self.make_pdf('text.pdf')
+        analysis = analyze_pdf(source)
+        self.assertEqual(analysis['pages'], 3)
+        self.assertEqual(analysis['image_count'], 0)
+        self.assertEqual(analysis['strategies'], [])
+
+        self.assertEqual(compress_pdf(source, max_size_mb=0, code='TXT001'), (True, source, os.path.getsize(source)))
+        record = CompressionRecord.objects.get(code='TXT001')
+        self.assertTrue(record.skipped)
+        self.assertIsNone(record.actual_ratio)
+
+    def test_image_pdf_planned_and_recorded(self):
+        """Для PDF с фотографиями выбирается перекодирование изображений, факт записывается"""
+        source = self.make_pdf('photo.pdf', image=True)
+        analysis = analyze_pdf(source)
+        self.assertGreater(analysis['image_share'], 0.9)
+        self.assertGreaterEqual(analysis['filters'].get('FlateDecode', 0), 3)
+        self.assertIn('images', analysis['strategies'])
+        # Есть текст — страницы не растеризуются
+        self.assertNotIn('raster', analysis['strategies'])
+
+        ok, path, size = compress_pdf(source, max_size_mb=0, code='IMG001', workers=1, time_budget=0)
+        self.assertTrue(ok)
+        record = CompressionRecord.objects.get(code='IMG001')
+        self.assertFalse(record.skipped)
+        self.assertIn(record.strategy, analysis['strategies'])
+        self.assertAlmostEqual(record.actual_ratio, size / os.path.getsize(source), places=3)
+        self.assertLess(record.actual_ratio, 1)
+        os.remove(path)
+
+        # Скан без текста может быть растеризован
+        self.assertIn('raster', analyze_pdf(self.make_pdf('scan.pdf', image=True, text=False))['strategies'])
+
+    def test_compress_file_pdf_in_place(self):
+        """Сжатый PDF пишется прямо в хранилище, оригинал как «сжатая» версия не сохраняется"""
+        media = os.path.join(self.tmp, 'media')
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        def create(code, source):
+            os.makedirs(os.path.join(media, 'uploads'), exist_ok=True)
+            shutil.copy(source, os.path.join(media, 'uploads', f'{code}.pdf'))
+            return File.objects.create(
+                file=f'uploads/{code}.pdf',
+                filename=f'{code}.pdf',
+                file_size=os.path.getsize(source),
+                code=code,
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+
+        photo = create('PHO001', self.make_pdf('photo.pdf', image=True))
+        size = compress_file_pdf(photo, max_size_mb=0, workers=1, time_budget=0)
+        photo.refresh_from_db()
+        self.assertTrue(photo.compressed_pdf.name.startswith('compressed_pdfs/compressed_PHO001'))
+        self.assertEqual(size, photo.compressed_pdf_size)
+        self.assertEqual(size, os.path.getsize(photo.compressed_pdf.path))
+        self.assertLess(size, photo.file_size)
+        self.assertEqual(os.listdir(os.path.dirname(photo.compressed_pdf.path)), [os.path.basename(photo.compressed_pdf.path)])
+
+        text = create('TXT002', self.make_pdf('text.pdf'))
+        self.assertIsNone(compress_file_pdf(text, max_size_mb=0))
+        text.refresh_from_db()
+        self.assertFalse(text.compressed_pdf)
+        self.assertEqual(sorted(os.listdir(os.path.join(media, 'compressed_pdfs'))), [os.path.basename(photo.compressed_pdf.path)])
+
+    def test_compress_file_pdf_same_filename(self):
+        """Две одновременные загрузки scan.pdf не делят одну сжатую копию"""
+        from .. import pdf_utils
+
+        media = os.path.join(self.tmp, 'media')
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        rows = []
+        for code, pages in (('SCN001', 1), ('SCN002', 2)):
+            source = self.make_pdf(f'{code}.pdf', image=True)
+            with fitz.open(source) as doc:
+                doc.select(list(range(pages)))
+                os.makedirs(os.path.join(media, 'uploads', code), exist_ok=True)
+                doc.save(os.path.join(media, 'uploads', code, 'scan.pdf'))
+            rows.append(File.objects.create(
+                file=f'uploads/{code}/scan.pdf',
+                filename='scan.pdf',
+                file_size=os.path.getsize(os.path.join(media, 'uploads', code, 'scan.pdf')),
+                code=code,
+                expires_at=timezone.now() + timedelta(hours=1),
+            ))
+
+        real_compress = pdf_utils.compress_pdf
+        calls = []
+
+        def interleaved(*args, **kwargs):
+            # Вторая загрузка сжимается, пока первая еще не записала результат
+            calls.append(args[0])
+            if len(calls) == 1:
+                compress_file_pdf(rows[1], max_size_mb=0, workers=1, time_budget=0)
+            return real_compress(*args, **kwargs)
+
+        with mock.patch.object(pdf_utils, 'compress_pdf', side_effect=interleaved):
+            compress_file_pdf(rows[0], max_size_mb=0, workers=1, time_budget=0)
+
+        for row in rows:
+            row.refresh_from_db()
+        first, second = rows
+        self.assertNotEqual(first.compressed_pdf.name, second.compressed_pdf.name)
+        for row, pages in ((first, 1), (second, 2)):
+            self.assertEqual(row.compressed_pdf.name, f'compressed_pdfs/compressed_{row.code}-{row.pk}.pdf')
+            with fitz.open(row.compressed_pdf.path) as doc:
+                self.assertEqual(doc.page_count, pages)
+
+        # Удаление одной записи не трогает сжатую копию другой
+        first.delete()
+        self.assertTrue(os.path.exists(second.compressed_pdf.path))
+
+
+class UploadCompressionTestCase(TestCase):
+    """Сжатие при загрузке не запускает пул процессов в воркере gunicorn"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @override_settings(PDF_COMPRESS_REQUEST_TIME_BUDGET=12)
+    def test_upload_compresses_serially_within_budget(self):
+        """В запросе загрузки сжатие идет в одном процессе с коротким бюджетом"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('scan.pdf', b'%PDF-1.4\n%%EOF\n', content_type='application/pdf')
+        with mock.patch('files.views.should_compress_pdf', return_value=True), \
+                mock.patch('files.views.compress_file_pdf', return_value=None) as compress:
+            self.client.post('/', {'file': upload})
+
+        compress.assert_called_once()
+        self.assertEqual(compress.call_args.kwargs['workers'], 1)
+        self.assertEqual(compress.call_args.kwargs['time_budget'], 12)
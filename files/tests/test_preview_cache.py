@@ -0,0 +1,84 @@
+"""
+Тесты кеша PDF-превью офисных документов
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import File
+from ..preview_cache import preview_cache
+
+
+class PreviewCacheTestCase(TestCase):
+    """Тесты PreviewCache"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, PREVIEW_CACHE_MAX_BYTES=1000)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        cache.clear()
+
+    def put(self, code, size=300, atime=None):
+        produced = os.path.join(preview_cache.tempdir(), f'{code}.pdf')
+        with open(produced, 'wb') as f:
+            f.write(b'x' * size)
+        path = preview_cache.store(code, produced)
+        if atime is not None:
+            os.utime(path, (atime, os.stat(path).st_mtime))
+        return path
+
+    def test_hit_and_miss(self):
+        """Превью старше исходника считается промахом"""
+        self.assertIsNone(preview_cache.get('MISS01'))
+        path = self.put('HIT001')
+        self.assertEqual(preview_cache.get('HIT001'), path)
+        self.assertIsNone(preview_cache.get('HIT001', source_mtime=time.time() + 10))
+
+        stats = preview_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertAlmostEqual(stats['hit_rate'], 1 / 3)
+        self.assertEqual(stats['bytes'], 300)
+
+    def test_evicts_least_recently_used(self):
+        """При превышении бюджета вытесняются давно не открытые превью"""
+        now = time.time()
+        old = self.put('OLD001', atime=now - 3000)
+        used = self.put('USE001', atime=now - 2000)
+        self.put('NEW001', atime=now - 1000)
+        # Открытие продлевает жизнь превью
+        preview_cache.get('USE001')
+
+        # 4 x 300 байт > 1000: вытесняется до 900 байт
+        self.put('NEW002')
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(used))
+        stats = preview_cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['bytes'], 900)
+
+    def test_removed_with_file(self):
+        """Превью удаляется вместе с файлом"""
+        file = File.objects.create(
+            file='uploads/DOC001.docx',
+            filename='DOC001.docx',
+            file_size=10,
+            code='DOC001',
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        path = self.put('DOC001')
+        file.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(preview_cache.stats()['bytes'], 0)
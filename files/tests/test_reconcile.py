@@ -0,0 +1,139 @@
+"""
+Тесты сверки media с базой данных
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import File
+from ..reconcile import diff, external_sort, reconcile_media
+from ..retention import purge_soft_deleted
+
+
+class ReconcileTestCase(TestCase):
+    """Тесты reconcile_media и purge_soft_deleted"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        cache.clear()
+
+    def touch(self, name, size=10):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def create(self, code, **kwargs):
+        file = File.objects.create(
+            file=f'uploads/{code}.txt',
+            filename=f'{code}.txt',
+            file_size=10,
+            code=code,
+            expires_at=timezone.now() + timedelta(hours=1),
+            **kwargs
+        )
+        self.touch(file.file.name)
+        if file.qr_code:
+            self.touch(file.qr_code.name)
+        return file
+
+    def test_external_sort(self):
+        """Внешняя сортировка со сбросом кусков на диск дает тот же порядок"""
+        lines = [f'uploads/{i % 37:03d}-{i}.txt' for i in range(200, 0, -1)]
+        self.assertEqual(list(external_sort(iter(lines), chunk_size=16)), sorted(lines))
+
+    def test_diff(self):
+        """Слияние находит расхождения в обе стороны"""
+        disk = iter(['a', 'b', 'd'])
+        db = iter(['b\tfile\t1\t0', 'c\tqr\t2\t0', 'c\tfile\t2\t0'])
+        self.assertEqual(
+            list(diff(disk, db)),
+            [('disk', 'a'), ('db', 'c', 'qr', 2, False), ('db', 'c', 'file', 2, False), ('disk', 'd')],
+        )
+
+    def test_dry_run_and_action(self):
+        """Пробный запуск только считает, рабочий удаляет сирот и битые записи"""
+        valid = self.create('VAL001')
+        broken = self.create('BRK001')
+        os.remove(os.path.join(self.media, broken.file.name))
+        permanent = self.create('PRM001', is_permanent=True)
+        os.remove(os.path.join(self.media, permanent.file.name))
+        orphan = self.touch('uploads/orphan.txt')
+        fresh = self.touch('uploads/fresh.txt')
+        page = self.touch('previews/pages/VAL001/1-800.webp')
+        os.utime(orphan, (0, 0))
+        os.utime(page, (0, 0))
+
+        report = reconcile_media(dry_run=True, grace_seconds=60)
+        self.assertEqual(report['disk_orphans'], 1)
+        self.assertEqual(report['missing_rows'], 1, report['samples'])
+        self.assertEqual(report['samples']['disk'], ['uploads/orphan.txt'])
+        self.assertTrue(os.path.exists(orphan))
+        self.assertTrue(File.objects.filter(pk=broken.pk).exists())
+
+        report = reconcile_media(dry_run=False, delete_orphans=True, grace_seconds=60)
+        self.assertEqual(report['purged'], 1)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(fresh))
+        # Изображения страниц принадлежат кешу превью
+        self.assertTrue(os.path.exists(page))
+        self.assertFalse(File.objects.filter(pk=broken.pk).exists())
+        self.assertTrue(File.objects.filter(pk=valid.pk).exists())
+        self.assertTrue(File.objects.filter(pk=permanent.pk).exists())
+        self.assertTrue(os.path.exists(os.path.join(self.media, valid.file.name)))
+
+    def test_purge_soft_deleted(self):
+        """Помеченные удаленными записи удаляются пачками вместе с файлами"""
+        for i in range(3):
+            self.create(f'DEL00{i}', is_deleted=True)
+        kept = self.create('KEEP01')
+
+        metrics = purge_soft_deleted(batch_size=2)
+
+        self.assertEqual(metrics['batches'], 2)
+        self.assertEqual(metrics['purged'], 3)
+        self.assertEqual(list(File.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'uploads/DEL000.txt')))
+
+    def test_command(self):
+        """Команда без --force в режиме просмотра ничего не удаляет, с --force удаляет"""
+        self.create('CMD001', is_deleted=True)
+        out = StringIO()
+        call_command('cleanup_deleted_files', dry_run=True, stdout=out)
+        self.assertIn('РЕЖИМ ПРОСМОТРА', out.getvalue())
+        self.assertEqual(File.objects.count(), 1)
+
+        call_command('cleanup_deleted_files', force=True, stdout=StringIO())
+        self.assertEqual(File.objects.count(), 0)
+
+    def test_command_keeps_orphans_by_default(self):
+        """Сироты на диске удаляются только с --delete-orphans; пробный запуск их перечисляет"""
+        orphan = self.touch('uploads/orphan.txt')
+        os.utime(orphan, (0, 0))
+
+        call_command('cleanup_deleted_files', force=True, stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+
+        out = StringIO()
+        call_command('cleanup_deleted_files', dry_run=True, delete_orphans=True, stdout=out)
+        self.assertIn('uploads/orphan.txt', out.getvalue())
+        self.assertTrue(os.path.exists(orphan))
+
+        call_command('cleanup_deleted_files', force=True, delete_orphans=True, stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
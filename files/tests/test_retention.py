@@ -0,0 +1,237 @@
+"""
+Тесты пакетной очистки истекших файлов
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import TempMediaMixin
+from ..models import File
+from ..preview_cache import preview_cache
+from ..expiry_scheduler import SCHEDULE_KEY, expiry_scheduler
+from ..retention import (
+    CHECKPOINT_KEY, IOBudget, expire_due, get_policy, last_run_metrics, purge_soft_deleted, run_retention,
+    sweep_expired,
+)
+from ..stats import get_stats, reconcile_stats
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class SweepExpiredTestCase(TestCase):
+    """Тесты sweep_expired"""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        cache.clear()
+
+    def touch(self, name, size=10):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def create(self, code, expired=True, **kwargs):
+        return File.objects.create(
+            file=f'uploads/{code}.pdf',
+            filename=f'{code}.pdf',
+            file_size=10,
+            code=code,
+            expires_at=timezone.now() + (timedelta(hours=-1) if expired else timedelta(hours=1)),
+            **kwargs
+        )
+
+    def test_removes_all_artifacts(self):
+        """Истекшие записи помечаются удаленными, с диска удаляются все их файлы"""
+        expired = self.create('EXP001', compressed_pdf='compressed_pdfs/EXP001.pdf')
+        paths = [
+            self.touch('uploads/EXP001.pdf', 100),
+            self.touch('compressed_pdfs/EXP001.pdf'),
+            self.touch('previews/EXP001.pdf'),
+        ]
+        if expired.qr_code:
+            paths.append(os.path.join(self.media, expired.qr_code.name))
+        alive_path = self.touch('uploads/LIVE01.pdf')
+        self.create('LIVE01', expired=False)
+        self.create('PERM01', is_permanent=True)
+
+        metrics = sweep_expired(batch_size=2, workers=2)
+
+        self.assertEqual(metrics['marked'], 1)
+        self.assertGreaterEqual(metrics['bytes_freed'], 120)
+        for path in paths:
+            self.assertFalse(os.path.exists(path), path)
+        self.assertTrue(os.path.exists(alive_path))
+        self.assertEqual(
+            set(File.objects.filter(is_deleted=True).values_list('code', flat=True)), {'EXP001'}
+        )
+        self.assertEqual(get_stats()['active_files'], 2)
+
+    def test_removes_previews_and_pages(self):
+        """Истечение удаляет превью и изображения страниц через кеш превью"""
+        self.create('PRV001')
+        produced = os.path.join(preview_cache.tempdir(), 'PRV001.pdf')
+        with open(produced, 'wb') as f:
+            f.write(b'x' * 50)
+        preview_cache.store('PRV001', produced)
+        page = preview_cache.store_page('PRV001', 1, 800, b'x' * 30)
+        self.assertEqual(preview_cache.stats()['bytes'], 80)
+
+        sweep_expired()
+
+        self.assertIsNone(preview_cache.get('PRV001'))
+        self.assertFalse(os.path.exists(page))
+        self.assertFalse(os.path.exists(preview_cache.page_dir('PRV001')))
+        self.assertEqual(preview_cache.stats()['bytes'], 0)
+
+    def test_batches_and_checkpoint(self):
+        """Прерванный по limit запуск продолжается с контрольной точки"""
+        for i in range(5):
+            self.create(f'BAT00{i}')
+
+        first = sweep_expired(batch_size=2, limit=2)
+        self.assertEqual(first['marked'], 2)
+        self.assertIsNotNone(cache.get(CHECKPOINT_KEY))
+
+        second = sweep_expired(batch_size=2)
+        self.assertEqual(second['marked'], 3)
+        self.assertEqual(second['batches'], 2)
+        self.assertIsNone(cache.get(CHECKPOINT_KEY))
+        self.assertFalse(File.objects.filter(is_deleted=False).exists())
+
+    def test_dry_run(self):
+        """Пробный запуск ничего не меняет"""
+        self.create('DRY001')
+        metrics = sweep_expired(dry_run=True)
+        self.assertEqual(metrics['rows'], 1)
+        self.assertEqual(metrics['marked'], 0)
+        self.assertFalse(File.objects.get(code='DRY001').is_deleted)
+
+    def test_run_retention(self):
+        """Политики выполняются по очереди, метрики запуска сохраняются в кеш"""
+        self.create('RUN001')
+        self.touch('uploads/RUN001.pdf')
+
+        result = run_retention(['expire', 'purge'], budget=IOBudget())
+
+        self.assertEqual(result['expire']['marked'], 1)
+        self.assertEqual(result['purge']['purged'], 1)
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(last_run_metrics('purge')['purged'], 1)
+        with self.assertRaises(ValueError):
+            get_policy('unknown')
+
+    def test_purge_keeps_totals(self):
+        """Удаление записей из БД не уменьшает общую статистику"""
+        self.create('OLD001', is_deleted=True)
+        recent = self.create('REC001', is_deleted=True)
+        File.objects.filter(pk=recent.pk).update(expires_at=timezone.now())
+        reconcile_stats()
+        before = get_stats()
+
+        metrics = purge_soft_deleted(expired_before=timezone.now() - timedelta(minutes=30))
+
+        self.assertEqual(metrics['purged'], 1)
+        self.assertEqual(list(File.objects.values_list('code', flat=True)), ['REC001'])
+        reconcile_stats()
+        self.assertEqual(get_stats()['total_files'], before['total_files'])
+
+
+class IOBudgetTestCase(TestCase):
+    """Тесты бюджета ввода-вывода"""
+
+    def test_unlimited(self):
+        """Без ограничений движок не ждет"""
+        self.assertEqual(IOBudget(0, 0).spend(10 ** 6, 10 ** 12), 0.0)
+
+    def test_debt_is_paid_with_sleep(self):
+        """Превышение бюджета оплачивается ожиданием по самому узкому ресурсу"""
+        sleeps = []
+        budget = IOBudget(ops_per_second=100, mb_per_second=1)
+        # В пределах секундного запаса ожидания нет
+        self.assertEqual(budget.spend(50, 0, sleep=sleeps.append), 0.0)
+        # 250 операций сверх запаса при 100 оп/с — 2,5 с
+        wait = budget.spend(300, 0, sleep=sleeps.append)
+        self.assertAlmostEqual(wait, 2.5, delta=0.1)
+        # 3 МБ при 1 МБ/с: долг по байтам больше долга по операциям
+        wait = IOBudget(1000, 1).spend(1, 3 * 1024 * 1024, sleep=sleeps.append)
+        self.assertAlmostEqual(wait, 2.0, delta=0.1)
+        self.assertEqual(len(sleeps), 2)
+
+
+@skipUnless(fakeredis, 'fakeredis не установлен')
+class ExpirySchedulerTestCase(TempMediaMixin, TestCase):
+    """Тесты удаления по расписанию в Redis"""
+
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('files.expiry_scheduler.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def create(self, code, expires_in, **kwargs):
+        # Расписание обновляется после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            return File.objects.create(
+                file=f'uploads/{code}.txt',
+                filename=f'{code}.txt',
+                file_size=10,
+                code=code,
+                expires_at=timezone.now() + expires_in,
+                **kwargs
+            )
+
+    def test_upload_schedules(self):
+        """Загрузка ставит файл в расписание, постоянный файл — нет"""
+        file = self.create('SCH001', timedelta(hours=1))
+        self.create('SCH002', timedelta(hours=1), is_permanent=True)
+        self.assertEqual(self.redis.zcard(SCHEDULE_KEY), 1)
+        self.assertEqual(self.redis.zscore(SCHEDULE_KEY, file.pk), file.expires_at.timestamp())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+        self.assertEqual(self.redis.zcard(SCHEDULE_KEY), 0)
+
+    def test_expire_due(self):
+        """Наступившие записи удаляются, продленные возвращаются в расписание"""
+        due = self.create('DUE001', timedelta(seconds=-1))
+        extended = self.create('EXT001', timedelta(seconds=-1))
+        later = self.create('LAT001', timedelta(hours=1))
+        File.objects.filter(pk=extended.pk).update(expires_at=timezone.now() + timedelta(hours=2))
+
+        metrics = expire_due()
+
+        self.assertEqual(metrics['marked'], 1)
+        self.assertTrue(File.objects.get(pk=due.pk).is_deleted)
+        self.assertFalse(File.objects.get(pk=extended.pk).is_deleted)
+        self.assertEqual(
+            {int(member) for member in self.redis.zrange(SCHEDULE_KEY, 0, -1)}, {extended.pk, later.pk}
+        )
+
+    def test_pop_due_is_exclusive(self):
+        """Запись достается только одному воркеру"""
+        file = self.create('POP001', timedelta(seconds=-1))
+        self.assertEqual(expiry_scheduler.pop_due(10), [file.pk])
+        self.assertEqual(expiry_scheduler.pop_due(10), [])
@@ -0,0 +1,70 @@
+"""
+Тесты индексированного поиска файлов
+"""
+
+from django.test import TestCase
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+
+from . import TempMediaMixin
+from ..models import File
+from ..pagination import KeysetPaginator
+from ..search import FTS_TABLE, fts_available, search_queryset
+
+
+class SearchTestCase(TempMediaMixin, TestCase):
+    """Тесты search_queryset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        for code, filename in [
+            ('REPORT', 'notes.txt'),
+            ('AAA001', 'annual report.pdf'),
+            ('AAA002', 'report-2024.xlsx'),
+            ('AAA003', 'photo.jpg'),
+        ]:
+            File.objects.create(
+                file=f'uploads/{filename}',
+                filename=filename,
+                file_size=10,
+                code=code,
+                session_id='search-session',
+                expires_at=now + timedelta(hours=1)
+            )
+
+    def search(self, query):
+        files = search_queryset(File.objects.filter(session_id='search-session'), query)
+        return [file.code for file in KeysetPaginator(files, 10, rank='match_rank').page()]
+
+    def test_ranking(self):
+        """Точный код, затем совпадение начала, затем подстрока"""
+        codes = self.search('report')
+        self.assertEqual(codes[0], 'REPORT')
+        self.assertEqual(codes[1], 'AAA002')
+        self.assertEqual(codes[2], 'AAA001')
+        self.assertNotIn('AAA003', codes)
+
+    def test_short_query(self):
+        """Запросы короче триграммы ищутся без индекса"""
+        self.assertEqual(set(self.search('jp')), {'AAA003'})
+
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при переименовании и удалении"""
+        file = File.objects.get(code='AAA003')
+        file.filename = 'holiday.png'
+        file.save()
+        self.assertEqual(self.search('holiday'), ['AAA003'])
+        self.assertEqual(self.search('photo'), [])
+
+        file.delete()
+        self.assertEqual(self.search('holiday'), [])
+
+    def test_uses_fts_on_sqlite(self):
+        """В SQLite поиск идет через таблицу FTS5"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 используется только в SQLite')
+        self.assertTrue(fts_available(connection))
+        sql = str(search_queryset(File.objects.all(), 'report').query)
+        self.assertIn(FTS_TABLE, sql)
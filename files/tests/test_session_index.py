@@ -0,0 +1,131 @@
+"""
+Тесты индекса файлов сессии в Redis
+"""
+
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import TempMediaMixin
+from ..models import File
+from ..session_index import session_files_page, session_index
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def create_file(code, session_id='sess-1', **kwargs):
+    kwargs.setdefault('expires_at', timezone.now() + timedelta(hours=24))
+    return File.objects.create(
+        file=f'uploads/{code}.txt',
+        filename=f'{code.lower()}.txt',
+        file_size=10,
+        code=code,
+        session_id=session_id,
+        **kwargs
+    )
+
+
+class SessionIndexFallbackTestCase(TempMediaMixin, TestCase):
+    """Без Redis списки читаются из БД"""
+
+    def test_no_redis(self):
+        create_file('FALL01')
+        self.assertIsNone(session_files_page('sess-1', None, 20))
+        session_index.add(File.objects.get(code='FALL01'))
+        session_index.remove('sess-1', 'FALL01')
+
+
+@skipUnless(fakeredis, 'fakeredis не установлен')
+class SessionIndexTestCase(TempMediaMixin, TestCase):
+    """Тесты индекса на fakeredis"""
+
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('files.session_index.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_rebuild_and_order(self):
+        """Индекс строится из БД при первом чтении; новые файлы идут первыми"""
+        now = timezone.now()
+        for i in range(5):
+            file = create_file(f'ORD00{i}')
+            File.objects.filter(pk=file.pk).update(created_at=now - timedelta(minutes=10 - i))
+        create_file('OTHER1', session_id='sess-2')
+        self.redis.flushall()
+
+        page = session_files_page('sess-1', None, 2)
+        self.assertEqual([card.code for card in page], ['ORD004', 'ORD003'])
+        self.assertEqual(page.total, 5)
+        self.assertTrue(page.has_next())
+
+        page = session_files_page('sess-1', page.next_cursor, 2)
+        self.assertEqual([card.code for card in page], ['ORD002', 'ORD001'])
+        self.assertEqual(page.number, 2)
+        self.assertTrue(page.has_previous())
+
+    def test_updates_on_save_and_delete(self):
+        """Загрузка, пометка удаления и удаление меняют индекс"""
+        session_files_page('sess-1', None, 20)
+        # Индекс обновляется после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            first = create_file('UPD001')
+            second = create_file('UPD002')
+        self.assertEqual({card.code for card in session_files_page('sess-1', None, 20)}, {'UPD001', 'UPD002'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.is_deleted = True
+            first.save()
+            second.delete()
+        self.assertEqual(session_files_page('sess-1', None, 20).total, 0)
+
+    def test_expired_trimmed(self):
+        """Истекшие файлы вычищаются при чтении"""
+        create_file('EXP001', expires_at=timezone.now() - timedelta(seconds=1))
+        create_file('EXP002')
+        page = session_files_page('sess-1', None, 20)
+        self.assertEqual([card.code for card in page], ['EXP002'])
+        self.assertEqual(self.redis.zcard('filehost:session:sess-1:expiry'), 1)
+
+    def test_view_uses_index(self):
+        """Страница «Мои файлы» отдает файлы из индекса"""
+        session_id = 'a' * 64
+        create_file('VIEW01', session_id=session_id)
+        self.client.cookies['anonymous_session_id'] = session_id
+
+        response = self.client.get(reverse('files:recent_files'))
+        self.assertContains(response, 'VIEW01')
+
+    def test_add_during_rebuild(self):
+        """Загрузка между выборкой из БД и записью индекса не теряется"""
+        from django.db.models.query import QuerySet
+
+        create_file('RACE01')
+        self.redis.flushall()
+        original = QuerySet.iterator
+
+        def iterator_then_upload(queryset, *args, **kwargs):
+            rows = list(original(queryset, *args, **kwargs))
+            if not File.objects.filter(code='RACE02').exists():
+                with self.captureOnCommitCallbacks(execute=True):
+                    create_file('RACE02')
+            return iter(rows)
+
+        with mock.patch.object(QuerySet, 'iterator', iterator_then_upload):
+            # Перестроение отменено — страница читается из БД
+            self.assertIsNone(session_files_page('sess-1', None, 20))
+        self.assertFalse(self.redis.exists('filehost:session:sess-1:ready'))
+
+        page = session_files_page('sess-1', None, 20)
+        self.assertEqual({card.code for card in page}, {'RACE01', 'RACE02'})
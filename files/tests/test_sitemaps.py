@@ -0,0 +1,170 @@
+"""
+Тесты потоковой карты сайта
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import TempMediaMixin
+from ..models import File
+from ..sitemap_journal import shard_of
+from ..sitemaps import build_sitemaps, expired_shards
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2, SITEMAP_ROOT='/nonexistent-sitemaps')
+class SitemapTestCase(TempMediaMixin, TestCase):
+    """Тесты индекса и частей sitemap"""
+
+    def setUp(self):
+        cache.clear()
+        self.files = []
+        for i in range(5):
+            self.files.append(File.objects.create(
+                file=f'uploads/map{i}.txt',
+                filename=f'map{i}.txt',
+                file_size=10,
+                code=f'MAP00{i}',
+                is_protected=(i == 1),
+                expires_at=timezone.now() + timedelta(hours=24)
+            ))
+
+    def tearDown(self):
+        cache.clear()
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_index_lists_shards(self):
+        """Индекс ссылается на статические страницы и непустые части"""
+        response = self.client.get('/sitemap.xml')
+        self.assertContains(response, '<sitemapindex')
+        self.assertContains(response, '/sitemap-pages.xml')
+        shards = sorted({file.pk // 2 for file in self.files})
+        for shard in shards:
+            self.assertContains(response, f'/sitemap-{shard}.xml')
+
+    def test_shard_streams_public_files(self):
+        """Часть отдается потоком и содержит только публичные файлы своего диапазона"""
+        public = self.files[0]
+        response = self.client.get(f'/sitemap-{public.pk // 2}.xml')
+        self.assertTrue(response.streaming)
+        xml = self.content(response)
+        self.assertIn(f'/{public.code}/detail/', xml)
+        self.assertNotIn('MAP001', xml)
+        self.assertNotIn('MAP004', xml)
+        self.assertTrue(xml.rstrip().endswith('</urlset>'))
+
+    def test_pages_and_unknown_section(self):
+        """Статическая часть и 404 для неизвестной"""
+        self.assertIn('/recent/', self.content(self.client.get('/sitemap-pages.xml')))
+        self.assertEqual(self.client.get('/sitemap-foo.xml').status_code, 404)
+
+    def test_command_writes_files(self):
+        """Команда пишет индекс и части в одну директорию"""
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_sitemap', output_dir=directory, stdout=open(os.devnull, 'w'))
+            names = sorted(os.listdir(directory))
+            self.assertIn('sitemap.xml', names)
+            self.assertIn('sitemap-pages.xml', names)
+            self.assertFalse([name for name in names if name.endswith('.tmp')])
+            with open(os.path.join(directory, 'sitemap.xml'), encoding='utf-8') as f:
+                self.assertIn('<sitemapindex', f.read())
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2)
+class PrebuiltSitemapTestCase(TempMediaMixin, TestCase):
+    """Тесты готовых файлов и инкрементальной сборки"""
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.files = [
+            File.objects.create(
+                file=f'uploads/pre{i}.txt',
+                filename=f'pre{i}.txt',
+                file_size=10,
+                code=f'PRE00{i}',
+                expires_at=timezone.now() + timedelta(hours=24)
+            )
+            for i in range(4)
+        ]
+
+    def test_served_without_queries(self):
+        """Собранный индекс отдается без запросов к БД и с условным GET"""
+        build_sitemaps(self.directory, domain='example.com', full=True)
+        with override_settings(SITEMAP_ROOT=self.directory):
+            with self.assertNumQueries(0):
+                response = self.client.get('/sitemap.xml')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+            response = self.client.get('/sitemap.xml', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_unknown_shard_after_build(self):
+        """После сборки часть, которой нет в манифесте, — 404 без запросов к БД"""
+        build_sitemaps(self.directory, domain='example.com', full=True)
+        with override_settings(SITEMAP_ROOT=self.directory):
+            with self.assertNumQueries(0):
+                response = self.client.get('/sitemap-999999.xml')
+            self.assertEqual(response.status_code, 404)
+
+    def test_incremental_rebuild(self):
+        """Пересобираются только части из журнала; опустевшая часть убирается из индекса"""
+        build_sitemaps(self.directory, domain='example.com', full=True)
+        # Среди четырех подряд идущих id есть пара из одной части (размер части 2)
+        start = 0 if self.files[0].pk % 2 == 0 else 1
+        first, second = self.files[start:start + 2]
+        shard = first.pk // 2
+
+        first.is_protected = True
+        first.save()
+        with mock.patch('files.sitemaps.take_dirty', return_value={shard}):
+            result = build_sitemaps(self.directory, domain='example.com')
+        self.assertFalse(result['full'])
+        self.assertEqual(result['rebuilt'], 1)
+        with open(os.path.join(self.directory, f'sitemap-{shard}.xml'), encoding='utf-8') as f:
+            xml = f.read()
+        self.assertNotIn(first.code, xml)
+        self.assertIn(second.code, xml)
+
+        # Часть, в которой не осталось публичных файлов, убирается из индекса
+        second.delete()
+        with mock.patch('files.sitemaps.take_dirty', return_value={shard}):
+            build_sitemaps(self.directory, domain='example.com')
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'sitemap-{shard}.xml')))
+        with open(os.path.join(self.directory, 'sitemap.xml'), encoding='utf-8') as f:
+            self.assertNotIn(f'sitemap-{shard}.xml', f.read())
+
+    def test_expired_shards_use_index(self):
+        """Истекшие части ищутся по частичному индексу сроков истечения"""
+        now = timezone.now()
+        expiring, deleted, permanent = self.files[:3]
+        File.objects.filter(pk=expiring.pk).update(expires_at=now - timedelta(minutes=1))
+        File.objects.filter(pk=deleted.pk).update(expires_at=now - timedelta(minutes=1), is_deleted=True)
+        File.objects.filter(pk=permanent.pk).update(expires_at=now - timedelta(minutes=1), is_permanent=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            shards = expired_shards(now - timedelta(hours=1), now)
+        self.assertEqual(shards, {shard_of(expiring.pk)})
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[-1]['sql'])
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('files_file_expiry_idx', plan)
+
+    def test_without_journal_full_rebuild(self):
+        """Без журнала изменений (нет Redis) сборка всегда полная"""
+        build_sitemaps(self.directory, domain='example.com')
+        self.assertTrue(build_sitemaps(self.directory, domain='example.com')['full'])
@@ -0,0 +1,101 @@
+"""
+Тесты инкрементальной глобальной статистики
+"""
+
+from django.test import TestCase, Client
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from . import TempMediaMixin
+from ..models import File, SiteStats
+from ..stats import get_stats, pending_downloads, reconcile_stats
+
+
+class SiteStatsTestCase(TempMediaMixin, TestCase):
+    """Тесты счетчиков главной страницы"""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_file(self, code, **kwargs):
+        return File.objects.create(
+            file=f'uploads/{code}.txt',
+            filename=f'{code}.txt',
+            file_size=10,
+            code=code,
+            expires_at=timezone.now() + timedelta(hours=24),
+            **kwargs
+        )
+
+    def test_counters_follow_file_lifecycle(self):
+        """Загрузка, скачивание, защита, истечение и удаление меняют счетчики"""
+        first = self.create_file('STA001')
+        second = self.create_file('STA002', is_protected=True)
+        self.assertEqual(get_stats(), {
+            'total_files': 2,
+            'total_downloads': 0,
+            'active_files': 2,
+            'protected_files': 1,
+            'today_files': 2,
+        })
+
+        File.objects.get(pk=first.pk).increment_download_count()
+        first = File.objects.get(pk=first.pk)
+        first.is_protected = True
+        first.save()
+        self.assertEqual(get_stats()['total_downloads'], 1)
+        self.assertEqual(get_stats()['protected_files'], 2)
+
+        # Истечение: файл помечен задачей очистки
+        second = File.objects.get(pk=second.pk)
+        second.is_deleted = True
+        second.save()
+        # Удаление записи: всего файлов не уменьшается
+        File.objects.get(pk=first.pk).delete()
+
+        stats = get_stats()
+        self.assertEqual(stats['total_files'], 2)
+        self.assertEqual(stats['active_files'], 0)
+        self.assertEqual(stats['protected_files'], 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Сверка исправляет расхождение с таблицей файлов"""
+        self.create_file('STA003')
+        SiteStats.objects.filter(pk=1).update(active_files=42, today_files=7)
+
+        reconcile_stats()
+        stats = get_stats()
+        self.assertEqual(stats['active_files'], 1)
+        self.assertEqual(stats['today_files'], 1)
+
+    def test_downloads_buffered_until_reconcile(self):
+        """Скачивание не обновляет строку статистики: его переносит сверка"""
+        file_obj = self.create_file('STA005')
+        reconcile_stats()
+
+        file_obj = File.objects.get(pk=file_obj.pk)
+        with self.assertNumQueries(1):
+            file_obj.increment_download_count()
+        File.objects.get(pk=file_obj.pk).increment_download_count()
+        self.assertEqual(SiteStats.objects.get(pk=1).total_downloads, 0)
+        self.assertEqual(get_stats()['total_downloads'], 2)
+
+        reconcile_stats()
+        self.assertEqual(SiteStats.objects.get(pk=1).total_downloads, 2)
+        self.assertEqual(pending_downloads(), 0)
+        self.assertEqual(get_stats()['total_downloads'], 2)
+
+    def test_home_reads_single_row(self):
+        """Главная страница получает всю статистику одним запросом"""
+        self.create_file('STA004')
+        client = Client()
+        client.get('/')
+        with self.assertNumQueries(1):
+            get_stats()
+        response = client.get('/')
+        self.assertEqual(response.context['active_files'], 1)
+        self.assertEqual(response.context['total_files'], 1)
@@ -0,0 +1,109 @@
+"""
+Тесты пакетного API статуса файлов
+"""
+
+import json
+
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from datetime import timedelta
+
+from . import TempMediaMixin
+from ..models import File
+
+
+class FilesStatusTestCase(TempMediaMixin, TestCase):
+    """Тесты /api/files/status/"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        File.objects.create(
+            file='uploads/report.pdf',
+            filename='report.pdf',
+            file_size=2048,
+            code='PUB001',
+            download_count=3,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        File.objects.create(
+            file='uploads/secret.txt',
+            filename='secret.txt',
+            file_size=10,
+            code='SEC001',
+            password=make_password('secret'),
+            is_protected=True,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_many_codes(self):
+        """Статус нескольких кодов одним запросом"""
+        response = self.client.get('/api/files/status/', {'codes': 'pub001,SEC001,NOPE01'})
+        self.assertEqual(response.status_code, 200)
+        files = response.json()['files']
+
+        self.assertEqual(files['PUB001']['size'], 2048)
+        self.assertEqual(files['PUB001']['type'], 'document')
+        self.assertEqual(files['PUB001']['downloads'], 3)
+        self.assertFalse(files['PUB001']['expired'])
+        self.assertEqual(files['SEC001'], {
+            'exists': True,
+            'expired': False,
+            'expires_at': files['SEC001']['expires_at'],
+            'protected': True,
+        })
+        self.assertEqual(files['NOPE01'], {'exists': False})
+
+    def test_cached_metadata_skips_database(self):
+        """Повторный запрос обслуживается из кеша метаданных"""
+        self.client.get('/api/files/status/', {'codes': 'PUB001,NOPE01'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/files/status/', {'codes': 'PUB001,NOPE01'})
+
+    def test_post_json(self):
+        """POST с JSON-списком кодов"""
+        response = self.client.post(
+            '/api/files/status',
+            data=json.dumps({'codes': ['PUB001']}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['files']['PUB001']['exists'])
+
+    def test_etag(self):
+        """Неизменившийся ответ отдается как 304"""
+        response = self.client.get('/api/files/status/', {'codes': 'PUB001'})
+        etag = response['ETag']
+        response = self.client.get('/api/files/status/', {'codes': 'PUB001'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Скачивание меняет статус и ETag
+        File.objects.get(code='PUB001').increment_download_count()
+        response = self.client.get('/api/files/status/', {'codes': 'PUB001'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['files']['PUB001']['downloads'], 4)
+
+    @override_settings(FILE_STATUS_MAX_CODES=2)
+    def test_too_many_codes(self):
+        """Слишком длинный список кодов отклоняется"""
+        response = self.client.get('/api/files/status/', {'codes': 'A,B,C'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CODE_MISS_RATE_LIMIT='5/m')
+    def test_misses_share_code_miss_limit(self):
+        """Несуществующие коды в пакете расходуют тот же лимит промахов, что и /<код>/"""
+        response = self.client.get('/api/files/status/', {'codes': 'PUB001,MISS01,MISS02,MISS03'})
+        self.assertEqual(response.status_code, 200)
+
+        # Пакет, выходящий за остаток лимита, не получает ответа вовсе
+        response = self.client.get('/api/files/status/', {'codes': 'MISS04,MISS05,MISS06'})
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('files', response.json())
+
+        # Лимит общий с маршрутом /<код>/; исчерпавший его IP отсекается сразу
+        self.assertEqual(self.client.get('/MISS07/').status_code, 429)
+        self.assertEqual(self.client.get('/api/files/status/', {'codes': 'PUB001'}).status_code, 429)
@@ -19,6 +19,10 @@ urlpatterns = [
     # Проверка доступности кода (ВАЖНО: должен быть перед <str:code>/)
     path('api/check-code/', views.check_code_availability, name='check_code_availability'),
     
+    # Пакетный статус файлов по списку кодов
+    path('api/files/status/', views.files_status, name='files_status'),
+    path('api/files/status', views.files_status),
+    
     # Проверка поддержки предпросмотра
     path('api/preview-support/', views.check_preview_support, name='check_preview_support'),
     
@@ -34,6 +38,9 @@ urlpatterns = [
     # Просмотр файла (inline)
     path('<str:code>/view/', views.view_file, name='view_file'),
     
+    # Изображение страницы PDF (?w=ширина)
+    path('<str:code>/page/<int:page>.webp', views.pdf_page, name='pdf_page'),
+    
     # Редактирование файла
     path('<str:code>/edit/', views.edit_file, name='edit_file'),
     
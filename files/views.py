@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, Http404, JsonResponse, FileResponse
+from django.http import HttpResponse, HttpResponseNotFound, Http404, JsonResponse, FileResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.utils.translation import gettext as _
 from django.contrib.auth.hashers import make_password
@@ -7,14 +7,14 @@ from django.utils import timezone
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum
 from django.urls import reverse
 from django_ratelimit.decorators import ratelimit
+from django_ratelimit.core import is_ratelimited
 from django.contrib.sitemaps import Sitemap
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.cache import cache
-from django.core.files.base import ContentFile
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 import random
 import string
 from datetime import timedelta
@@ -22,10 +22,26 @@ import os
 import subprocess
 import shutil
 import mimetypes
+import hashlib
+import json
+import logging
+import time
 
 from .models import File
+from .code_index import code_index
+from .metadata import get_metadata_many, invalidate_metadata
+from .stats import get_stats
+from .pagination import KeysetPaginator
+from .session_index import session_files_page
+from .search import search_queryset
+from .sitemaps import iter_index, iter_section, list_shards, load_manifest, sitemap_domain
+from .cards import CARD_FIELDS, pack_cards, unpack_cards
+from .caching import LOCK_POLL_SECONDS, TAG_SITEMAP, TAG_STATS, acquire_lock, cached_compute, release_lock, session_tag, versioned_key
 from .forms import FileUploadForm, PasswordForm, FileEditForm
-from .pdf_utils import compress_pdf, should_compress_pdf
+from .pdf_utils import compress_file_pdf, pdf_page_count, render_page_image, should_compress_pdf
+from .preview_cache import preview_cache
+
+logger = logging.getLogger(__name__)
 
 
 def generate_unique_code():
@@ -97,28 +113,18 @@ def home(request):
             if file_instance.filename.lower().endswith('.pdf'):
                 try:
                     if should_compress_pdf(file_instance.file.path, max_size_mb=10):
-                        success, compressed_path, compressed_size = compress_pdf(
-                            file_instance.file.path,
+                        # Сжатый PDF пишется прямо в хранилище (атомарный rename).
+                        # В запросе — один процесс и бюджет меньше таймаута gunicorn:
+                        # пул процессов в синхронном воркере был бы убит вместе с ним
+                        compressed_size = compress_file_pdf(
+                            file_instance,
                             quality=75,
-                            max_size_mb=10
+                            max_size_mb=10,
+                            workers=1,
+                            time_budget=settings.PDF_COMPRESS_REQUEST_TIME_BUDGET,
                         )
                         
-                        if success and compressed_path and compressed_size:
-                            # Сохраняем сжатую версию
-                            with open(compressed_path, 'rb') as f:
-                                file_instance.compressed_pdf.save(
-                                    f"compressed_{file_instance.filename}",
-                                    ContentFile(f.read()),
-                                    save=True
-                                )
-                            
-                            file_instance.compressed_pdf_size = compressed_size
-                            file_instance.save(update_fields=['compressed_pdf', 'compressed_pdf_size'])
-                            
-                            # Удаляем временный файл
-                            if compressed_path != file_instance.file.path:
-                                os.remove(compressed_path)
-                            
+                        if compressed_size:
                             # Логируем успешное сжатие
                             import logging
                             logger = logging.getLogger(__name__)
@@ -172,57 +178,35 @@ def home(request):
     # Показываем только файлы текущего пользователя (если есть session_id)
     if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
         # Кешируем недавние файлы на 2 минуты
-        cache_key = f'recent_files_{request.anonymous_session_id}'
-        recent_files = cache.get(cache_key)
-        
-        if recent_files is None:
-            recent_files = list(File.objects.filter(
-                session_id=request.anonymous_session_id,
-                expires_at__gt=timezone.now(),
-                is_deleted=False
-            ).order_by('-created_at')[:3])
-            cache.set(cache_key, recent_files, 120)  # 2 минуты
+        session_id = request.anonymous_session_id
+        session_page = session_files_page(session_id, None, 3)
+        if session_page is not None:
+            recent_files = session_page.object_list
+        else:
+            recent_files = unpack_cards(cached_compute(
+                versioned_key(f'recent_files_{session_id}', session_tag(session_id)),
+                120,
+                lambda: pack_cards(File.objects.filter(
+                    session_id=session_id,
+                    expires_at__gt=timezone.now(),
+                    is_deleted=False
+                ).only(*CARD_FIELDS).order_by('-created_at')[:3])
+            ))
     else:
         # Если session_id нет, показываем пустой список
         recent_files = []
     
-    # Статистика для главной страницы (с кешированием)
-    
-    # Кешируем статистику на 5 минут
-    cache_key = f'home_stats_{request.anonymous_session_id or "anonymous"}'
-    cached_stats = cache.get(cache_key)
-    
-    if cached_stats is None:
-        total_files = File.objects.count()  # Все файлы (включая удаленные)
-        total_downloads = File.objects.aggregate(Sum('download_count')).get('download_count__sum') or 0
-        
-        cached_stats = {
-            'total_files': total_files,
-            'total_downloads': total_downloads,
-        }
-        cache.set(cache_key, cached_stats, 300)  # 5 минут
-    else:
-        total_files = cached_stats['total_files']
-        total_downloads = cached_stats['total_downloads']
-    active_files = File.objects.filter(expires_at__gt=timezone.now(), is_deleted=False).count()
-    protected_files = File.objects.filter(is_protected=True, expires_at__gt=timezone.now(), is_deleted=False).count()
-    
-    # Количество загруженных файлов за сегодня
-    today = timezone.now().date()
-    today_files = File.objects.filter(
-        created_at__date=today
-    ).count()
+    # Статистика для главной страницы: одна строка, поддерживаемая инкрементально
+    site_stats = cached_compute(
+        versioned_key('home_stats', TAG_STATS), settings.HOME_STATS_CACHE_SECONDS, get_stats
+    )
 
     context = {
         'form': form,
         'recent_files': recent_files,
         'max_file_size_mb': settings.MAX_FILE_SIZE // (1024 * 1024),
         'expiry_hours': settings.FILE_EXPIRY_HOURS,
-        'total_files': total_files,
-        'total_downloads': total_downloads,
-        'active_files': active_files,
-        'protected_files': protected_files,
-        'today_files': today_files,
+        **site_stats,
     }
     
     return render(request, 'files/home.html', context)
@@ -283,6 +267,17 @@ def file_detail(request, code):
         'file_url': request.build_absolute_uri(reverse('files:file_detail', kwargs={'code': file_instance.code})),
     }
     
+    # Постраничный предпросмотр PDF: первые страницы сразу, остальные лениво
+    if file_instance.filename.lower().endswith('.pdf'):
+        page_count = _pdf_page_count(file_instance)
+        if page_count:
+            context.update({
+                'page_count': page_count,
+                'pdf_pages': range(1, min(page_count, settings.PDF_PAGE_PREVIEW_LIMIT) + 1),
+                'pdf_page_eager': settings.PDF_PAGE_EAGER,
+                'pdf_page_width': settings.PDF_PAGE_DEFAULT_WIDTH,
+            })
+    
     return render(request, 'files/file_detail.html', context)
 
 
@@ -404,41 +399,44 @@ def view_file(request, code):
             response['Content-Type'] = 'application/octet-stream'
             return response
 
-    # Для офисных форматов — пробуем конвертировать в PDF (кэшируем)
+    # Для офисных форматов — пробуем конвертировать в PDF (кеш превью с вытеснением)
     if ext in doc_like_exts:
-        previews_dir = os.path.join(settings.MEDIA_ROOT, 'previews')
-        os.makedirs(previews_dir, exist_ok=True)
-        preview_pdf_path = os.path.join(previews_dir, f'{file_instance.code}.pdf')
-
         # Нужна повторная конвертация, если превью нет или исходник новее
-        need_convert = True
-        if os.path.exists(preview_pdf_path):
-            try:
-                src_mtime = os.path.getmtime(file_instance.file.path)
-                pdf_mtime = os.path.getmtime(preview_pdf_path)
-                need_convert = pdf_mtime < src_mtime
-            except Exception:
-                need_convert = True
+        try:
+            src_mtime = os.path.getmtime(file_instance.file.path)
+        except Exception:
+            src_mtime = None
+        preview_pdf_path = preview_cache.get(file_instance.code, src_mtime)
 
-        if need_convert:
+        if preview_pdf_path is None:
             libreoffice = shutil.which('libreoffice') or shutil.which('soffice')
             if not libreoffice:
                 # Нет LibreOffice — fallback: отдаём оригинал на скачивание
                 return redirect('files:download_file', code=file_instance.code)
+            # LibreOffice называет результат по имени исходника, поэтому конвертируем
+            # во временный каталог и атомарно переносим в кеш под кодом файла
+            convert_dir = preview_cache.tempdir()
             try:
                 # Конвертируем через LibreOffice в headless режиме
                 subprocess.check_call([
                     libreoffice,
                     '--headless',
                     '--convert-to', 'pdf',
-                    '--outdir', previews_dir,
+                    '--outdir', convert_dir,
                     file_instance.file.path,
                 ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                produced = os.path.join(
+                    convert_dir, os.path.splitext(os.path.basename(file_instance.file.path))[0] + '.pdf'
+                )
+                if os.path.exists(produced):
+                    preview_pdf_path = preview_cache.store(file_instance.code, produced)
             except subprocess.CalledProcessError:
                 return redirect('files:download_file', code=file_instance.code)
+            finally:
+                shutil.rmtree(convert_dir, ignore_errors=True)
 
         # Отдаём PDF inline
-        if os.path.exists(preview_pdf_path):
+        if preview_pdf_path and os.path.exists(preview_pdf_path):
             preview_stream = open(preview_pdf_path, 'rb')
             response = FileResponse(preview_stream, as_attachment=False, filename=os.path.basename(preview_pdf_path))
             response['Content-Type'] = 'application/pdf'
@@ -461,6 +459,116 @@ def view_file(request, code):
     return response
 
 
+# Сколько ждать, пока страницу рендерит другой воркер, прежде чем рендерить самим
+PAGE_LOCK_WAIT_SECONDS = 10
+
+
+def _page_width(value):
+    """Запрошенная ширина, округленная вверх до допустимой (ограничивает число вариантов в кеше)"""
+    widths = settings.PDF_PAGE_WIDTHS
+    try:
+        requested = int(value)
+    except (TypeError, ValueError):
+        return settings.PDF_PAGE_DEFAULT_WIDTH
+    return next((width for width in widths if width >= requested), widths[-1])
+
+
+def _render_pdf_page(file_instance, page, width):
+    """
+    Путь к изображению страницы в кеше превью; None — такой страницы нет.
+    Страницу рендерит только один воркер, остальные ждут его результат.
+    """
+    source = file_instance.file.path
+    src_mtime = os.path.getmtime(source)
+    path = preview_cache.get_page(file_instance.code, page, width, src_mtime)
+    if path:
+        return path
+
+    def render():
+        data = render_page_image(source, page, width, quality=settings.PDF_PAGE_QUALITY)
+        if data is None:
+            return None
+        return preview_cache.store_page(file_instance.code, page, width, data)
+
+    lock = f'pdf_page:{file_instance.code}:{page}:{width}'
+    if acquire_lock(lock, 60):
+        try:
+            return render()
+        finally:
+            release_lock(lock)
+
+    path = preview_cache.page_path(file_instance.code, page, width)
+    deadline = time.monotonic() + PAGE_LOCK_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_SECONDS)
+        if os.path.exists(path):
+            return path
+
+    logger.warning(f"Не дождались рендера страницы {page} файла {file_instance.code}, рендерим без блокировки")
+    return render()
+
+
+def _pdf_page_count(file_instance):
+    """Число страниц PDF (кешируется по коду и времени изменения файла)"""
+    try:
+        src_mtime = int(os.path.getmtime(file_instance.file.path))
+    except OSError:
+        return None
+    key = f'pdf_pages:{file_instance.code}:{src_mtime}'
+    count = cache.get(key)
+    if count is None:
+        count = pdf_page_count(file_instance.file.path)
+        if count is not None:
+            cache.set(key, count, 24 * 3600)
+    return count
+
+
+@ratelimit(key='ip', rate='120/m', method=['GET'])
+def pdf_page(request, code, page):
+    """
+    Изображение одной страницы PDF в WebP (/<код>/page/<n>.webp?w=<ширина>).
+    Браузер показывает первые страницы, не скачивая документ целиком.
+    """
+    code = code.upper().strip()
+    file_instance = File.objects.filter(code__iexact=code).first()
+    # Это src картинки — HTML-страницы ошибок не нужны, хватает статуса
+    if file_instance is None or file_instance.is_deleted:
+        return HttpResponseNotFound()
+    if not file_instance.is_permanent and file_instance.is_expired():
+        return HttpResponseNotFound()
+    if not file_instance.filename.lower().endswith('.pdf'):
+        return HttpResponseNotFound()
+
+    if file_instance.is_protected:
+        authorized = request.session.get('authorized_files', {})
+        if not authorized.get(file_instance.code):
+            return HttpResponse(status=403)
+
+    width = _page_width(request.GET.get('w'))
+    # Код может быть выдан заново, поэтому в ETag входит id записи
+    etag = f'"{file_instance.pk:x}-{page}-{width}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            path = _render_pdf_page(file_instance, page, width)
+        except Exception as e:
+            logger.error(f"Ошибка рендера страницы {page} файла {file_instance.code}: {e}")
+            return HttpResponse(status=503)
+        if path is None:
+            return HttpResponseNotFound()
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+
+    response['ETag'] = etag
+    if file_instance.is_protected:
+        response['Cache-Control'] = 'private, max-age=3600'
+    elif request.GET.get('v') == str(file_instance.pk):
+        # URL со страницы файла содержит id записи — содержимое по нему не меняется
+        response['Cache-Control'] = f'public, max-age={settings.PDF_PAGE_CACHE_SECONDS}, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+
 def edit_file(request, code):
     """
     Редактирование информации о файле.
@@ -486,6 +594,8 @@ def edit_file(request, code):
             # Обновляем код если указан новый
             new_code = form.cleaned_data.get('new_code')
             if new_code:
+                # Старый код больше не указывает на файл
+                invalidate_metadata(file_instance.code)
                 # Нормализуем код (верхний регистр, убираем пробелы)
                 file_instance.code = new_code.upper().strip()
                 file_instance.generate_qr_code()  # Перегенерируем QR код
@@ -557,14 +667,17 @@ def delete_file(request, code):
 def check_code_availability(request):
     """
     Проверка доступности кода для файла.
+    Вызывается на каждое нажатие клавиши, поэтому обслуживается в обход
+    сессионных middleware (см. SESSIONLESS_PATHS).
     """
-    code = request.GET.get('code', '').strip()
+    # Коды хранятся в верхнем регистре — сравниваем канонический вид
+    code = request.GET.get('code', '').upper().strip()
     
     if not code:
         return JsonResponse({'available': False, 'error': _('Код не указан')})
     
-    # Проверяем, не занят ли код
-    is_occupied = File.objects.filter(code=code).exists()
+    # Проверяем, не занят ли код (множество занятых кодов в Redis, БД только для подтверждения)
+    is_occupied = not code_index.is_available(code)
     
     return JsonResponse({
         'available': not is_occupied,
@@ -590,6 +703,119 @@ def check_preview_support(request):
     })
 
 
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@ratelimit(key='ip', rate='60/m', method=['GET', 'POST'])
+def files_status(request):
+    """
+    Пакетный статус файлов по списку кодов (для ботов и страницы «Мои файлы»).
+    
+    Коды передаются в ?codes=A,B,C (или повторяющимся ?code=), а в POST —
+    в JSON {"codes": [...]} или в поле формы codes. Ответ собирается из кеша
+    метаданных и одного запроса с IN; ETag считается по всему ответу.
+    """
+    codes = []
+    if request.method == 'POST' and request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        raw_codes = payload.get('codes') if isinstance(payload, dict) else None
+        if not isinstance(raw_codes, list):
+            return JsonResponse({'success': False, 'error': 'codes must be a list'}, status=400)
+        codes = [str(code) for code in raw_codes]
+    else:
+        params = request.POST if request.method == 'POST' else request.GET
+        for value in params.getlist('codes'):
+            codes.extend(value.split(','))
+        codes.extend(params.getlist('code'))
+    
+    codes = list(dict.fromkeys(code.upper().strip() for code in codes if code.strip()))
+    if not codes:
+        return JsonResponse({'success': False, 'error': _('Код не указан')}, status=400)
+    if len(codes) > settings.FILE_STATUS_MAX_CODES:
+        return JsonResponse({
+            'success': False,
+            'error': f'Too many codes (max {settings.FILE_STATUS_MAX_CODES})',
+        }, status=400)
+    
+    # Промахи учитываются тем же лимитом, что и на /<код>/, иначе пакетный
+    # запрос позволял бы перебирать коды в сотни раз быстрее
+    if is_ratelimited(request, group=CODE_MISS_GROUP, key='ip', rate=settings.CODE_MISS_RATE_LIMIT):
+        return JsonResponse({'success': False, 'error': 'Too many requests'}, status=429)
+    
+    snapshots = get_metadata_many(codes)
+    now = timezone.now().timestamp()
+    files = {}
+    for code in codes:
+        snapshot = snapshots.get(code)
+        if not snapshot or snapshot['deleted']:
+            files[code] = {'exists': False}
+            continue
+        
+        expired = not snapshot['permanent'] and snapshot['expires_at'] < now
+        status = {
+            'exists': True,
+            'expired': expired,
+            'expires_at': None if snapshot['permanent'] else int(snapshot['expires_at']),
+            'protected': snapshot['protected'],
+        }
+        # Для защищенных файлов наружу отдаем только факт существования и срок
+        if not snapshot['protected']:
+            status.update({
+                'size': snapshot['size'],
+                'type': snapshot['type'],
+                'downloads': snapshot['downloads'],
+                'state': 'compressed' if snapshot['compressed_size'] else 'ready',
+            })
+        files[code] = status
+    
+    # Каждый несуществующий код — отдельный промах; исчерпавший лимит
+    # запрос не получает ни одного ответа
+    for code, status in files.items():
+        if status['exists']:
+            continue
+        if is_ratelimited(request, group=CODE_MISS_GROUP, key='ip', rate=settings.CODE_MISS_RATE_LIMIT, increment=True):
+            return JsonResponse({'success': False, 'error': 'Too many requests'}, status=429)
+    
+    body = json.dumps({'success': True, 'files': files}, separators=(',', ':'), sort_keys=True)
+    etag = '"%s"' % hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+    
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    
+    # Клиент, у которого ответ не изменился, получает 304 без тела
+    if request.method == 'GET':
+        return get_conditional_response(request, etag=etag, response=response)
+    return response
+
+
+# Минимальный ответ для несуществующих кодов: без шаблонов и обращений к БД
+CODE_MISS_BODY = (
+    b'<!DOCTYPE html><html><head><meta charset="utf-8"><title>404</title></head>'
+    b'<body><h1>404</h1><p><a href="/">0123.ru</a></p></body></html>'
+)
+CODE_MISS_GROUP = 'files.code_miss'
+
+
+def _code_miss_response(request):
+    """
+    Ответ на промах по коду. Каждый промах учитывается в rate limiter по IP,
+    чтобы сканеры и перебор кодов быстро упирались в лимит.
+    """
+    limited = is_ratelimited(
+        request,
+        group=CODE_MISS_GROUP,
+        key='ip',
+        rate=settings.CODE_MISS_RATE_LIMIT,
+        increment=True,
+    )
+    if limited:
+        return HttpResponse(status=429)
+    return HttpResponseNotFound(CODE_MISS_BODY)
+
+
 def direct_pdf_view(request, code):
     """
     Прямой просмотр PDF файла по коду (например, /5711).
@@ -598,12 +824,19 @@ def direct_pdf_view(request, code):
     # Нормализуем код (верхний регистр, убираем пробелы) для поиска
     code = code.upper().strip()
     
-    # Используем поиск без учета регистра на случай, если в БД есть старые записи
-    try:
-        file_instance = File.objects.get(code__iexact=code)
-    except File.DoesNotExist:
-        # Пробуем точное совпадение
-        file_instance = get_object_or_404(File, code=code)
+    # IP, который уже набрал слишком много промахов, отсекаем сразу
+    if is_ratelimited(request, group=CODE_MISS_GROUP, key='ip', rate=settings.CODE_MISS_RATE_LIMIT):
+        return HttpResponse(status=429)
+    
+    # Коды, которых точно нет (фильтр Блума или негативный кеш), не доходят до БД
+    if not code_index.might_exist(code):
+        return _code_miss_response(request)
+    
+    # Поиск без учета регистра покрывает и точное совпадение
+    file_instance = File.objects.filter(code__iexact=code).first()
+    if file_instance is None:
+        code_index.remember_miss(code)
+        return _code_miss_response(request)
     
     # Проверяем, не удален ли файл
     if file_instance.is_deleted:
@@ -653,8 +886,6 @@ def direct_pdf_view(request, code):
         
         # Если файл в папке demo_files, ищем его напрямую
         if file_path.startswith('demo_files/'):
-            import os
-            from django.conf import settings
             full_path = os.path.join(settings.BASE_DIR, file_path)
             
             if os.path.exists(full_path):
@@ -707,26 +938,26 @@ def search_files(request):
     
     # Получаем только файлы текущего пользователя
     if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
-        # Ищем файлы по коду или имени только среди файлов пользователя
-        files = File.objects.filter(
-            Q(code__icontains=query) | Q(filename__icontains=query),
+        # Ищем файлы по коду или имени только среди файлов пользователя.
+        # Индекс сессии в Redis хранит лишь коды по времени, а поиску подстроки
+        # в имени с ранжированием нужен индекс FTS/pg_trgm, поэтому запрос идет
+        # в БД (по индексу session_id, как и раньше)
+        files = search_queryset(File.objects.filter(
             session_id=request.anonymous_session_id,
             expires_at__gt=timezone.now(),
             is_deleted=False
-        ).order_by('-created_at')
+        ), query)
     else:
         # Если session_id нет, показываем пустой список
-        files = File.objects.none()
+        files = search_queryset(File.objects.none(), query)
     
-    # Пагинация
-    paginator = Paginator(files, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация по релевантности (без COUNT(*) и OFFSET на каждую страницу)
+    page_obj = KeysetPaginator(files, 10, rank='match_rank').page(request.GET.get('cursor'))
     
     context = {
         'query': query,
         'page_obj': page_obj,
-        'files_count': files.count(),
+        'files_count': page_obj.total_display,
         'has_session': hasattr(request, 'anonymous_session_id') and request.anonymous_session_id,
     }
     
@@ -740,32 +971,26 @@ def recent_files(request):
     """
     # Получаем только файлы текущего пользователя
     if hasattr(request, 'anonymous_session_id') and request.anonymous_session_id:
-        files = File.objects.filter(
-            session_id=request.anonymous_session_id,
-            expires_at__gt=timezone.now(),
-            is_deleted=False
-        ).order_by('-created_at')
-        
-        # Проверяем, есть ли активные файлы
-        has_files = files.exists()
+        # Индекс сессии в Redis; без Redis — курсорная пагинация по индексу (session_id, created_at)
+        page_obj = session_files_page(request.anonymous_session_id, request.GET.get('cursor'), 20)
+        if page_obj is None:
+            files = File.objects.filter(
+                session_id=request.anonymous_session_id,
+                expires_at__gt=timezone.now(),
+                is_deleted=False
+            )
+            page_obj = KeysetPaginator(files, 20).page(request.GET.get('cursor'))
+        has_files = bool(page_obj)
     else:
         # Если session_id нет, показываем пустой список
-        files = File.objects.none()
-        has_files = False
-    
-    # Пагинация только если есть файлы
-    if has_files:
-        paginator = Paginator(files, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-    else:
         page_obj = None
+        has_files = False
     
     context = {
-        'page_obj': page_obj,
+        'page_obj': page_obj if has_files else None,
         'has_session': hasattr(request, 'anonymous_session_id') and request.anonymous_session_id,
         'has_files': has_files,
-        'total_files': files.count() if has_files else 0,
+        'total_files': page_obj.total_display if has_files else 0,
     }
     
     return render(request, 'files/recent_files.html', context)
@@ -886,57 +1111,66 @@ def robots_txt(request):
     return HttpResponse(content, content_type='text/plain')
 
 
-def sitemap_xml(request):
+def _serve_sitemap_file(request, name):
     """
-    Возвращает sitemap.xml файл.
+    Отдает готовый файл карты сайта из SITEMAP_ROOT с Last-Modified и ETag
+    (в том же формате, что у nginx). None — файл еще не собран.
     """
-    from django.http import HttpResponse
-    from django.contrib.sites.models import Site
-    
+    path = os.path.join(settings.SITEMAP_ROOT, name)
     try:
-        site = Site.objects.get_current()
-        domain = site.domain
-    except Site.DoesNotExist:
-        domain = '0123.ru'
-    
-    # Генерируем XML
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    
-    # Статические страницы
-    static_pages = [
-        ('', '1.0', 'daily'),  # Главная страница
-        ('/files/recent/', '0.8', 'daily'),  # Мои файлы
-    ]
-    
-    for url, priority, changefreq in static_pages:
-        xml += f'  <url>\n'
-        xml += f'    <loc>https://{domain}{url}</loc>\n'
-        xml += f'    <changefreq>{changefreq}</changefreq>\n'
-        xml += f'    <priority>{priority}</priority>\n'
-        xml += f'  </url>\n'
-    
-    # Публичные файлы (без паролей)
-    public_files = File.objects.filter(
-        is_protected=False,
-        expires_at__gt=timezone.now(),
-        is_deleted=False
-    ).order_by('-created_at')[:1000]  # Ограничиваем количество
-    
-    for file in public_files:
-        xml += f'  <url>\n'
-        xml += f'    <loc>https://{domain}/files/{file.code}/</loc>\n'
-        xml += f'    <lastmod>{file.created_at.strftime("%Y-%m-%d")}</lastmod>\n'
-        xml += f'    <changefreq>daily</changefreq>\n'
-        xml += f'    <priority>0.6</priority>\n'
-        xml += f'  </url>\n'
-    
-    # Закрываем XML
-    xml += '</urlset>'
-    
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    etag = f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type='application/xml')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    return response
+
+
+def sitemap_xml(request):
+    """
+    Возвращает индекс карты сайта (sitemap.xml).
+    В продакшене файл отдает nginx; здесь — тот же файл для разработки
+    и запасной вариант из БД до первой сборки.
+    """
+    response = _serve_sitemap_file(request, 'sitemap.xml')
+    if response is not None:
+        return response
+
+    domain = sitemap_domain()
+    xml = cached_compute(
+        versioned_key(f'sitemap_xml_{domain}', TAG_SITEMAP),
+        settings.SITEMAP_CACHE_SECONDS,
+        lambda: ''.join(iter_index(domain, list_shards()))
+    )
     return HttpResponse(xml, content_type='application/xml')
 
 
+def sitemap_section(request, section):
+    """
+    Отдает часть карты сайта: готовый файл или поток из БД, не собирая XML в памяти.
+    Поток из БД — только до первой сборки: после нее части, которых нет
+    в манифесте, не существуют, и запросы сканеров не доходят до БД.
+    """
+    if section != 'pages' and not section.isdigit():
+        return HttpResponseNotFound(content_type='application/xml')
+
+    response = _serve_sitemap_file(request, f'sitemap-{section}.xml')
+    if response is not None:
+        return response
+
+    manifest = load_manifest(settings.SITEMAP_ROOT)
+    if manifest is not None and section != 'pages' and int(section) not in manifest['shards']:
+        return HttpResponseNotFound(content_type='application/xml')
+
+    chunks = iter_section(sitemap_domain(), section)
+    return StreamingHttpResponse(chunks, content_type='application/xml')
+
+
 # Error handlers
 def error_400(request, exception):
     return render(request, '400.html', {'exception': exception}, status=400)
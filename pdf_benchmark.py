@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сжатия PDF в пуле процессов.
+
+Создает синтетический «скан» на N страниц (каждая страница — полноформатное
+изображение с шумом) и сжимает его compress_pdf (files/pdf_utils.py) с разным
+числом процессов: 1, 2, 4, ... до числа ядер. Печатает время и ускорение
+относительно одного процесса.
+
+Запуск: python pdf_benchmark.py [--pages 100] [--workers 1,2,4] [--keep путь.pdf]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings')
+
+import django
+
+django.setup()
+
+from files.pdf_utils import compress_pdf
+
+
+def create_scan(path, pages, seed=42):
+    """PDF из страниц A4, каждая — JPEG 1240x1754 (150 DPI) с шумом, как у скана"""
+    import fitz  # PyMuPDF
+    from io import BytesIO
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    noise = Image.effect_noise((1240, 1754), 24).point(lambda v: min(255, v + 120)).convert('RGB')
+    with fitz.open() as doc:
+        for _ in range(pages):
+            image = noise.copy()
+            draw = ImageDraw.Draw(image)
+            for _ in range(40):
+                x, y = rng.randint(0, 1100), rng.randint(0, 1700)
+                draw.rectangle((x, y, x + rng.randint(20, 140), y + rng.randint(4, 40)), fill=(0, 0, 0))
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=90)
+            page = doc.new_page(width=595, height=842)
+            page.insert_image(page.rect, stream=buffer.getvalue())
+        doc.save(path)
+    size = os.path.getsize(path)
+    print(f"📄 Создан PDF: {pages} страниц, {size / 1024 / 1024:.1f} МБ за {time.perf_counter() - started:.1f} с")
+
+
+def default_workers():
+    counts, n = [], 1
+    cpus = os.cpu_count() or 1
+    while n < cpus:
+        counts.append(n)
+        n *= 2
+    counts.append(cpus)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сжатия PDF в пуле процессов')
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--workers', default=None, help='Список через запятую (по умолчанию 1, 2, 4, ... ядер)')
+    parser.add_argument('--keep', default=None, help='Сохранить исходный PDF по этому пути')
+    args = parser.parse_args()
+
+    workers = [int(w) for w in args.workers.split(',')] if args.workers else default_workers()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.keep or os.path.join(tmp, 'scan.pdf')
+        create_scan(source, args.pages)
+        print(f"🖥️  Ядер: {os.cpu_count()}")
+
+        baseline = None
+        for count in workers:
+            output = os.path.join(tmp, f'scan-{count}.pdf')
+            started = time.perf_counter()
+            ok, path, size = compress_pdf(source, output, max_size_mb=0, workers=count, time_budget=0)
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            status = f"{size / 1024 / 1024:.1f} МБ" if ok else 'ошибка'
+            print(
+                f"  процессов {count:>2}: {elapsed:6.2f} с, {args.pages / elapsed:6.1f} стр/с, "
+                f"ускорение x{baseline / elapsed:.2f}, результат {status}"
+            )
+            if ok and path == output:
+                os.remove(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска файлов по имени на синтетических данных.
+
+Создает временную базу SQLite с таблицей files_file на N строк (по умолчанию
+миллион), устанавливает ту же теневую таблицу FTS5 с триггерами, что и
+миграция files/0007, и сравнивает время поиска:
+- LIKE '%запрос%' (как icontains без индекса);
+- MATCH по FTS5 trigram (files/search.py).
+
+Для PostgreSQL индекс pg_trgm проверяется через EXPLAIN ANALYZE запроса
+поиска на рабочей базе.
+
+Запуск: python search_benchmark.py [--rows 1000000] [--keep путь.sqlite3]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'filehost.settings')
+
+import django
+
+django.setup()
+
+from files.search import FTS_TABLE, SQLITE_INSTALL, fts_phrase
+
+WORDS = [
+    'report', 'invoice', 'photo', 'scan', 'contract', 'presentation', 'backup',
+    'отчет', 'договор', 'счет', 'фото', 'презентация', 'архив', 'резюме',
+]
+EXTENSIONS = ['.pdf', '.docx', '.xlsx', '.jpg', '.png', '.zip', '.txt']
+QUERIES = ['report', 'договор', 'invoice_2023', 'scan-77', 'zzzz-not-found']
+
+
+def random_filename(rng):
+    parts = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+    suffix = f'{rng.randint(2015, 2025)}_{rng.randint(1, 9999)}'
+    return '-'.join(parts) + '_' + suffix + rng.choice(EXTENSIONS)
+
+
+def create_database(path, rows, seed=42):
+    """Создает таблицу files_file с FTS и заполняет синтетическими строками"""
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.execute(
+        'CREATE TABLE files_file (id INTEGER PRIMARY KEY, code VARCHAR(10) UNIQUE, '
+        'filename VARCHAR(255), session_id VARCHAR(64), created_at REAL)'
+    )
+    for statement in SQLITE_INSTALL:
+        db.execute(statement)
+
+    started = time.perf_counter()
+    alphabet = string.ascii_uppercase + string.digits
+    batch = []
+    for index in range(1, rows + 1):
+        code = ''.join(rng.choices(alphabet, k=4)) + f'{index:06d}'[-6:]
+        batch.append((index, code, random_filename(rng), f'session{index % 5000}', time.time() - index))
+        if len(batch) >= 50000:
+            db.executemany('INSERT INTO files_file VALUES (?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        db.executemany('INSERT INTO files_file VALUES (?, ?, ?, ?, ?)', batch)
+    db.commit()
+    print(f"📦 Создано {rows} строк за {time.perf_counter() - started:.1f}с")
+    return db
+
+
+def timed(db, sql, params, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = db.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) / repeat * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска по имени файла')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Количество строк')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов каждого запроса')
+    parser.add_argument('--keep', help='Сохранить базу по этому пути')
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(), 'search_benchmark.sqlite3')
+    db = create_database(path, args.rows)
+
+    like_sql = (
+        'SELECT id FROM files_file WHERE code LIKE ? OR filename LIKE ? '
+        'ORDER BY created_at DESC LIMIT 10'
+    )
+    fts_sql = (
+        f'SELECT id FROM files_file WHERE id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?) '
+        'ORDER BY created_at DESC LIMIT 10'
+    )
+
+    print(f"{'Запрос':<18} {'LIKE, мс':>10} {'FTS5, мс':>10} {'Ускорение':>10}")
+    for query in QUERIES:
+        pattern = f'%{query}%'
+        like_ms, like_rows = timed(db, like_sql, (pattern, pattern), args.repeat)
+        fts_ms, fts_rows = timed(db, fts_sql, (fts_phrase(query),), args.repeat)
+        print(f"{query:<18} {like_ms:>10.1f} {fts_ms:>10.1f} {like_ms / max(fts_ms, 0.001):>9.1f}x"
+              f"  ({like_rows}/{fts_rows} строк)")
+
+    db.close()
+    if not args.keep:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()